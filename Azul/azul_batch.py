@@ -0,0 +1,358 @@
+import numpy as np
+
+import Azul.azul_utils as utils
+from Azul.azul_model import AzulState, GRID_SCHEME, WALL_SIZE, LINE_MASK, \
+    CELL_BIT, LINE_SCORE, ROW_MASKS, COL_MASKS, COLOUR_MASKS
+
+
+# Many games of Azul held as NumPy arrays (one row per game) and advanced
+# in lockstep, for tuning and self-play where running AzulStates one at
+# a time is too slow. The rules are those of AzulGameRule as driven by
+# game.Game, including its quirks:
+#
+# - The tiles placed on the factories when the state is created are
+#   replaced (not returned to the bag) by the first STARTROUND.
+# - A round in which nobody takes the first agent token (every grab
+#   emptied a single-colour factory) ends without scoring.
+# - When the bag runs low, the tiles left in it are drawn before the
+#   used tiles are shuffled back in.
+#
+# The gamemaster's actions are applied automatically, so after every
+# Step() each unfinished game is waiting on a move from an agent. Bags
+# are kept as counts per colour and drawn from the batch's own generator,
+# so games do not follow the random module like AzulState does.
+#
+# An action of an agent is an index into the legal move mask,
+#     (source*NUM_COLOURS + tile)*NUM_DESTS + dest,
+# where sources are the factories followed by the centre, and dests the
+# pattern lines followed by the floor line. Together with the state this
+# determines the utils.TileGrab (see ToAction and ActionIndex).
+
+NUM_COLOURS = len(utils.Tile)
+NUM_DESTS = WALL_SIZE + 1
+FLOOR_DEST = WALL_SIZE
+FLOOR_SIZE = len(AzulState.AgentState.FLOOR_SCORES)
+MAX_ROUNDS = 50
+
+_GRID_SCHEME = np.array(GRID_SCHEME)
+_CELL_BIT = np.array(CELL_BIT, dtype=np.int64)     # [row][tile]
+_LINE_SCORE = np.array(LINE_SCORE)                  # [pos][line bits]
+_ROW_MASKS = np.array(ROW_MASKS, dtype=np.int64)
+_COL_MASKS = np.array(COL_MASKS, dtype=np.int64)
+_COLOUR_MASKS = np.array(COLOUR_MASKS, dtype=np.int64)
+# Penalty for a floor line with the given number of filled slots
+_FLOOR_PENALTY = np.concatenate(([0], np.cumsum(AzulState.AgentState.FLOOR_SCORES)))
+
+
+class AzulBatch:
+    def __init__(self, num_games, num_agents=2, seed=None, max_rounds=MAX_ROUNDS):
+        self.num_games = num_games
+        self.num_agents = num_agents
+        self.max_rounds = max_rounds
+        self.num_factories = AzulState.NUM_FACTORIES[num_agents-2]
+        self.num_sources = self.num_factories + 1
+        self.num_actions = self.num_sources * NUM_COLOURS * NUM_DESTS
+        self.rng = np.random.default_rng(seed)
+        self.Reset()
+
+    # Start a new game in every row of the batch.
+    def Reset(self):
+        n, p = self.num_games, self.num_agents
+        self.factories = np.zeros((n, self.num_factories, NUM_COLOURS), np.int16)
+        self.centre_pool = np.zeros((n, NUM_COLOURS), np.int16)
+        self.bag = np.full((n, NUM_COLOURS), AzulState.NUM_TILE_TYPE, np.int16)
+        self.bag_used = np.zeros((n, NUM_COLOURS), np.int16)
+
+        # Agent states, indexed [game][agent]. Walls are bitboards laid out
+        # as in AzulState.AgentState, and floors hold the number of filled
+        # slots (including the first agent token) plus the tiles on them.
+        self.lines_number = np.zeros((n, p, WALL_SIZE), np.int16)
+        self.lines_tile = np.full((n, p, WALL_SIZE), -1, np.int16)
+        self.wall = np.zeros((n, p), np.int64)
+        self.wall_t = np.zeros((n, p), np.int64)
+        self.floor = np.zeros((n, p), np.int16)
+        self.floor_tiles = np.zeros((n, p, NUM_COLOURS), np.int16)
+        self.score = np.zeros((n, p), np.int32)
+
+        self.first_agent_taken = np.zeros(n, bool)
+        self.first_agent = self.rng.integers(p, size=n)
+        self.next_first_agent = np.full(n, -1)
+        self.agent_to_move = np.zeros(n, np.int64)
+        self.rounds = np.zeros(n, np.int64)
+
+        # Finished games. A game is 'stalled' when a round starts with no
+        # tiles left to draw, or after max_rounds rounds (with 3 or 4 
+        # agents the few tiles left in play can circulate for ever without
+        # completing a row). AzulGameRule would never end such a game, so
+        # it is stopped here with its scores as they stand.
+        self.done = np.zeros(n, bool)
+        self.stalled = np.zeros(n, bool)
+
+        games = np.arange(n)
+        self._FillFactories(games)  # Replaced by the first round, see above
+        self._StartRound(games)
+
+    # Draw 'number' tiles (per game) from the bags of the given games, one
+    # at a time, without replacement. Returns the counts drawn.
+    def _Draw(self, games, number):
+        drawn = np.zeros((len(games), NUM_COLOURS), np.int16)
+        rows = np.arange(len(games))
+        for i in range(int(number.max(initial=0))):
+            bag = self.bag[games]
+            total = bag.sum(1)
+            active = (number > i) & (total > 0)
+            u = self.rng.random(len(games)) * total
+            tile = (np.cumsum(bag, 1) <= u[:, None]).sum(1)
+            drawn[rows[active], tile[active]] += 1
+            self.bag[games[active], tile[active]] -= 1
+        return drawn
+
+    # Fill the factories of the given games from their bags, as
+    # AzulState.InitialiseFactory does.
+    def _FillFactories(self, games):
+        for f in range(self.num_factories):
+            fill = np.zeros((len(games), NUM_COLOURS), np.int16)
+            refill = (self.bag[games].sum(1) < AzulState.NUM_ON_FACTORY) & \
+                (self.bag_used[games].sum(1) > 0)
+            g = games[refill]
+            fill[refill] = self.bag[g]
+            self.bag[g] = self.bag_used[g]
+            self.bag_used[g] = 0
+            fill += self._Draw(games, AzulState.NUM_ON_FACTORY - fill.sum(1))
+            self.factories[games, f] = fill
+
+    def _StartRound(self, games):
+        self.centre_pool[games] = 0
+        self._FillFactories(games)
+        self.agent_to_move[games] = self.first_agent[games]
+        self.rounds[games] += 1
+
+        stalled = games[(self.TilesRemaining(games) == 0) | 
+                        (self.rounds[games] > self.max_rounds)]
+        self.done[stalled] = True
+        self.stalled[stalled] = True
+
+    # Number of tiles left on the factories and in the centre of each of
+    # the given games.
+    def TilesRemaining(self, games):
+        return self.factories[games].sum((1, 2)) + self.centre_pool[games].sum(1)
+
+    # Boolean mask of the legal actions of the agent to move in each game,
+    # indexed [game][action]. Finished games have no legal actions.
+    def LegalMask(self):
+        games = np.arange(self.num_games)
+        agents = self.agent_to_move
+        lines_tile = self.lines_tile[games, agents][:, None, :]   # [game][1][line]
+        wall = self.wall[games, agents][:, None, None]
+
+        # Pattern lines that can take each colour: empty or holding that
+        # colour, with the colour's space in the wall row still free.
+        tiles = np.arange(NUM_COLOURS)[None, :, None]
+        dests = np.ones((self.num_games, NUM_COLOURS, NUM_DESTS), bool)
+        dests[:, :, :WALL_SIZE] = ((lines_tile == -1) | (lines_tile == tiles)) & \
+            (wall & _CELL_BIT.T[None] == 0)
+
+        available = np.concatenate((self.factories, self.centre_pool[:, None]), 1) > 0
+        mask = available[:, :, :, None] & dests[:, None]
+        mask[self.done] = False
+        return mask.reshape(self.num_games, self.num_actions)
+
+    # Apply one action per game (entries for finished games are ignored),
+    # then run the gamemaster for games whose round has ended.
+    def Step(self, actions):
+        games = np.flatnonzero(~self.done)
+        if len(games) == 0:
+            return
+        source, rest = np.divmod(np.asarray(actions)[games], NUM_COLOURS*NUM_DESTS)
+        tile, dest = np.divmod(rest, NUM_DESTS)
+        agents = self.agent_to_move[games]
+
+        from_centre = source == self.num_factories
+        factory = np.minimum(source, self.num_factories-1)
+        number = np.where(from_centre, self.centre_pool[games, tile],
+                          self.factories[games, factory, tile])
+        to_line_dest = dest != FLOOR_DEST
+        line = np.minimum(dest, WALL_SIZE-1)
+        lines_number = self.lines_number[games, agents, line]
+        lines_tile = self.lines_tile[games, agents, line]
+        assert (number > 0).all(), "No tiles of the chosen colour"
+        assert (~to_line_dest | (((lines_tile == -1) | (lines_tile == tile)) &
+            (self.wall[games, agents] & _CELL_BIT[line, tile] == 0))).all(), \
+            "Pattern line cannot take the chosen colour"
+
+        to_line = np.where(to_line_dest, np.minimum(number, line+1 - lines_number), 0)
+        to_floor = number - to_line
+
+        # The first agent to take from the centre gets the first agent token
+        token = from_centre & ~self.first_agent_taken[games]
+        g, a = games[token], agents[token]
+        self.floor[g, a] = np.minimum(self.floor[g, a] + 1, FLOOR_SIZE)
+        self.first_agent_taken[g] = True
+        self.next_first_agent[g] = a
+
+        # Tiles that do not fit on the floor line go into the used bag
+        floor = self.floor[games, agents]
+        placed = np.minimum(to_floor, FLOOR_SIZE - floor)
+        self.floor[games, agents] = floor + placed
+        self.floor_tiles[games, agents, tile] += placed
+        self.bag_used[games, tile] += to_floor - placed
+
+        on_line = to_line > 0
+        g, a, i = games[on_line], agents[on_line], line[on_line]
+        self.lines_number[g, a, i] += to_line[on_line]
+        self.lines_tile[g, a, i] = tile[on_line]
+
+        # Take the tiles from the centre, or move the rest of the factory's
+        # tiles into the centre
+        self.centre_pool[games[from_centre], tile[from_centre]] -= number[from_centre]
+        g, f = games[~from_centre], factory[~from_centre]
+        rest = self.factories[g, f]
+        rest[np.arange(len(g)), tile[~from_centre]] = 0
+        self.centre_pool[g] += rest
+        self.factories[g, f] = 0
+
+        self.agent_to_move[games] = (agents + 1) % self.num_agents
+        ended = games[self.TilesRemaining(games) == 0]
+        if len(ended):
+            self._EndRound(ended)
+
+    def _EndRound(self, games):
+        scored = games[self.next_first_agent[games] != -1]
+        self._ScoreRound(scored)
+        self.first_agent_taken[scored] = False
+        self.first_agent[scored] = self.next_first_agent[scored]
+        self.next_first_agent[scored] = -1
+
+        # The game ends after a round in which an agent completes a row
+        rows = self.wall[scored][:, :, None] & _ROW_MASKS == _ROW_MASKS
+        ended = scored[rows.any((1, 2))]
+        self.score[ended] += self._Bonus(self.wall[ended])
+        self.done[ended] = True
+
+        self._StartRound(games[~self.done[games]])
+
+    # Move the tiles in full pattern lines to the walls and score them,
+    # then score the floor lines, as AgentState.ScoreRound does.
+    def _ScoreRound(self, games):
+        wall = self.wall[games]
+        wall_t = self.wall_t[games]
+        score_inc = np.zeros(wall.shape, np.int32)
+        for i in range(WALL_SIZE):
+            lines_number = self.lines_number[games, :, i]
+            lines_tile = self.lines_tile[games, :, i]
+            full = lines_number == i+1
+            tile = np.where(full, lines_tile, 0)
+            col = _GRID_SCHEME[i][tile]
+            wall = np.where(full, wall | _CELL_BIT[i][tile], wall)
+            wall_t = np.where(full, wall_t | (1 << (col*WALL_SIZE + i)), wall_t)
+            points = _LINE_SCORE[col, wall >> (i*WALL_SIZE) & LINE_MASK] + \
+                _LINE_SCORE[i, wall_t >> (col*WALL_SIZE) & LINE_MASK]
+            score_inc += np.where(full, np.maximum(points, 1), 0)
+
+            # All but the tile placed on the wall go to the used bag
+            g, a = np.nonzero(full)
+            np.add.at(self.bag_used, (games[g], tile[g, a]), i)
+            self.lines_number[games, :, i] = np.where(full, 0, lines_number)
+            self.lines_tile[games, :, i] = np.where(full, -1, lines_tile)
+
+        # Agents cannot be assigned a negative score in any round.
+        score_change = score_inc + _FLOOR_PENALTY[self.floor[games]]
+        self.score[games] = np.maximum(self.score[games] + score_change, 0)
+        self.wall[games] = wall
+        self.wall_t[games] = wall_t
+        self.bag_used[games] += self.floor_tiles[games].sum(1)
+        self.floor_tiles[games] = 0
+        self.floor[games] = 0
+
+    # End of game bonus for an array of walls
+    def _Bonus(self, wall):
+        def completed(masks):
+            return (wall[..., None] & masks == masks).sum(-1)
+        agent = AzulState.AgentState
+        return completed(_ROW_MASKS)*agent.ROW_BONUS + \
+            completed(_COL_MASKS)*agent.COL_BONUS + \
+            completed(_COLOUR_MASKS)*agent.SET_BONUS
+
+    # Play every game to the end. 'policy' is called as policy(batch, mask)
+    # with the legal move mask and returns one action per game. Returns
+    # the final scores, indexed [game][agent].
+    def Run(self, policy):
+        while not self.done.all():
+            self.Step(policy(self, self.LegalMask()))
+        return self.score
+
+    # The action tuple, as returned by AzulGameRule.getLegalActions, for
+    # an action index in the given game's current position.
+    def ToAction(self, game, index):
+        source, rest = divmod(int(index), NUM_COLOURS*NUM_DESTS)
+        tile, dest = divmod(rest, NUM_DESTS)
+        agent = self.agent_to_move[game]
+        if source == self.num_factories:
+            fid = -1
+            number = int(self.centre_pool[game, tile])
+        else:
+            fid = source
+            number = int(self.factories[game, source, tile])
+        if dest == FLOOR_DEST:
+            return utils.ACTIONS[utils.ActionCode(fid, tile, number)]
+        slots_free = dest+1 - int(self.lines_number[game, agent, dest])
+        return utils.ACTIONS[utils.ActionCode(fid, tile, number, dest,
+            min(number, slots_free))]
+
+    # The action index of an action tuple
+    def ActionIndex(self, action):
+        return ActionIndex(action, self.num_factories)
+
+    # Build an AzulState of one game, e.g. to let an agent choose its
+    # move. The floor tiles are listed in colour order.
+    def GetState(self, game):
+        state = AzulState.__new__(AzulState)
+        state.agents = []
+        for i in range(self.num_agents):
+            plr = AzulState.AgentState(i)
+            plr.score = int(self.score[game, i])
+            plr.lines_number = [int(n) for n in self.lines_number[game, i]]
+            plr.lines_tile = [int(t) for t in self.lines_tile[game, i]]
+            plr.wall = int(self.wall[game, i])
+            plr.wall_t = int(self.wall_t[game, i])
+            plr.CountCompleted()
+            num_floor = int(self.floor[game, i])
+            plr.floor = [1]*num_floor + [0]*(FLOOR_SIZE - num_floor)
+            plr.floor_tiles = _TileList(self.floor_tiles[game, i])
+            state.agents.append(plr)
+        state.bag = _TileDisplay(self.bag[game], AzulState.TileBag)
+        state.bag_used = _TileDisplay(self.bag_used[game], AzulState.TileBag)
+        state.factories = [_TileDisplay(fd) for fd in self.factories[game]]
+        state.centre_pool = _TileDisplay(self.centre_pool[game])
+        state.tiles_on_board = state.ComputeTilesOnBoard()
+        state.first_agent_taken = bool(self.first_agent_taken[game])
+        state.first_agent = int(self.first_agent[game])
+        state.next_first_agent = int(self.next_first_agent[game])
+        state._agent_to_move = int(self.agent_to_move[game])
+        state.zobrist = state.ComputeZobrist()
+        state.rng = None
+        return state
+
+
+# The action index of an action tuple, in a game with num_factories
+# factories.
+def ActionIndex(action, num_factories):
+    tg = action[2]
+    source = num_factories if action[1] == -1 else action[1]
+    dest = FLOOR_DEST if tg.pattern_line_dest == -1 else tg.pattern_line_dest
+    return (source*NUM_COLOURS + tg.tile_type)*NUM_DESTS + dest
+
+
+def _TileList(counts):
+    return [tile for tile in utils.Tile for _ in range(counts[tile])]
+
+def _TileDisplay(counts, display=AzulState.TileDisplay):
+    td = display()
+    td.tiles = [int(n) for n in counts]
+    td.total = sum(td.tiles)
+    return td
+
+
+# A policy choosing uniformly at random among each game's legal actions.
+def RandomPolicy(batch, mask):
+    return np.argmax(batch.rng.random(mask.shape) * mask, 1)
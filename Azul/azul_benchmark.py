@@ -0,0 +1,123 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Measures how many search nodes per second can be expanded with the different ways of deriving a successor
+#          state from an AzulState. A node is one successor generated from a sampled mid-round position. Also
+#          measures the per-move overhead of running an agent in a worker process (see agent_worker.py).
+# Usage:   python -m Azul.azul_benchmark [-n NUM_OF_AGENTS] [-t SECONDS] [--setRandomSeed SEED]
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+import sys
+import copy
+import time
+import random
+from optparse import OptionParser
+from Azul.azul_model import AzulGameRule
+from agent_worker import AgentWorker
+from template import Agent, Deadline
+
+# CONSTANTS ----------------------------------------------------------------------------------------------------------#
+
+NUM_POSITIONS = 200  # Number of positions sampled from random games.
+
+# FUNCTION DEF -------------------------------------------------------------------------------------------------------#
+
+def samplePositions(num_of_agent, num_positions, seed):
+    """
+    Play random games and collect (game_state, agent_id, actions) tuples for positions where a player is to move.
+    """
+    random.seed(seed)
+    positions = []
+    while len(positions) < num_positions:
+        game_rule = AzulGameRule(num_of_agent)
+        while not game_rule.gameEnds() and len(positions) < num_positions:
+            agent_id = game_rule.getCurrentAgentIndex()
+            actions = game_rule.getLegalActions(game_rule.current_game_state, agent_id)
+            if agent_id != num_of_agent:
+                positions.append((copy.deepcopy(game_rule.current_game_state), agent_id, actions))
+            game_rule.update(random.choice(actions))
+    return positions
+
+
+def deepcopyNode(game_rule, state, action, agent_id):
+    game_rule.generateSuccessor(copy.deepcopy(state), action, agent_id)
+
+
+def cloneNode(game_rule, state, action, agent_id):
+    game_rule.generateSuccessor(state.clone(), action, agent_id)
+
+
+def applyUndoNode(game_rule, state, action, agent_id):
+    game_rule.undo(state, game_rule.apply(state, action, agent_id))
+
+
+METHODS = [("deepcopy",   deepcopyNode),
+           ("clone",      cloneNode),
+           ("apply/undo", applyUndoNode)]
+
+
+def nodeRate(expand, game_rule, positions, seconds):
+    """
+    Expand successors of the sampled positions, cycling through them, for the given number of seconds.
+    Returns the number of nodes expanded per second.
+    """
+    nodes = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for state, agent_id, actions in positions:
+            for action in actions:
+                expand(game_rule, state, action, agent_id)
+            nodes += len(actions)
+    return nodes / (time.perf_counter() - start)
+
+
+def workerOverhead(positions):
+    """
+    Time SelectAction calls through an AgentWorker running an agent that answers at once, for each sampled position.
+    Returns the mean and maximum time per call in seconds.
+    """
+    worker = AgentWorker(Agent(0))
+    worker.Start()
+    times = []
+    try:
+        for state, agent_id, actions in positions:
+            start = time.perf_counter()
+            worker.SelectAction(actions, state, Deadline(1))
+            times.append(time.perf_counter() - start)
+    finally:
+        worker.Close()
+    return sum(times)/len(times), max(times)
+
+
+def run(options):
+    game_rule = AzulGameRule(options.num_of_agents)
+    positions = samplePositions(options.num_of_agents, NUM_POSITIONS, options.setRandomSeed)
+    print("Sampled {} positions ({} agents), {:.1f} actions per position on average.".format(
+        len(positions), options.num_of_agents, sum(len(p[2]) for p in positions)/len(positions)))
+
+    baseline = None
+    for name, expand in METHODS:
+        rate = nodeRate(expand, game_rule, positions, options.seconds)
+        baseline = baseline or rate
+        print("    {:<10} {:>12,.0f} nodes/s  ({:.1f}x)".format(name, rate, rate/baseline))
+
+    mean, worst = workerOverhead(positions)
+    print("Agent worker overhead: {:.2f} ms per move on average, {:.2f} ms at most.".format(mean*1000, worst*1000))
+
+
+def loadParameter():
+    parser = OptionParser("python -m Azul.azul_benchmark <options>")
+    parser.add_option('-n', '--num_of_agents', type='int', help='The number of agents in the sampled games (default: 2)', default=2)
+    parser.add_option('-t', '--seconds', type='float', help='Time spent measuring each method in seconds (default: 2)', default=2.0)
+    parser.add_option('--setRandomSeed', type='int', help='Random seed used to sample positions (default: 90054)', default=90054)
+    options, otherjunk = parser.parse_args(sys.argv[1:])
+    assert len(otherjunk) == 0, "Unrecognized options: " + str(otherjunk)
+    return options
+
+# MAIN ---------------------------------------------------------------------------------------------------------------#
+
+if __name__ == '__main__':
+    run(loadParameter())
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
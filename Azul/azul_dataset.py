@@ -0,0 +1,274 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Exports recorded games as a training dataset. Replays (of either format; see replay_file.py) are re-simulated
+#          with GameReplayer over a pool of worker processes, and every position in which an agent chose its own move
+#          (not a random move given after a warning) becomes one row: the position's features in a fixed layout (see
+#          featureNames), the index of the chosen action, the outcome for the agent to move, and the final scores.
+#
+#          Rows are appended to shards of .npy files in the output directory, which can be memory-mapped (see
+#          loadShards) so training code can stream them without loading everything. A manifest lists the shards and
+#          their rows, the feature layout and the replays already exported or skipped, so exporting again only adds new
+#          replays.
+# Usage:   python -m Azul.azul_dataset [-d REPLAY_DIRECTORY] [-o DATASET_DIRECTORY] [-n AGENTS] [-j JOBS]
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+import sys
+import os
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from optparse import OptionParser
+from game import GameReplayer
+from replay_index import findReplays
+from Azul.azul_model import AzulGameRule, AzulState, WALL_SIZE
+from Azul.azul_batch import NUM_COLOURS, ActionIndex
+
+# CONSTANTS ----------------------------------------------------------------------------------------------------------#
+
+MANIFEST   = "manifest.json"
+SHARD_SIZE = 1 << 18 #Rows per shard.
+ARRAYS     = ("features", "actions", "outcomes", "scores", "games")
+
+# FUNCTION DEF -------------------------------------------------------------------------------------------------------#
+
+def featureNames(num_agents):
+    """
+    Names of the features, in order: the tiles of each colour on each factory and in the centre, whether the first
+    agent token is in the centre; for each agent in seat order, the tiles of each colour on each pattern line, the
+    wall's cells (1 if tiled), the number of floor slots filled and the score; and which agent is to move.
+    """
+    names = []
+    for f in range(AzulState.NUM_FACTORIES[num_agents-2]):
+        names += ["factory{}_tile{}".format(f, tile) for tile in range(NUM_COLOURS)]
+    names += ["centre_tile{}".format(tile) for tile in range(NUM_COLOURS)] + ["centre_first_agent_token"]
+    for agent in range(num_agents):
+        names += ["agent{}_line{}_tile{}".format(agent, line, tile)
+                  for line in range(WALL_SIZE) for tile in range(NUM_COLOURS)]
+        names += ["agent{}_wall{}_{}".format(agent, row, col) for row in range(WALL_SIZE) for col in range(WALL_SIZE)]
+        names += ["agent{}_floor".format(agent), "agent{}_score".format(agent)]
+    names += ["to_move{}".format(agent) for agent in range(num_agents)]
+    return names
+
+
+def encodeState(state, agent_to_move):
+    """
+    The features of a position, laid out as in featureNames.
+    """
+    num_agents = len(state.agents)
+    features = []
+    for factory in state.factories:
+        features += factory.tiles
+    features += state.centre_pool.tiles
+    features.append(0 if state.first_agent_taken else 1)
+    for plr in state.agents:
+        lines = [0]*(WALL_SIZE*NUM_COLOURS)
+        for line in range(WALL_SIZE):
+            if plr.lines_tile[line] != -1:
+                lines[line*NUM_COLOURS + plr.lines_tile[line]] = plr.lines_number[line]
+        features += lines
+        features += [plr.wall >> cell & 1 for cell in range(WALL_SIZE*WALL_SIZE)]
+        features += [sum(plr.floor), plr.score]
+    features += [1 if agent == agent_to_move else 0 for agent in range(num_agents)]
+    return features
+
+
+def exportReplay(path, num_agents):
+    """
+    Re-simulate one replay and return its rows (features, actions, outcomes, scores) as arrays, or None if the replay
+    cannot be read or replayed, or is not a game between num_agents agents. Actions are indexed as in AzulBatch (see
+    azul_batch.ActionIndex). Runs in a worker process.
+    """
+    try:
+        replayer = GameReplayer(AzulGameRule, path)
+    except Exception:
+        return None
+    replay = replayer.replay
+    if replay["num_of_agent"] != num_agents:
+        return None
+    warnings = set(replay["warning_positions"])
+    num_factories = AzulState.NUM_FACTORIES[num_agents-2]
+    #Pickled replays hold numpy scores.
+    scores = [int(replay["scores"][agent]) for agent in range(num_agents)]
+    features, actions, outcomes = [], [], []
+    try:
+        while replayer.position < len(replay["actions"]):
+            (index, info), = replay["actions"][replayer.position].items()
+            agent_id = info["agent_id"]
+            if agent_id < num_agents and (agent_id, index) not in warnings:
+                features.append(encodeState(replayer.game_rule.current_game_state, agent_id))
+                actions.append(ActionIndex(info["action"], num_factories))
+                margin = scores[agent_id] - max(score for agent,score in enumerate(scores) if agent != agent_id)
+                outcomes.append((margin > 0) - (margin < 0))
+            replayer.Step()
+    except Exception:
+        return None
+    return (np.array(features, np.int16).reshape(-1, len(featureNames(num_agents))), np.array(actions, np.int16),
+            np.array(outcomes, np.int8), np.tile(np.array(scores, np.int16), (len(actions), 1)))
+
+
+class ShardWriter:
+    #Appends rows to the shards in a directory, recording them in the manifest. A shard's arrays are memory maps of
+    #SHARD_SIZE rows, preallocated (sparsely, where the file system allows) and never cut down; the manifest gives the
+    #number of rows filled. The last shard is filled up before a new one is started, so exporting a few replays at a
+    #time does not leave many small shards, and until the manifest is saved its old rows stand.
+    def __init__(self, directory, manifest, shard_size=SHARD_SIZE):
+        self.directory = directory
+        self.manifest = manifest
+        self.shard_size = shard_size
+        self.arrays = None
+        self.rows = 0
+
+    def _Path(self, shard, name):
+        return os.path.join(self.directory, "{}-{}.npy".format(shard, name))
+
+    def _Open(self):
+        shards = self.manifest["shards"]
+        if shards:
+            #Reopen the last shard in place if it has room; it is added to the manifest again when closed. Shards
+            #written before they were kept at full size have none.
+            last = shards[-1]
+            self.arrays = {name:np.lib.format.open_memmap(self._Path(last["name"], name), mode="r+")
+                           for name in ARRAYS}
+            if last["rows"] < len(self.arrays["actions"]):
+                shards.pop()
+                self.shard = last["name"]
+                self.rows = last["rows"]
+                return
+            self.arrays = None
+        self.shard = "shard-{:05d}".format(len(shards))
+        num_features = len(self.manifest["features"])
+        shapes = {"features":((self.shard_size, num_features), np.int16), "actions":((self.shard_size,), np.int16),
+                  "outcomes":((self.shard_size,), np.int8),
+                  "scores":((self.shard_size, self.manifest["num_agents"]), np.int16),
+                  "games":((self.shard_size,), np.int32)}
+        self.arrays = {name:np.lib.format.open_memmap(self._Path(self.shard, name), mode="w+", dtype=dtype, shape=shape)
+                       for name,(shape,dtype) in shapes.items()}
+        self.rows = 0
+
+    #Append the rows of one game.
+    def Append(self, rows, game):
+        rows = dict(zip(ARRAYS, rows + (np.full(len(rows[0]), game, np.int32),)))
+        start = 0
+        while start < len(rows["actions"]):
+            if self.arrays is None:
+                self._Open()
+            size = len(self.arrays["actions"])
+            n = min(len(rows["actions"]) - start, size - self.rows)
+            for name in ARRAYS:
+                self.arrays[name][self.rows:self.rows+n] = rows[name][start:start+n]
+            self.rows += n
+            start += n
+            if self.rows == size:
+                self.Close()
+
+    #Close the current shard, if any, and add it to the manifest.
+    def Close(self):
+        if self.arrays is None:
+            return
+        for array in self.arrays.values():
+            array.flush()
+        self.manifest["shards"].append({"name":self.shard, "rows":self.rows})
+        self.arrays = None
+
+
+def loadManifest(directory, num_agents):
+    path = os.path.join(directory, MANIFEST)
+    if os.path.exists(path):
+        with open(path) as f:
+            manifest = json.load(f)
+        assert manifest["num_agents"] == num_agents, \
+            "The dataset in {} is of {}-agent games.".format(directory, manifest["num_agents"])
+        manifest.setdefault("skipped", {})
+        return manifest
+    return {"num_agents":num_agents, "features":featureNames(num_agents), "shards":[], "replays":[], "skipped":{}}
+
+
+def saveManifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+def loadShards(directory):
+    """
+    Yield each shard of a dataset as a dict of memory-mapped arrays (see ARRAYS), cut to the rows the manifest lists
+    as filled (see ShardWriter).
+    """
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    for shard in manifest["shards"]:
+        yield {name:np.load(os.path.join(directory, "{}-{}.npy".format(shard["name"], name)),
+                            mmap_mode="r")[:shard["rows"]]
+               for name in ARRAYS}
+
+
+def fileStamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+
+def export(replay_directory, directory, num_agents, jobs=1, shard_size=SHARD_SIZE):
+    """
+    Export the replays in replay_directory not yet in the dataset in directory. Returns the numbers of replays
+    exported and skipped, and of rows written. Games are numbered in the order the manifest lists their replays.
+    Replays that cannot be exported are listed in the manifest too, with their size and modification time, and are
+    only tried again once they change (eg. a game that was still being recorded).
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = loadManifest(directory, num_agents)
+    done = set(manifest["replays"])
+    skipped = manifest["skipped"]
+    paths = [path for path in (os.path.abspath(p) for p in findReplays(replay_directory))
+             if path not in done and skipped.get(path) != fileStamp(path)]
+    writer = ShardWriter(directory, manifest, shard_size)
+    num_exported, num_rows = 0, 0
+    executor = ProcessPoolExecutor(jobs) if jobs > 1 else None
+    try:
+        if executor is not None:
+            results = executor.map(exportReplay, paths, [num_agents]*len(paths), chunksize=16)
+        else:
+            results = (exportReplay(path, num_agents) for path in paths)
+        for path, rows in zip(paths, results):
+            if rows is None:
+                skipped[path] = fileStamp(path)
+                continue
+            writer.Append(rows, len(manifest["replays"]))
+            manifest["replays"].append(path)
+            skipped.pop(path, None)
+            num_exported += 1
+            num_rows += len(rows[1])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        writer.Close()
+        saveManifest(directory, manifest)
+    return num_exported, len(paths) - num_exported, num_rows
+
+
+def run(options):
+    directory = options.dataset or os.path.join(options.directory, "dataset")
+    num_exported, num_skipped, num_rows = export(options.directory, directory, options.num_of_agents, options.jobs,
+                                                 options.shardSize)
+    print("Exported {} replays ({} positions) to {}; skipped {}.".format(num_exported, num_rows, directory,
+                                                                         num_skipped))
+
+
+def loadParameter():
+    parser = OptionParser("python -m Azul.azul_dataset <options>")
+    parser.add_option('-d', '--directory', help='Directory of the replay files (default: output)', default="output")
+    parser.add_option('-o', '--dataset', help='Directory of the dataset (default: dataset in the replay directory)', default=None)
+    parser.add_option('-n', '--num_of_agents', type='int', help='Number of agents in the games to export; others are skipped (default: 2)', default=2)
+    parser.add_option('-j', '--jobs', type='int', help='Number of worker processes replaying games (default: 1)', default=1)
+    parser.add_option('--shardSize', type='int', help='Positions per shard (default: {})'.format(SHARD_SIZE), default=SHARD_SIZE)
+    options, otherjunk = parser.parse_args(sys.argv[1:])
+    assert len(otherjunk) == 0, "Unrecognized options: " + str(otherjunk)
+    return options
+
+# MAIN ---------------------------------------------------------------------------------------------------------------#
+
+if __name__ == '__main__':
+    run(loadParameter())
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
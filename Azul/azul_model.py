@@ -1,32 +1,147 @@
 from template import GameState, GameRule, Agent
 
 import random
-import numpy
 import copy
 import Azul.azul_utils as utils
 
 
+# Column of the wall grid in which each tile colour is placed, for each
+# row (GRID_SCHEME[row][tile] == column). The wall reads:
+#    [Tile.BLUE,Tile.YELLOW,Tile.RED,Tile.BLACK,Tile.WHITE],
+#    [Tile.WHITE,Tile.BLUE,Tile.YELLOW,Tile.RED,Tile.BLACK],
+#    [Tile.BLACK,Tile.WHITE,Tile.BLUE,Tile.YELLOW,Tile.RED],
+#    [Tile.RED,Tile.BLACK,Tile.WHITE,Tile.BLUE,Tile.YELLOW],
+#    [Tile.YELLOW,Tile.RED,Tile.BLACK,Tile.WHITE,Tile.BLUE]
+GRID_SCHEME = [
+    [0,1,2,3,4],
+    [1,2,3,4,0],
+    [2,3,4,0,1],
+    [3,4,0,1,2],
+    [4,0,1,2,3]
+]
+WALL_SIZE = len(GRID_SCHEME)
+
+# Walls are stored as integer bitboards: cell (row, col) is bit 
+# row*WALL_SIZE + col. Agents also keep the transposed wall (cell 
+# (row, col) at bit col*WALL_SIZE + row), so that both the row and the 
+# column through a cell can be read as a WALL_SIZE-bit line.
+LINE_MASK = (1 << WALL_SIZE) - 1
+
+# Bit of the wall (and of the transposed wall) covering each tile colour
+# in each row, indexed [row][tile].
+CELL_BIT = [[1 << (row*WALL_SIZE + GRID_SCHEME[row][tile]) 
+             for tile in utils.Tile] for row in range(WALL_SIZE)]
+CELL_BIT_T = [[1 << (GRID_SCHEME[row][tile]*WALL_SIZE + row) 
+               for tile in utils.Tile] for row in range(WALL_SIZE)]
+
+# Masks of the cells making up each row, column and colour of a wall.
+ROW_MASKS = [LINE_MASK << (row*WALL_SIZE) for row in range(WALL_SIZE)]
+COL_MASKS = [sum(1 << (row*WALL_SIZE + col) for row in range(WALL_SIZE))
+             for col in range(WALL_SIZE)]
+COLOUR_MASKS = [sum(CELL_BIT[row][tile] for row in range(WALL_SIZE))
+                for tile in utils.Tile]
+
+# Contribution of one line (row or column) to the score of a tile just 
+# placed at position 'pos' in that line, indexed [pos][line bits]: the 
+# length of the contiguous run of tiles through 'pos', or 0 if the tile
+# has no neighbour in this line.
+def _BuildLineScores():
+    table = []
+    for pos in range(WALL_SIZE):
+        scores = []
+        for bits in range(1 << WALL_SIZE):
+            bits |= 1 << pos
+            lo = pos
+            while lo > 0 and bits >> (lo-1) & 1:
+                lo -= 1
+            hi = pos
+            while hi < WALL_SIZE-1 and bits >> (hi+1) & 1:
+                hi += 1
+            run = hi - lo + 1
+            scores.append(run if run > 1 else 0)
+        table.append(scores)
+    return table
+
+LINE_SCORE = _BuildLineScores()
+
+# Wall lines (the WALL_SIZE cells of one row or column) as 0/1 tuples,
+# indexed by line bits; used to present walls as 5x5 grids.
+LINE_CELLS = [tuple(bits >> i & 1 for i in range(WALL_SIZE))
+              for bits in range(1 << WALL_SIZE)]
+
+# Zobrist keys for hashing positions (see AzulState.ComputeZobrist). Keys
+# are drawn from a private generator with a fixed seed, so hashes are the
+# same in every process and the global random state is left untouched.
+# A count of zero always maps to key 0, so empty displays, pattern lines 
+# and floors do not contribute to the hash.
+ZOBRIST_SEED = 90054
+MAX_AGENTS = 4
+MAX_FACTORIES = utils.MAX_FACTORIES
+MAX_TILES = 100
+MAX_SCORE = 255   # Scores above this share a key.
+
+def _BuildZobristKeys(rng, *shape):
+    if len(shape) == 1:
+        return [0] + [rng.getrandbits(64) for _ in range(shape[0]-1)]
+    return [_BuildZobristKeys(rng, *shape[1:]) for _ in range(shape[0])]
+
+_zobrist_rng = random.Random(ZOBRIST_SEED)
+# [factory][tile][count]
+ZOBRIST_FACTORY = _BuildZobristKeys(_zobrist_rng, MAX_FACTORIES, len(utils.Tile), 5)
+# [tile][count]
+ZOBRIST_CENTRE = _BuildZobristKeys(_zobrist_rng, len(utils.Tile), MAX_TILES+1)
+# [agent][line][tile][count]
+ZOBRIST_LINE = _BuildZobristKeys(_zobrist_rng, MAX_AGENTS, WALL_SIZE, len(utils.Tile), WALL_SIZE+1)
+# [agent][cell], cell being the bit index of the tile in the wall
+ZOBRIST_WALL = [[_zobrist_rng.getrandbits(64) for _ in range(WALL_SIZE*WALL_SIZE)] 
+                for _ in range(MAX_AGENTS)]
+# [agent][number of filled floor slots]
+ZOBRIST_FLOOR = _BuildZobristKeys(_zobrist_rng, MAX_AGENTS, 8)
+# [agent][score]
+ZOBRIST_SCORE = _BuildZobristKeys(_zobrist_rng, MAX_AGENTS, MAX_SCORE+1)
+# [holder of the first agent token + 1], 0 meaning it is still in the centre
+ZOBRIST_TOKEN = _BuildZobristKeys(_zobrist_rng, MAX_AGENTS+1)
+# [agent to move], MAX_AGENTS being the gamemaster
+ZOBRIST_TURN = [_zobrist_rng.getrandbits(64) for _ in range(MAX_AGENTS+1)]
+del _zobrist_rng
+
+
 class AzulState(GameState):
     NUM_FACTORIES = [5,7,9]
     NUM_TILE_TYPE = 20
     NUM_ON_FACTORY = 4
 
+    # States are copied at every node of an agent's search tree, so they
+    # are kept flat: slotted objects holding small lists of ints that
+    # clone() can copy without walking the object graph like deepcopy.
+    __slots__ = ("agents", "bag", "bag_used", "factories", "centre_pool",
+                 "first_agent_taken", "first_agent", "next_first_agent",
+                 "_agent_to_move", "zobrist", "rng", "tiles_on_board")
+
 
     class TileDisplay:
+        __slots__ = ("tiles", "total")
+
         def __init__(self):
-            # Map between tile colour and number in the display
-            self.tiles = {}
+            # Number of tiles of each colour in the display, indexed by
+            # tile colour
+            self.tiles = [0]*len(utils.Tile)
 
             # Total number of tiles in the display
             self.total = 0
 
-            for tile in utils.Tile:
-                self.tiles[tile] = 0
+        def clone(self):
+            td = self.__class__.__new__(self.__class__)
+            td.tiles = self.tiles[:]
+            td.total = self.total
+            return td
+
+        def SameAs(self, other):
+            return self.tiles == other.tiles and self.total == other.total
 
         def ReactionTiles(self, number, tile_type):
             assert number > 0
-            assert tile_type in utils.Tile
-            assert tile_type in self.tiles
+            assert 0 <= tile_type < len(self.tiles)
 
             self.tiles[tile_type] -= number
             self.total -= number
@@ -36,13 +151,83 @@ class AzulState(GameState):
 
         def AddTiles(self, number, tile_type):
             assert number > 0
-            assert tile_type in utils.Tile
-            assert tile_type in self.tiles
+            assert 0 <= tile_type < len(self.tiles)
             
             self.tiles[tile_type] += number
             self.total += number
 
 
+    # Bag of tiles, kept as the number of tiles of each colour. Tiles are
+    # drawn at random from the counts.
+    class TileBag(TileDisplay):
+        __slots__ = ()
+
+        def Extend(self, tiles):
+            for tile in tiles:
+                self.tiles[tile] += 1
+            self.total += len(tiles)
+
+        # The order of the tiles is not kept, so there is nothing to do.
+        def Shuffle(self, rng):
+            pass
+
+        # Take a tile out of the bag, each tile being equally likely.
+        def Draw(self, rng):
+            r = rng.randrange(self.total)
+            for tile,num in enumerate(self.tiles):
+                if r < num:
+                    self.tiles[tile] -= 1
+                    self.total -= 1
+                    return tile
+                r -= num
+
+
+    # Bag of tiles kept as an ordered list, drawn from the front, as bags 
+    # were stored before TileBag. Games and replays recorded with it can 
+    # only be reproduced exactly with this bag, since shuffling the list 
+    # uses the random state differently from drawing from counts.
+    class LegacyTileBag:
+        __slots__ = ("contents",)
+
+        def __init__(self, contents=None):
+            self.contents = contents if contents is not None else []
+
+        def clone(self):
+            return AzulState.LegacyTileBag(self.contents[:])
+
+        def SameAs(self, other):
+            return self.contents == other.contents
+
+        # Number of tiles of each colour in the bag, indexed by colour
+        @property
+        def tiles(self):
+            counts = [0]*len(utils.Tile)
+            for tile in self.contents:
+                counts[tile] += 1
+            return counts
+
+        @property
+        def total(self):
+            return len(self.contents)
+
+        def AddTiles(self, number, tile_type):
+            self.contents.extend([tile_type]*number)
+
+        # Remove the given number of tiles, which must be the last added.
+        def ReactionTiles(self, number, tile_type):
+            assert self.contents[-number:] == [tile_type]*number
+            del self.contents[-number:]
+
+        def Extend(self, tiles):
+            self.contents.extend(tiles)
+
+        def Shuffle(self, rng):
+            rng.shuffle(self.contents)
+
+        def Draw(self, rng):
+            return self.contents.pop(0)
+
+
     class AgentState:
         GRID_SIZE = 5
         FLOOR_SCORES = [-1,-1,-2,-2,-2,-3,-3]
@@ -50,67 +235,77 @@ class AzulState(GameState):
         COL_BONUS = 7
         SET_BONUS = 10
 
+        # The wall colour scheme is the same for every agent, so it is 
+        # shared rather than stored (and copied) per instance.
+        grid_scheme = GRID_SCHEME
+
+        __slots__ = ("id", "score", "lines_number", "lines_tile",
+                     "wall", "wall_t", "floor", "floor_tiles",
+                     "completed_rows", "completed_cols", "completed_sets")
+
         def __init__(self, _id):
             self.id = _id
             self.score = 0
             self.lines_number = [0]*self.GRID_SIZE
             self.lines_tile = [-1]*self.GRID_SIZE
 
-            self.agent_trace = utils.AgentTrace(_id)
-
-            #self.grid_scheme = [
-            #    [Tile.BLUE,Tile.YELLOW,Tile.RED,Tile.BLACK,Tile.WHITE],
-            #    [Tile.WHITE,Tile.BLUE,Tile.YELLOW,Tile.RED,Tile.BLACK],
-            #    [Tile.BLACK,Tile.WHITE,Tile.BLUE,Tile.YELLOW,Tile.RED],
-            #    [Tile.RED,Tile.BLACK,Tile.WHITE,Tile.BLUE,Tile.YELLOW],
-            #    [Tile.YELLOW,Tile.RED,Tile.BLACK,Tile.WHITE,Tile.BLUE]
-            #]
-            self.grid_scheme = numpy.zeros((self.GRID_SIZE,self.GRID_SIZE))
-            self.grid_scheme[0][utils.Tile.BLUE] = 0
-            self.grid_scheme[1][utils.Tile.BLUE] = 1
-            self.grid_scheme[2][utils.Tile.BLUE] = 2
-            self.grid_scheme[3][utils.Tile.BLUE] = 3
-            self.grid_scheme[4][utils.Tile.BLUE] = 4
-
-            self.grid_scheme[1][utils.Tile.WHITE] = 0
-            self.grid_scheme[2][utils.Tile.WHITE] = 1
-            self.grid_scheme[3][utils.Tile.WHITE] = 2
-            self.grid_scheme[4][utils.Tile.WHITE] = 3 
-            self.grid_scheme[0][utils.Tile.WHITE] = 4
-            
-            self.grid_scheme[2][utils.Tile.BLACK] = 0 
-            self.grid_scheme[3][utils.Tile.BLACK] = 1
-            self.grid_scheme[4][utils.Tile.BLACK] = 2
-            self.grid_scheme[0][utils.Tile.BLACK] = 3
-            self.grid_scheme[1][utils.Tile.BLACK] = 4
-
-            self.grid_scheme[3][utils.Tile.RED] = 0
-            self.grid_scheme[4][utils.Tile.RED] = 1
-            self.grid_scheme[0][utils.Tile.RED] = 2
-            self.grid_scheme[1][utils.Tile.RED] = 3
-            self.grid_scheme[2][utils.Tile.RED] = 4
-
-            self.grid_scheme[4][utils.Tile.YELLOW] = 0
-            self.grid_scheme[0][utils.Tile.YELLOW] = 1
-            self.grid_scheme[1][utils.Tile.YELLOW] = 2
-            self.grid_scheme[2][utils.Tile.YELLOW] = 3
-            self.grid_scheme[3][utils.Tile.YELLOW] = 4
-
-            # Matrix representing state of the agent's grid (ie. which
-            # slots have tiles on them -- 1s -- and which don't -- 0s).
-            self.grid_state = numpy.zeros((self.GRID_SIZE,self.GRID_SIZE))
+            # Bitboard of the agent's wall grid (ie. which slots have 
+            # tiles on them -- 1s -- and which don't -- 0s), and the same
+            # wall transposed. See GRID_SCHEME and CELL_BIT.
+            self.wall = 0
+            self.wall_t = 0
+
+            # Number of completed rows, columns and colour sets on the
+            # wall, kept up to date by ScoreRound (see CountCompleted).
+            self.completed_rows = 0
+            self.completed_cols = 0
+            self.completed_sets = 0
 
             # State of the agent's floor line, a 1 indicates there is
             # a tile sitting in that position in their floor line.
             self.floor = [0,0,0,0,0,0,0]
             self.floor_tiles = []
 
-            # Record of the number of tiles of each colour the agent
-            # has placed in their grid (useful for end-game scoring)
-            self.number_of = {}
-            for tile in utils.Tile:
-                self.number_of[tile] = 0
-
+        def clone(self):
+            ps = AzulState.AgentState.__new__(AzulState.AgentState)
+            ps.id = self.id
+            ps.score = self.score
+            ps.lines_number = self.lines_number[:]
+            ps.lines_tile = self.lines_tile[:]
+            ps.wall = self.wall
+            ps.wall_t = self.wall_t
+            ps.floor = self.floor[:]
+            ps.floor_tiles = self.floor_tiles[:]
+            ps.completed_rows = self.completed_rows
+            ps.completed_cols = self.completed_cols
+            ps.completed_sets = self.completed_sets
+            return ps
+
+        def SameAs(self, other):
+            return (self.id == other.id and self.score == other.score
+                and self.wall == other.wall and self.wall_t == other.wall_t
+                and self.lines_number == other.lines_number
+                and self.lines_tile == other.lines_tile
+                and self.floor == other.floor
+                and self.floor_tiles == other.floor_tiles
+                and self.completed_rows == other.completed_rows
+                and self.completed_cols == other.completed_cols
+                and self.completed_sets == other.completed_sets)
+
+        # Matrix representing state of the agent's grid (ie. which
+        # slots have tiles on them -- 1s -- and which don't -- 0s), as a 
+        # list of row tuples built from the wall bitboard. Read-only.
+        @property
+        def grid_state(self):
+            wall = self.wall
+            return [LINE_CELLS[wall >> (i*WALL_SIZE) & LINE_MASK] 
+                    for i in range(self.GRID_SIZE)]
+
+        # Record of the number of tiles of each colour the agent has 
+        # placed in their grid, indexed by tile colour.
+        @property
+        def number_of(self):
+            return [bin(self.wall & mask).count("1") for mask in COLOUR_MASKS]
 
         # Add given tiles to the agent's floor line. After calling this 
         # method, 'tiles' will contain tiles that could not be added to
@@ -146,40 +341,84 @@ class AzulState(GameState):
                     self.floor[i] = 1
                     break
 
-        # Compute number of completed rows in the agent's grid
+        # Number of completed rows in the agent's grid
         def GetCompletedRows(self):
-            completed = 0
-            for i in range(self.GRID_SIZE):
-                allin = True
-                for j in range(self.GRID_SIZE):
-                    if self.grid_state[i][j] == 0:
-                        allin = False
-                        break
-                if allin:
-                    completed += 1
-            return completed
-
-        # Compute number of completed columns in the agent's grid
+            return self.completed_rows
+
+        # Number of completed columns in the agent's grid
         def GetCompletedColumns(self):
-            completed = 0
-            for i in range(self.GRID_SIZE):
-                allin = True
-                for j in range(self.GRID_SIZE):
-                    if self.grid_state[j][i] == 0:
-                        allin = False
-                        break
-                if allin:
-                    completed += 1
-            return completed
-
-        # Compute the number of completed tile sets in the agent's grid
+            return self.completed_cols
+
+        # Number of completed tile sets in the agent's grid
         def GetCompletedSets(self):
-            completed = 0
-            for tile in utils.Tile:
-                if self.number_of[tile] == self.GRID_SIZE:
-                    completed += 1
-            return completed
+            return self.completed_sets
+
+        # Recount the completed rows, columns and sets from the wall; only
+        # needed after setting 'wall' directly.
+        def CountCompleted(self):
+            wall = self.wall
+            self.completed_rows = sum(1 for mask in ROW_MASKS if wall & mask == mask)
+            self.completed_cols = sum(1 for mask in COL_MASKS if wall & mask == mask)
+            self.completed_sets = sum(1 for mask in COLOUR_MASKS if wall & mask == mask)
             
+        # Walls (and transposed walls) after the tiles in full pattern lines
+        # are moved across to the grid, the points scored for placing them,
+        # in the order ScoreRound() places them, and the numbers of
+        # completed rows, columns and sets afterwards. The agent is not
+        # changed.
+        def _PlaceFullLines(self):
+            wall = self.wall
+            wall_t = self.wall_t
+            score_inc = 0
+            rows = self.completed_rows
+            cols = self.completed_cols
+            sets = self.completed_sets
+            for i in range(self.GRID_SIZE):
+                if self.lines_number[i] == i+1:
+                    tc = self.lines_tile[i]
+                    col = self.grid_scheme[i][tc]
+
+                    # Tile will be placed at position (i,col) in grid
+                    wall |= CELL_BIT[i][tc]
+                    wall_t |= CELL_BIT_T[i][tc]
+
+                    # The tile is worth 1*the number of tiles in the 
+                    # contiguous horizontal line in which it sits (including
+                    # itself), plus the same for the vertical line. If the
+                    # tile is not next to any already placed tiles on the 
+                    # grid, it is worth 1 point.
+                    score_inc += (
+                        LINE_SCORE[col][wall >> (i*WALL_SIZE) & LINE_MASK] +
+                        LINE_SCORE[i][wall_t >> (col*WALL_SIZE) & LINE_MASK]
+                    ) or 1
+
+                    # A row, column or set is completed by the tile that
+                    # fills its last space
+                    if wall & ROW_MASKS[i] == ROW_MASKS[i]:
+                        rows += 1
+                    if wall & COL_MASKS[col] == COL_MASKS[col]:
+                        cols += 1
+                    if wall & COLOUR_MASKS[tc] == COLOUR_MASKS[tc]:
+                        sets += 1
+            return wall, wall_t, score_inc, rows, cols, sets
+
+        # Change in score from placing tiles and floor penalties. Agents 
+        # cannot be assigned a negative score in any round.
+        def _RoundScoreChange(self, score_inc):
+            penalties = 0
+            for i in range(len(self.floor)):
+                penalties += self.floor[i]*self.FLOOR_SCORES[i]
+
+            score_change = score_inc + penalties
+            if score_change < 0 and self.score < -score_change:
+                score_change = -self.score
+            return score_change
+
+        # End of game bonus for the given completed rows, columns and sets
+        def _Bonus(self, rows, cols, sets):
+            return (rows * self.ROW_BONUS) + (cols * self.COL_BONUS) + \
+                (sets * self.SET_BONUS)
+
         # Complete scoring process for agent at round end: 
         # 1. Action tiles across from pattern lines to the grid and score each;
         #
@@ -191,135 +430,88 @@ class AzulState(GameState):
         #
         # Returns a pair: the change in the agent's score; and the set of 
         # tiles to be returned to the "used" tile bag. The agents internal
-        # representation of their score is updated in the process. 
+        # representation of their score is updated in the process.
         def ScoreRound(self):
             used_tiles = []
 
-            score_inc = 0
-
             # 1. Action tiles across from pattern lines to the wall grid
+            (self.wall, self.wall_t, score_inc, self.completed_rows,
+                self.completed_cols, self.completed_sets) = self._PlaceFullLines()
             for i in range(self.GRID_SIZE):
                 # Is the pattern line full? If not it persists in its current
                 # state into the next round.
                 if self.lines_number[i] == i+1:
-                    tc = self.lines_tile[i]
-                    col = int(self.grid_scheme[i][tc])
-
-                    # Record that the agent has placed a tile of type 'tc'
-                    self.number_of[tc] += 1
-
                     # Clear the pattern line, add all but one tile into the
-                    # used tiles bag. The last tile will be placed on the 
+                    # used tiles bag. The last tile was placed on the 
                     # agents wall grid.  
-                    for j in range(i):
-                        used_tiles.append(tc)
+                    used_tiles.extend([self.lines_tile[i]]*i)
 
                     self.lines_tile[i] = -1
                     self.lines_number[i] = 0
 
-                    # Tile will be placed at position (i,col) in grid
-                    self.grid_state[i][col] = 1
-
-                    # count the number of tiles in a continguous line
-                    # above, below, to the left and right of the placed tile.
-                    above = 0
-                    for j in range(col-1, -1, -1):
-                        val = self.grid_state[i][j]
-                        above += val
-                        if val == 0:
-                            break
-                    below = 0
-                    for j in range(col+1,self.GRID_SIZE,1):
-                        val = self.grid_state[i][j]
-                        below +=  val
-                        if val == 0:
-                            break
-                    left = 0
-                    for j in range(i-1, -1, -1):
-                        val = self.grid_state[j][col]
-                        left += val
-                        if val == 0:
-                            break
-                    right = 0
-                    for j in range(i+1, self.GRID_SIZE, 1):
-                        val = self.grid_state[j][col]
-                        right += val
-                        if val == 0:
-                            break
-
-                    # If the tile sits in a contiguous vertical line of 
-                    # tiles in the grid, it is worth 1*the number of tiles
-                    # in this line (including itself).
-                    if above > 0 or below > 0:
-                        score_inc += (1 + above + below)
-
-                    # In addition to the vertical score, the tile is worth
-                    # an additional H points where H is the length of the 
-                    # horizontal contiguous line in which it sits.
-                    if left > 0 or right > 0:
-                        score_inc += (1 + left + right)
-
-                    # If the tile is not next to any already placed tiles
-                    # on the grid, it is worth 1 point.                
-                    if above == 0 and below == 0 and left == 0 \
-                        and right == 0:
-                        score_inc += 1
-
             # Score penalties for tiles in floor line
-            penalties = 0
+            score_change = self._RoundScoreChange(score_inc)
             for i in range(len(self.floor)):
-                penalties += self.floor[i]*self.FLOOR_SCORES[i]
                 self.floor[i] = 0
                 
             used_tiles.extend(self.floor_tiles)
             self.floor_tiles = []
             
-            # Agents cannot be assigned a negative score in any round.
-            score_change = score_inc + penalties
-            if score_change < 0 and self.score < -score_change:
-                score_change = -self.score
-            
             self.score += score_change
-            self.agent_trace.round_scores[-1] = score_change
 
             return (self.score, used_tiles) 
 
+        # The score ScoreRound() would return for this agent now, without
+        # changing the agent.
+        def PreviewRoundScore(self):
+            return self.score + self._RoundScoreChange(self._PlaceFullLines()[2])
+
         # Complete additional end of game scoring (add bonuses). Return
         # computed bonus, and add to internal score representation.
         def EndOfGameScore(self):
-            rows = self.GetCompletedRows()
-            cols = self.GetCompletedColumns()
-            sets = self.GetCompletedSets()
-
-            bonus = (rows * self.ROW_BONUS) + (cols * self.COL_BONUS) + \
-                (sets * self.SET_BONUS)
-
-            self.agent_trace.bonuses = bonus
+            bonus = self._Bonus(self.completed_rows, self.completed_cols,
+                self.completed_sets)
             self.score += bonus
             return bonus 
 
+        # The bonus EndOfGameScore() would return after ScoreRound(), ie. 
+        # counting the tiles in full pattern lines as placed, without 
+        # changing the agent. Together with PreviewRoundScore() this gives
+        # ScoreRound()[0] + EndOfGameScore() on an unscored agent.
+        def PreviewEndGameBonus(self):
+            return self._Bonus(*self._PlaceFullLines()[3:])
+
 
-    def __init__(self, num_agents):
+    def __init__(self, num_agents, legacy_bag=False):
         # Create agent states
         self.agents = []
         for i in range(num_agents):
             ps = self.AgentState(i)
             self.agents.append(ps)
+
+        # Source of randomness for drawing tiles; None uses the random 
+        # module (which game.Game seeds before every move).
+        self.rng = None
             
-        # Tile bag contains NUM_TILE_TYPE of each tile colour
-        self.bag = []
-        for i in range(self.NUM_TILE_TYPE):
-            self.bag.append(utils.Tile.BLUE)
-            self.bag.append(utils.Tile.YELLOW)
-            self.bag.append(utils.Tile.RED)
-            self.bag.append(utils.Tile.BLACK)
-            self.bag.append(utils.Tile.WHITE)
+        # Tile bag contains NUM_TILE_TYPE of each tile colour, "used" bag
+        # is initially empty
+        if legacy_bag:
+            self.bag = self.LegacyTileBag()
+            for i in range(self.NUM_TILE_TYPE):
+                self.bag.Extend(utils.Tile)
+            self.bag_used = self.LegacyTileBag()
+        else:
+            self.bag = self.TileBag()
+            for tile in utils.Tile:
+                self.bag.AddTiles(self.NUM_TILE_TYPE, tile)
+            self.bag_used = self.TileBag()
 
         # Shuffle contents of tile bag
-        random.shuffle(self.bag)
+        self.bag.Shuffle(self.rng or random)
 
-        # "Used" bag is initial empty
-        self.bag_used = []
+        # Number of tiles on the factory displays and in the centre pool,
+        # kept up to date by InitialiseFactory and AzulGameRule.
+        self.tiles_on_board = 0
 
         # In a 2/3/4-agent game, 5/7/9 factory displays are used
         self.factories = []
@@ -336,39 +528,125 @@ class AzulState(GameState):
         self.first_agent = random.randrange(num_agents)
         self.next_first_agent = -1
 
+        # The game starts with the gamemaster (index num_agents) to move.
+        self._agent_to_move = num_agents
+
+        # 64-bit Zobrist hash of the position, kept up to date by 
+        # AzulGameRule as moves are applied.
+        self.zobrist = self.ComputeZobrist()
+
+    # Index of the agent to move (the number of agents for the gamemaster).
+    # Setting it updates the position's hash.
+    @property
+    def agent_to_move(self):
+        return self._agent_to_move
+
+    @agent_to_move.setter
+    def agent_to_move(self, agent_id):
+        self.zobrist ^= ZOBRIST_TURN[self._agent_to_move] ^ ZOBRIST_TURN[agent_id]
+        self._agent_to_move = agent_id
+
+    # Compute the Zobrist hash of this position from scratch. It covers 
+    # the factory displays, the centre pool, each agent's pattern lines, 
+    # wall, floor line and score, the holder of the first agent token and
+    # the agent to move (but not the contents of the bags). AzulGameRule 
+    # maintains the same value incrementally in 'zobrist'; call this to 
+    # resynchronise after modifying agent states directly (e.g. with 
+    # AgentState.ScoreRound).
+    def ComputeZobrist(self):
+        h = 0
+        for fid,fd in enumerate(self.factories):
+            for tile in utils.Tile:
+                h ^= ZOBRIST_FACTORY[fid][tile][fd.tiles[tile]]
+        for tile in utils.Tile:
+            h ^= ZOBRIST_CENTRE[tile][self.centre_pool.tiles[tile]]
+        for plr in self.agents:
+            for i in range(plr.GRID_SIZE):
+                if plr.lines_number[i] > 0:
+                    h ^= ZOBRIST_LINE[plr.id][i][plr.lines_tile[i]][plr.lines_number[i]]
+            for cell in range(WALL_SIZE*WALL_SIZE):
+                if plr.wall >> cell & 1:
+                    h ^= ZOBRIST_WALL[plr.id][cell]
+            h ^= ZOBRIST_FLOOR[plr.id][plr.floor.count(1)]
+            h ^= ZOBRIST_SCORE[plr.id][min(plr.score, MAX_SCORE)]
+        h ^= ZOBRIST_TOKEN[self.next_first_agent+1]
+        h ^= ZOBRIST_TURN[self._agent_to_move]
+        return h
+
+    # Return an independent copy of this state. Much cheaper than
+    # copy.deepcopy, and the copy can be mutated (e.g. passed to
+    # AzulGameRule.generateSuccessor) without affecting the original.
+    def clone(self):
+        state = AzulState.__new__(AzulState)
+        state.agents = [plr.clone() for plr in self.agents]
+        state.bag = self.bag.clone()
+        state.bag_used = self.bag_used.clone()
+        state.factories = [fd.clone() for fd in self.factories]
+        state.centre_pool = self.centre_pool.clone()
+        state.first_agent_taken = self.first_agent_taken
+        state.first_agent = self.first_agent
+        state.next_first_agent = self.next_first_agent
+        state._agent_to_move = self._agent_to_move
+        state.zobrist = self.zobrist
+        state.rng = self.rng
+        state.tiles_on_board = self.tiles_on_board
+        return state
+
+    # Whether this state is the same as another (eg. a clone of it taken 
+    # earlier), comparing every field. Cheap unless they are the same.
+    def SameAs(self, other):
+        return (self.zobrist == other.zobrist
+            and self.tiles_on_board == other.tiles_on_board
+            and self.first_agent_taken == other.first_agent_taken
+            and self.first_agent == other.first_agent
+            and self.next_first_agent == other.next_first_agent
+            and self._agent_to_move == other._agent_to_move
+            and self.rng is other.rng
+            and len(self.agents) == len(other.agents)
+            and all(p.SameAs(q) for p,q in zip(self.agents, other.agents))
+            and len(self.factories) == len(other.factories)
+            and all(f.SameAs(g) for f,g in zip(self.factories, other.factories))
+            and self.centre_pool.SameAs(other.centre_pool)
+            and self.bag.SameAs(other.bag)
+            and self.bag_used.SameAs(other.bag_used))
 
     def TilesRemaining(self):
-        if self.centre_pool.total > 0:
-            return True
-        for fac in self.factories:
-            if fac.total > 0:
-                return True
-        return False
+        return self.tiles_on_board > 0
+
+    # Count the tiles on the factory displays and in the centre pool; only
+    # needed to resynchronise 'tiles_on_board' after changing the displays
+    # directly.
+    def ComputeTilesOnBoard(self):
+        return self.centre_pool.total + sum(fd.total for fd in self.factories)
 
     # Place tiles from the main bag (and used bag if the main bag runs
     # out of tiles) onto the given factory display.
     def InitialiseFactory(self, factory):
         # Reset contents of factory display
+        self.tiles_on_board -= factory.total
         factory.total = 0
-        for tile in utils.Tile:
-            factory.tiles[tile] = 0
+        factory.tiles = [0]*len(utils.Tile)
+
+        rng = self.rng or random
 
         # If there are < NUM_ON_FACTORY tiles in the bag, shuffle the 
         # tiles in the "used" bag and add them to the main bag (we still
-        # want the tiles that were left in the main bag to be drawn first).
+        # want the tiles that were left in the main bag to be drawn first,
+        # so they are taken before the used tiles become the main bag).
         # Fill the factory display with tiles, up to capacity, if possible.
         # If there are less than NUM_ON_FACTORY tiles available in both
         # bags, the factory will be left at partial capacity.
-        if len(self.bag) < self.NUM_ON_FACTORY and len(self.bag_used) > 0:
-            random.shuffle(self.bag_used)
-            self.bag.extend(self.bag_used)
-            self.bag_used = []
+        if self.bag.total < self.NUM_ON_FACTORY and self.bag_used.total > 0:
+            while self.bag.total > 0:
+                factory.AddTiles(1, self.bag.Draw(rng))
+            self.bag_used.Shuffle(rng)
+            self.bag, self.bag_used = self.bag_used, self.bag
 
-        for i in range(min(self.NUM_ON_FACTORY,len(self.bag))):
+        while factory.total < self.NUM_ON_FACTORY and self.bag.total > 0:
             # take tile out of the bag
-            tile = self.bag.pop(0)
-            factory.tiles[tile] += 1
-            factory.total += 1
+            factory.AddTiles(1, self.bag.Draw(rng))
+
+        self.tiles_on_board += factory.total
 
     # Execute end of round actions (scoring and clean up)
     def ExecuteEndOfRound(self):
@@ -376,92 +654,224 @@ class AzulState(GameState):
         # used bag (if appropriate).
         for plr in self.agents:
             _,used = plr.ScoreRound()
-            self.bag_used.extend(used)
+            self.bag_used.Extend(used)
 
 
 class AzulGameRule(GameRule):
-    def __init__(self,num_of_agent):
+    # With legacy_bag, bags are ordered lists as in games (and replays) 
+    # recorded before bags were kept as counts; see AzulState.LegacyTileBag.
+    def __init__(self,num_of_agent,legacy_bag=False):
+        self.legacy_bag = legacy_bag
         super().__init__(num_of_agent)
+
+        # Each agent's actions and scores over the game. They are recorded
+        # by update() rather than kept in the game state, so states stay 
+        # as cheap to copy at the end of the game as at the start.
+        self.agent_traces = [utils.AgentTrace(i) for i in range(num_of_agent)]
         self.private_information = None # Azul is a perfect-information game.
         
     def validAction(self, m, actions):
         return utils.ValidAction(m, actions)
 
+    def indexActions(self, actions):
+        return utils.IndexActions(actions)
+
+    # Agents are handed the game state itself rather than a deep copy; a
+    # clone is enough to detect and undo any change they make to it.
+    def snapshotState(self, game_state):
+        return game_state.clone()
+
+    def stateChanged(self, game_state, snapshot):
+        return not game_state.SameAs(snapshot)
+
+    # Actions are packed as their utils.ACTIONS code, and the round
+    # signals as the two codes after those.
+    def encodeAction(self, action):
+        if action == "STARTROUND":
+            return len(utils.ACTIONS)
+        if action == "ENDROUND":
+            return len(utils.ACTIONS)+1
+        return utils.EncodeAction(action)
+
+    def decodeAction(self, code):
+        if code == len(utils.ACTIONS):
+            return "STARTROUND"
+        if code == len(utils.ACTIONS)+1:
+            return "ENDROUND"
+        return utils.DecodeAction(code)
+
     def initialGameState(self):
         self.current_agent_index = self.num_of_agent
-        return AzulState(self.num_of_agent)
+        return AzulState(self.num_of_agent, self.legacy_bag)
 
     def generateSuccessor(self, state, action, agent_id):
         if action == "ENDROUND":
             for plr in state.agents:
                 _,used = plr.ScoreRound()
-                state.bag_used.extend(used)
+                state.bag_used.Extend(used)
 
             state.first_agent_taken = False
             state.first_agent = state.next_first_agent
             state.next_first_agent = -1
+            state._agent_to_move = len(state.agents)
+            state.zobrist = state.ComputeZobrist()
         elif action == "STARTROUND":
-            for plr in state.agents:
-                plr.agent_trace.StartRound()
             for fd in state.factories:
                 state.InitialiseFactory(fd)
 
-            for tile in utils.Tile:
-                state.centre_pool.tiles[tile] = 0
+            state.centre_pool.tiles = [0]*len(utils.Tile)
+            state._agent_to_move = state.first_agent
+            state.zobrist = state.ComputeZobrist()
         else:
-            plr_state = state.agents[agent_id]
-            plr_state.agent_trace.actions[-1].append(action)
-
-            # The agent is taking tiles from the centre
-            if action[0] == utils.Action.TAKE_FROM_CENTRE: 
-                tg = action[2]
-
-                if not state.first_agent_taken:
-                    plr_state.GiveFirstAgentToken()
-                    state.first_agent_taken = True
-                    state.next_first_agent = agent_id
-
-                if tg.num_to_floor_line > 0:
-                    ttf = []
-                    for i in range(tg.num_to_floor_line):
-                        ttf.append(tg.tile_type)
-                    plr_state.AddToFloor(ttf)
-                    state.bag_used.extend(ttf)
-
-                if tg.num_to_pattern_line > 0:
-                    plr_state.AddToPatternLine(tg.pattern_line_dest, 
-                        tg.num_to_pattern_line, tg.tile_type)
-
-                # Reaction tiles from the centre
-                state.centre_pool.ReactionTiles(tg.number, tg.tile_type)
-
-            elif action[0] == utils.Action.TAKE_FROM_FACTORY:
-                tg = action[2]
-                if tg.num_to_floor_line > 0:
-                    ttf = []
-                    for i in range(tg.num_to_floor_line):
-                        ttf.append(tg.tile_type)
-                    plr_state.AddToFloor(ttf)
-                    state.bag_used.extend(ttf)
-
-                if tg.num_to_pattern_line > 0:
-                    plr_state.AddToPatternLine(tg.pattern_line_dest, 
-                        tg.num_to_pattern_line, tg.tile_type)
-
-                # Reaction tiles from the factory display
-                fid = action[1]
-                fac = state.factories[fid]
-                fac.ReactionTiles(tg.number,tg.tile_type)
-
-                # All remaining tiles on the factory display go into the 
-                # centre!
-                for tile in utils.Tile:
-                    num_on_fd = fac.tiles[tile]
-                    if num_on_fd > 0:
-                        state.centre_pool.AddTiles(num_on_fd, tile)
-                        fac.ReactionTiles(num_on_fd, tile)
+            self.apply(state, action, agent_id)
         return state
+
+    # Apply an agent's move (a tile grab) to the given state in place, as
+    # generateSuccessor does, and return an undo token. Passing the token
+    # to undo() restores the state exactly, so search agents can explore
+    # moves on a single state rather than copying it for every node. The
+    # STARTROUND and ENDROUND signals cannot be undone and must go through
+    # generateSuccessor.
+    def apply(self, state, action, agent_id):
+        plr_state = state.agents[agent_id]
+        centre = state.centre_pool
+        tg = action[2]
+        line = tg.pattern_line_dest
+        from_factory = action[0] == utils.Action.TAKE_FROM_FACTORY
+
+        # Record everything the move can change. The floor line always 
+        # fills from the left, so its number of filled slots is enough to
+        # restore it. The factory's tile list is replaced rather than 
+        # modified below, so the token can keep the original.
+        num_floor = plr_state.floor.count(1)
+        undo_token = (agent_id, action, state.first_agent_taken,
+            state.next_first_agent, num_floor,
+            len(plr_state.floor_tiles), state.bag_used.total,
+            plr_state.lines_number[line] if line != -1 else 0,
+            plr_state.lines_tile[line] if line != -1 else -1,
+            state.factories[action[1]].tiles if from_factory else None,
+            state._agent_to_move, state.zobrist)
+
+        # The position's hash is updated alongside each change.
+        h = state.zobrist
+
+        state.tiles_on_board -= tg.number
+
+        # The agent is taking tiles from the centre
+        if not from_factory and not state.first_agent_taken:
+            plr_state.GiveFirstAgentToken()
+            state.first_agent_taken = True
+            state.next_first_agent = agent_id
+            h ^= ZOBRIST_TOKEN[0] ^ ZOBRIST_TOKEN[agent_id+1]
+
+        if tg.num_to_floor_line > 0:
+            ttf = [tg.tile_type]*tg.num_to_floor_line
+            plr_state.AddToFloor(ttf)
+            state.bag_used.Extend(ttf)
+        floor_keys = ZOBRIST_FLOOR[agent_id]
+        h ^= floor_keys[num_floor] ^ floor_keys[plr_state.floor.count(1)]
+
+        if tg.num_to_pattern_line > 0:
+            line_keys = ZOBRIST_LINE[agent_id][line]
+            h ^= line_keys[plr_state.lines_tile[line]][plr_state.lines_number[line]]
+            plr_state.AddToPatternLine(line, tg.num_to_pattern_line, tg.tile_type)
+            h ^= line_keys[tg.tile_type][plr_state.lines_number[line]]
+
+        if not from_factory:
+            # Reaction tiles from the centre
+            centre_keys = ZOBRIST_CENTRE[tg.tile_type]
+            h ^= centre_keys[centre.tiles[tg.tile_type]]
+            centre.ReactionTiles(tg.number, tg.tile_type)
+            h ^= centre_keys[centre.tiles[tg.tile_type]]
+        else:
+            # Reaction tiles from the factory display. All remaining tiles
+            # on the factory display go into the centre!
+            fac = state.factories[action[1]]
+            assert fac.tiles[tg.tile_type] >= tg.number
+            factory_keys = ZOBRIST_FACTORY[action[1]]
+            for tile,num_on_fd in enumerate(fac.tiles):
+                if num_on_fd > 0:
+                    h ^= factory_keys[tile][num_on_fd]
+                    if tile == tg.tile_type:
+                        num_on_fd -= tg.number
+                    if num_on_fd > 0:
+                        centre_keys = ZOBRIST_CENTRE[tile]
+                        h ^= centre_keys[centre.tiles[tile]] ^ \
+                            centre_keys[centre.tiles[tile] + num_on_fd]
+                        centre.AddTiles(num_on_fd, tile)
+            fac.tiles = [0]*len(fac.tiles)
+            fac.total = 0
+
+        # Play passes to the next agent, or to the gamemaster once all 
+        # tiles have been taken (as in getNextAgentIndex).
+        if state.TilesRemaining():
+            next_agent = (agent_id + 1) % len(state.agents)
+        else:
+            next_agent = len(state.agents)
+        h ^= ZOBRIST_TURN[state._agent_to_move] ^ ZOBRIST_TURN[next_agent]
+        state._agent_to_move = next_agent
+        state.zobrist = h
+
+        return undo_token
+
+    # Reverse the move recorded in an undo token returned by apply(). Moves
+    # must be undone in the reverse order in which they were applied.
+    def undo(self, state, undo_token):
+        (agent_id, action, first_agent_taken, next_first_agent, num_floor, 
+            num_floor_tiles, num_used, line_number, line_tile, 
+            factory_tiles, agent_to_move, zobrist) = undo_token
+        plr_state = state.agents[agent_id]
+        centre = state.centre_pool
+        tg = action[2]
+
+        state.tiles_on_board += tg.number
+
+        if tg.num_to_pattern_line > 0:
+            plr_state.lines_number[tg.pattern_line_dest] = line_number
+            plr_state.lines_tile[tg.pattern_line_dest] = line_tile
+
+        for i in range(num_floor, len(plr_state.floor)):
+            plr_state.floor[i] = 0
+        del plr_state.floor_tiles[num_floor_tiles:]
+        if state.bag_used.total > num_used:
+            state.bag_used.ReactionTiles(state.bag_used.total - num_used, tg.tile_type)
+
+        state.first_agent_taken = first_agent_taken
+        state.next_first_agent = next_first_agent
+        state._agent_to_move = agent_to_move
+        state.zobrist = zobrist
+
+        if factory_tiles is None:
+            centre.AddTiles(tg.number, tg.tile_type)
+        else:
+            # Take the factory's other tiles back out of the centre
+            for tile,num_on_fd in enumerate(factory_tiles):
+                if tile == tg.tile_type:
+                    num_on_fd -= tg.number
+                if num_on_fd > 0:
+                    centre.ReactionTiles(num_on_fd, tile)
+            fac = state.factories[action[1]]
+            fac.tiles = factory_tiles
+            fac.total = sum(factory_tiles)
     
+    # Advance the game, recording the action (or the round scores, at the
+    # end of a round) in the agent traces.
+    def update(self, action):
+        traces = self.agent_traces
+        if action == "STARTROUND":
+            for trace in traces:
+                trace.StartRound()
+        elif action == "ENDROUND":
+            scores = [plr.score for plr in self.current_game_state.agents]
+        else:
+            traces[self.current_agent_index].actions[-1].append(action)
+
+        super().update(action)
+
+        if action == "ENDROUND":
+            for trace, plr, score in zip(traces, self.current_game_state.agents, scores):
+                trace.round_scores[-1] = plr.score - score
+
     def getNextAgentIndex(self):
         if not self.current_game_state.TilesRemaining():
             return self.num_of_agent
@@ -471,13 +881,14 @@ class AzulGameRule(GameRule):
 
     def gameEnds(self):
         for plr_state in self.current_game_state.agents:
-            completed_rows = plr_state.GetCompletedRows()
-            if completed_rows > 0:
+            if plr_state.completed_rows > 0:
                 return True
         return False
 
     def calScore(self, game_state,agent_id):
-        game_state.agents[agent_id].EndOfGameScore()
+        bonus = game_state.agents[agent_id].EndOfGameScore()
+        if game_state is self.current_game_state:
+            self.agent_traces[agent_id].bonuses = bonus
         return game_state.agents[agent_id].score
 
     def getLegalActions(self, game_state, agent_id):
@@ -489,14 +900,31 @@ class AzulGameRule(GameRule):
             return ["STARTROUND"]
         else: 
             agent_state = game_state.agents[agent_id]
-
-            # Look at each factory display with available tiles
-            fid = 0
-            for fd in game_state.factories:
+            # Destinations the agent can use for each tile type: pattern 
+            # lines holding no tiles or tiles of that type, whose space 
+            # on the grid is still free.
+            dests = [[] for _ in utils.Tile]
+            for i in range(agent_state.GRID_SIZE):
+                line_tile = agent_state.lines_tile[i]
+                slots_free = (i+1) - agent_state.lines_number[i]
+                for tile in (utils.Tile if line_tile == -1 else (line_tile,)):
+                    if not agent_state.wall & CELL_BIT[i][tile]:
+                        dests[tile].append((i, slots_free))
+
+            # The actions are shared tuples looked up by their code (see
+            # utils.ActionCode), so none are allocated here.
+            table = utils.ACTIONS
+            num_dests = utils.NUM_DESTS
+
+            # Look at each factory display with available tiles, then at 
+            # the centre pool. Note that we do not include the first agent
+            # token in the collection of tiles recorded in each 
+            # utils.TileGrab. This is managed by the game running class. 
+            sources = list(enumerate(game_state.factories))
+            sources.append((-1, game_state.centre_pool))
+            for fid,fd in sources:
                 # Look at each available tile set
-                for tile in utils.Tile:
-                    num_avail = fd.tiles[tile]
-                
+                for tile,num_avail in enumerate(fd.tiles):
                     if num_avail == 0:
                         continue
 
@@ -504,87 +932,15 @@ class AzulGameRule(GameRule):
                     # added to their floor line (if their floor line is 
                     # full, the extra tiles are placed in the used bag).
 
-                    # First look through each pattern line, create actions 
-                    # that place the tiles in each appropriate line (with
-                    # those that cannot be placed added to the floor line).
-                    for i in range(agent_state.GRID_SIZE):
-                        # Can tiles be added to pattern line i?
-                        if agent_state.lines_tile[i] != -1 and \
-                            agent_state.lines_tile[i] != tile:
-                            # these tiles cannot be added to this pattern line
-                            continue
-
-                        # Is the space on the grid for this tile already
-                        # occupied?
-                        grid_col = int(agent_state.grid_scheme[i][tile])
-                        if agent_state.grid_state[i][grid_col] == 1:
-                            # It is, so we cannot place this tile type
-                            # in this pattern line!
-                            continue
-
-                        slots_free = (i+1) - agent_state.lines_number[i]
-                        tg = utils.TileGrab()
-                        tg.number = num_avail
-                        tg.tile_type = tile
-                        tg.pattern_line_dest = i
-                        tg.num_to_pattern_line = min(num_avail, slots_free)
-                        tg.num_to_floor_line = tg.number - tg.num_to_pattern_line
-
-                        actions.append((utils.Action.TAKE_FROM_FACTORY, fid, tg))
+                    # First create actions that place the tiles in each 
+                    # appropriate pattern line (with those that cannot be
+                    # placed added to the floor line).
+                    code = utils.ActionCode(fid, tile, num_avail)
+                    for i,slots_free in dests[tile]:
+                        actions.append(table[code + (i+1)*num_dests + 
+                            min(num_avail, slots_free)])
             
                     # Default action is to place all the tiles in the floor line
-                    tg = utils.TileGrab()
-                    tg.number = num_avail
-                    tg.tile_type = tile
-                    tg.num_to_floor_line = tg.number
-                    actions.append((utils.Action.TAKE_FROM_FACTORY, fid, tg))
-
-                fid += 1    
-
-            # Alternately, the agent could take tiles from the centre pool.
-            # Note that we do not include the first agent token in the 
-            # collection of tiles recorded in each utils.TileGrab. This is managed
-            # by the game running class. 
-            for tile in utils.Tile:
-                # Number of tiles of this type in the centre
-                num_avail = game_state.centre_pool.tiles[tile]
-
-                if num_avail == 0:
-                    continue
-
-                # First look through each pattern line, create actions 
-                # that place the tiles in each appropriate line (with
-                # those that cannot be placed added to the floor line).
-                for i in range(agent_state.GRID_SIZE):
-                    # Can tiles be added to pattern line i?
-                    if agent_state.lines_tile[i] != -1 and \
-                        agent_state.lines_tile[i] != tile:
-                        # these tiles cannot be added to this pattern line
-                        continue
-
-                    # Is the space on the grid for this tile already
-                    # occupied?
-                    grid_col = int(agent_state.grid_scheme[i][tile])
-                    if agent_state.grid_state[i][grid_col] == 1:
-                        # It is, so we cannot place this tile type
-                        # in this pattern line!
-                        continue
-
-                    slots_free = (i+1) - agent_state.lines_number[i]
-                    tg = utils.TileGrab()
-                    tg.number = num_avail
-                    tg.tile_type = tile
-                    tg.pattern_line_dest = i
-                    tg.num_to_pattern_line = min(num_avail, slots_free)
-                    tg.num_to_floor_line = tg.number - tg.num_to_pattern_line
-
-                    actions.append((utils.Action.TAKE_FROM_CENTRE, -1, tg))
-            
-                # Default action is to place all the tiles in the floor line
-                tg = utils.TileGrab()
-                tg.number = num_avail
-                tg.tile_type = tile
-                tg.num_to_floor_line = tg.number
-                actions.append((utils.Action.TAKE_FROM_CENTRE, -1, tg))
+                    actions.append(table[code])
 
             return actions
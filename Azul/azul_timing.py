@@ -0,0 +1,78 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Test harness for agents' time management. Plays games through the runner's Game class and reports how much
+#          of each move's time limit the agents used, as measured by the runner, and how many warnings they got.
+#          Agents whose SelectAction takes a deadline (see template.Deadline) should run close to the limit without
+#          tripping it.
+# Usage:   python -m Azul.azul_timing -a AGENT[,AGENT] [-m GAMES] [-w SECONDS] [--setRandomSeed SEED]
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+import sys
+import importlib
+from optparse import OptionParser
+from game import Game
+from Azul.azul_model import AzulGameRule
+
+# CONSTANTS ----------------------------------------------------------------------------------------------------------#
+
+DEFAULT_OPPONENT = "agents.generic.first_move"
+
+# FUNCTION DEF -------------------------------------------------------------------------------------------------------#
+
+def playGames(agent_names, num_games, time_limit, seed):
+    """
+    Play the games, swapping seats between games, and collect (agent name, time taken, time limit, warmup) for every
+    move and the number of warnings given to each agent name.
+    """
+    moves = []
+    warnings = {name:0 for name in agent_names}
+    for game_num in range(num_games):
+        names = agent_names if game_num % 2 == 0 else agent_names[::-1]
+        agents = [importlib.import_module(name).myAgent(i) for i,name in enumerate(names)]
+        game = Game(AzulGameRule, agents, len(agents), seed=seed+game_num, time_limit=time_limit)
+        game.Run()
+        for agent_index, action_counter, taken, limit, warmup in game.move_times:
+            moves.append((names[agent_index], taken, limit, warmup))
+        for agent_index, _ in game.warning_positions:
+            warnings[names[agent_index]] += 1
+    return moves, warnings
+
+
+def report(name, moves, warnings):
+    print("{}: {} moves, {} warnings.".format(name, sum(1 for move in moves if move[0] == name), warnings))
+    for warmup in (True, False):
+        used = sorted(taken/limit for n,taken,limit,w in moves if n == name and w == warmup)
+        slack = min((limit-taken for n,taken,limit,w in moves if n == name and w == warmup), default=0)
+        if used:
+            print("    {:<7} limit used: mean {:5.1f}%, 99th percentile {:5.1f}%, max {:5.1f}%; least time left {:.3f}s"\
+                  .format("warmup" if warmup else "other", 100*sum(used)/len(used),
+                          100*used[min(len(used)-1, int(0.99*len(used)))], 100*used[-1], slack))
+
+
+def run(options):
+    agent_names = options.agents.split(",")
+    if len(agent_names) == 1:
+        agent_names.append(DEFAULT_OPPONENT)
+    moves, warnings = playGames(agent_names, options.multipleGames, options.warningTimeLimit, options.setRandomSeed)
+    for name in dict.fromkeys(agent_names):
+        report(name, moves, warnings[name])
+
+
+def loadParameter():
+    parser = OptionParser("python -m Azul.azul_timing <options>")
+    parser.add_option('-a', '--agents', help='One or two agents, etc. agents.t_080.myTeam (default opponent: {})'.format(DEFAULT_OPPONENT))
+    parser.add_option('-m', '--multipleGames', type='int', help='Number of games to play (default: 2)', default=2)
+    parser.add_option('-w', '--warningTimeLimit', type='float', help='Time limit for a warning of one move in seconds (default: 1)', default=1.0)
+    parser.add_option('--setRandomSeed', type='int', help='Random seed of the first game (default: 90054)', default=90054)
+    options, otherjunk = parser.parse_args(sys.argv[1:])
+    assert len(otherjunk) == 0, "Unrecognized options: " + str(otherjunk)
+    assert options.agents, "No agent given."
+    return options
+
+# MAIN ---------------------------------------------------------------------------------------------------------------#
+
+if __name__ == '__main__':
+    run(loadParameter())
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
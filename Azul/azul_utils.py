@@ -51,16 +51,124 @@ class AgentTrace:
 
 # Structure recording the number, type, and destination of tiles 
 # collected by a agent. Note that the sum of 'num_to_pattern_line'
-# and 'num_to_floor_line' must equal 'number'.
+# and 'num_to_floor_line' must equal 'number'. TileGrabs are immutable
+# and compare by value; GetTileGrab returns a shared (interned) instance.
 class TileGrab:
-    def __init__(self):
-        self.tile_type = -1
-        self.number = 0
-        self.pattern_line_dest = -1
-        self.num_to_pattern_line = 0
-        self.num_to_floor_line = 0 
+    __slots__ = ("tile_type", "number", "pattern_line_dest", 
+        "num_to_pattern_line", "num_to_floor_line", "_key")
+
+    def __init__(self, tile_type=-1, number=0, pattern_line_dest=-1, 
+            num_to_pattern_line=0):
+        self._Set(tile_type, number, pattern_line_dest, num_to_pattern_line)
+
+    def _Set(self, tile_type, number, pattern_line_dest, num_to_pattern_line):
+        set_field = object.__setattr__
+        set_field(self, "tile_type", tile_type)
+        set_field(self, "number", number)
+        set_field(self, "pattern_line_dest", pattern_line_dest)
+        set_field(self, "num_to_pattern_line", num_to_pattern_line)
+        set_field(self, "num_to_floor_line", number - num_to_pattern_line)
+        set_field(self, "_key", (((tile_type+1)*(MAX_GRAB+1) + number)
+            *NUM_DESTS + pattern_line_dest+1)*NUM_DESTS + num_to_pattern_line)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TileGrab is immutable")
+
+    def __eq__(self, other):
+        return self is other or (isinstance(other, TileGrab) and 
+            SameTG(self, other))
+
+    def __hash__(self):
+        return self._key
+
+    def __repr__(self):
+        return "TileGrab({}, {}, {}, {})".format(self.tile_type, self.number,
+            self.pattern_line_dest, self.num_to_pattern_line)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (GetTileGrab, (self.tile_type, self.number, 
+            self.pattern_line_dest, self.num_to_pattern_line))
+
+    # Replays pickled before TileGrab had slots store its fields in a dict.
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            state = state[1]
+        self._Set(state["tile_type"], state["number"], 
+            state["pattern_line_dest"], state["num_to_pattern_line"])
+
+# Bounds of the interned TileGrabs and actions: the number of tiles of
+# one colour, the destinations (floor line and five pattern lines) and
+# the sources of tiles (centre and up to 9 factories).
+MAX_GRAB = 20
+NUM_DESTS = 6
+MAX_FACTORIES = 9
+
+TILE_GRABS = [[[[TileGrab(tile, number, dest, to_line)
+                 for to_line in range(NUM_DESTS)]
+                for dest in range(-1, NUM_DESTS-1)]
+               for number in range(MAX_GRAB+1)]
+              for tile in Tile]
+
+# Grabs outside the interned table (eg. read from an old replay) are built
+# as they are, rather than indexing the table with out of range values.
+def GetTileGrab(tile_type, number, pattern_line_dest=-1, num_to_pattern_line=0):
+    if 0 <= tile_type < len(Tile) and 0 <= number <= MAX_GRAB and \
+            -1 <= pattern_line_dest < NUM_DESTS-1 and 0 <= num_to_pattern_line < NUM_DESTS:
+        return TILE_GRABS[tile_type][number][pattern_line_dest+1][num_to_pattern_line]
+    return TileGrab(tile_type, number, pattern_line_dest, num_to_pattern_line)
+
+# Actions can be packed into a small int. ACTIONS maps each code to the
+# shared action tuple, so move generation can look actions up instead of
+# building them. The code of a grab without a pattern line destination 
+# is ActionCode(factory_id, tile_type, number), and adding 
+# (pattern_line_dest+1)*NUM_DESTS + num_to_pattern_line gives the others.
+def ActionCode(factory_id, tile_type, number, pattern_line_dest=-1, 
+        num_to_pattern_line=0):
+    return (((factory_id+1)*len(Tile) + tile_type)*(MAX_GRAB+1) + number) \
+        *NUM_DESTS*NUM_DESTS + (pattern_line_dest+1)*NUM_DESTS + num_to_pattern_line
+
+ACTIONS = [((Action.TAKE_FROM_CENTRE if fid == -1 else Action.TAKE_FROM_FACTORY),
+            fid, TILE_GRABS[tile][number][dest][to_line])
+           for fid in range(-1, MAX_FACTORIES)
+           for tile in Tile
+           for number in range(MAX_GRAB+1)
+           for dest in range(NUM_DESTS)
+           for to_line in range(NUM_DESTS)]
+
+# Codes of the shared action tuples, by object id.
+ACTION_CODES = {id(action): code for code, action in enumerate(ACTIONS)}
+
+# Convert an action tuple (shared or not) to its int code and back.
+def EncodeAction(action):
+    tg = action[2]
+    return ActionCode(action[1], tg.tile_type, tg.number, 
+        tg.pattern_line_dest, tg.num_to_pattern_line)
+
+def DecodeAction(code):
+    if not 0 <= code < len(ACTIONS):
+        raise ValueError("{} is not an action code.".format(code))
+    return ACTIONS[code]
+
+# Return the shared tuple equal to an action, e.g. one read from a replay.
+# Fields out of range can give another action's code, so it is compared.
+def InternAction(action):
+    if isinstance(action, str):
+        return action
+    shared = DecodeAction(EncodeAction(action))
+    if not (shared[0] == action[0] and shared[1] == action[1] and SameTG(shared[2], action[2])):
+        raise ValueError("{} is not an action.".format(action))
+    return shared
 
 def SameTG(tg1, tg2):
+    if tg1 is tg2:
+        return True
+
     if tg1.tile_type != tg2.tile_type:
         return False
 
@@ -78,7 +186,46 @@ def SameTG(tg1, tg2):
 
     return True
 
+# Canonical key of an action: its code for tile grabs, or the signal
+# string itself for the gamemaster's actions. Equal actions from 
+# different instances share a key.
+def ActionKey(action):
+    code = ACTION_CODES.get(id(action))
+    if code is not None:
+        return code
+    if isinstance(action, str):
+        return action
+    return EncodeAction(action)
+
+# Index a list of legal actions by key, so that looking an action up in
+# it (or validating one) is constant-time. Shared action tuples, as 
+# returned by getLegalActions, are keyed without decoding them.
+def IndexActions(actions):
+    codes = ACTION_CODES
+    index = {}
+    for m in actions:
+        code = codes.get(id(m))
+        index[ActionKey(m) if code is None else code] = m
+    return index
+
+# Return the legal action equal to c from an index built by IndexActions,
+# or None if c is not legal (or not an action at all).
+def FindAction(c, action_index):
+    try:
+        m = action_index.get(ActionKey(c))
+    except (TypeError, AttributeError, IndexError, KeyError, ValueError):
+        return None
+    # Fields out of range can alias another action's key, so compare.
+    if m is None or isinstance(m, str):
+        return m if m == c else None
+    if c[0] == m[0] and c[1] == m[1] and SameTG(c[2],m[2]):
+        return m
+    return None
+
+# Accepts either a list of actions or an index built by IndexActions.
 def ValidAction(c, actions):
+    if isinstance(actions, dict):
+        return FindAction(c, actions) is not None
     for m in actions:
         if c[0] == m[0] and c[1] == m[1] and SameTG(c[2],m[2]):
             return True
@@ -0,0 +1,185 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Runs an agent in its own long-lived worker process, so that the runner can time-limit each move without
+#          sharing an interpreter (and the GIL) with the agent. An agent that overruns its time limit is killed, and
+#          a fresh worker is started for its next move.
+#
+#          Agents may also define Ponder(game_state, stop). Ponder is called, in a thread of the agent's worker, with
+#          the game state while another agent chooses its move, and a threading.Event; it should keep searching (eg. to
+#          fill a transposition table) until stop is set, which happens before the agent's next SelectAction, inside
+#          that move's time limit. stop is made before the thread starts, so it cannot be missed.
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+import os, sys, random
+import signal
+import threading
+import multiprocessing
+from   template import TakesDeadline
+
+# CONSTANTS ----------------------------------------------------------------------------------------------------------#
+
+JOIN_TIMEOUT = 1  #Time given to a worker to exit on its own when closed, in seconds.
+RANDOM_STATE_TIMEOUT = 0.1  #Time given to a timed out worker to send its random state, in seconds.
+
+# CLASS DEF ----------------------------------------------------------------------------------------------------------#
+
+class WorkerTimedOut(Exception):
+    pass
+
+
+def _Ponder(agent, game_state, stop):
+    try:
+        agent.Ponder(game_state, stop)
+    except Exception:
+        pass
+
+
+#Main loop of a worker process. A "select" request holds the actions, the game state, the move's Deadline (passed on
+#if SelectAction takes one) and the runner's random state, so that the agent draws the same random numbers as it
+#would in the runner's process. The reply is (True, action, random state),
+#or (False, exception, random state) if SelectAction raised one, the random state being the worker's after the agent's
+#draws, for the runner to carry on from. If the runner signals SIGUSR1 while the agent is still selecting (it has
+#timed out), the worker sends ("random", random state) at once instead. A "ponder" request starts the agent pondering
+#on the game state, and has no reply. Any request stops pondering first. A request of None closes the worker.
+def _WorkerMain(agent, conn, cpu):
+    if cpu is not None:
+        os.sched_setaffinity(0, {cpu})
+    takes_deadline = TakesDeadline(agent)
+    ponder_thread, ponder_stop = None, None
+    selecting = threading.Event()
+
+    #Signal handlers run in this (the main) thread between the agent's steps, and only send while the reply cannot be.
+    def sendRandomState(signum, frame):
+        if selecting.is_set():
+            selecting.clear()
+            conn.send(("random", random.getstate()))
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, sendRandomState)
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if ponder_thread is not None:
+            ponder_stop.set()
+            ponder_thread.join()
+            ponder_thread, ponder_stop = None, None
+        if request is None:
+            return
+        if request[0] == "ponder":
+            ponder_stop = threading.Event()
+            ponder_thread = threading.Thread(target=_Ponder, args=(agent, request[1], ponder_stop), daemon=True)
+            ponder_thread.start()
+            continue
+        _, actions, game_state, deadline, random_state = request
+        random.setstate(random_state)
+        selecting.set()
+        try:
+            if takes_deadline:
+                reply = (True, agent.SelectAction(actions, game_state, deadline=deadline))
+            else:
+                reply = (True, agent.SelectAction(actions, game_state))
+        except Exception as e:
+            reply = (False, e)
+        if not selecting.is_set():
+            continue #The runner has timed the agent out, and is killing this worker.
+        selecting.clear()
+        sys.stdout.flush()
+        try:
+            conn.send(reply + (random.getstate(),))
+        except Exception as e:
+            #The action or exception could not be pickled.
+            conn.send((False, RuntimeError(repr(e)), random.getstate()))
+
+
+class AgentWorker:
+    #If cpu is given, the worker only runs on that CPU, so that an agent pondering does not slow down the others.
+    def __init__(self, agent, cpu=None):
+        self.agent = agent
+        self.id = agent.id
+        self.cpu = cpu
+        self.can_ponder = hasattr(agent, "Ponder")
+        self.process = None
+        self.conn = None
+        self.restarts = 0 #Number of times the worker was killed and had to be started again.
+
+    #Start the worker process. Where possible it is forked, so the agent is inherited rather than pickled; a restarted
+    #worker starts again from the agent as it was first loaded.
+    def Start(self):
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context()
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_WorkerMain, args=(self.agent, child_conn, self.cpu), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    #Ask the agent to select an action, waiting for the reply until the deadline (a template.Deadline). Raises
+    #WorkerTimedOut (after killing the worker) if the agent overruns, or the agent's exception if SelectAction raised one.
+    #Either way this process's random state is then the worker's, as if the agent had run (and been stopped) here, so
+    #a random action given instead of the agent's is the same as in a game without workers.
+    def SelectAction(self, actions, game_state, deadline):
+        if self.process is None:
+            self.Start()
+        self.conn.send(("select", actions, game_state, deadline, random.getstate()))
+        if not self.conn.poll(max(0, deadline.Remaining())):
+            self._TakeRandomState()
+            self.Kill()
+            raise WorkerTimedOut()
+        try:
+            ok, result, random_state = self.conn.recv()
+        except EOFError:
+            self.Kill()
+            raise RuntimeError("Agent worker exited unexpectedly.")
+        random.setstate(random_state)
+        if not ok:
+            raise result
+        return result
+
+    #Take the random state of a worker that has timed out, where it can be signalled for it. A reply that arrives in
+    #the meantime has the random state last.
+    def _TakeRandomState(self):
+        if not hasattr(signal, "SIGUSR1"):
+            return
+        try:
+            os.kill(self.process.pid, signal.SIGUSR1)
+            if self.conn.poll(RANDOM_STATE_TIMEOUT):
+                random.setstate(self.conn.recv()[-1])
+        except (OSError, EOFError):
+            pass
+
+    #Let the agent ponder on the game state until its next move, if it can.
+    def Ponder(self, game_state):
+        if not self.can_ponder:
+            return
+        if self.process is None:
+            self.Start()
+        self.conn.send(("ponder", game_state))
+
+    def Kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+        self.restarts += 1
+
+    def Close(self):
+        if self.process is None:
+            return
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(JOIN_TIMEOUT)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
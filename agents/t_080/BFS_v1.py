@@ -1,11 +1,12 @@
 import time, random
-from copy import deepcopy
 from collections import deque
 import heapq
 
+from template import Deadline
 from Azul.azul_model import AzulGameRule as GameRule
 
-THINKTIME   = 0.9
+THINKTIME   = 0.9  # Time to think for when the runner gives no deadline
+SAFETY_MARGIN = 0.1  # Time kept back from the deadline to return the action
 NUM_PLAYERS = 2
 
 # Defines this agent.
@@ -26,17 +27,17 @@ class myAgent():
 
     # Take a list of actions and an initial state, and perform breadth-first search within a time limit.
     # Return the first action that leads to goal, if any was found.
-    def SelectAction(self, actions, rootstate):
-        start_time = time.time()
-        queue = deque([ (deepcopy(rootstate),[]) ]) # Initialise queue. First node = root state and an empty path.
+    def SelectAction(self, actions, rootstate, deadline=None):
+        deadline = deadline or Deadline(THINKTIME + SAFETY_MARGIN)
+        queue = deque([ (rootstate.clone(),[]) ]) # Initialise queue. First node = root state and an empty path.
         
         # Conduct BFS starting from rootstate.
-        while len(queue) and time.time()-start_time < THINKTIME:
+        while len(queue) and not deadline.Expired(SAFETY_MARGIN):
             state, path = queue.popleft() # Pop the next node (state, path) in the queue.
             new_actions = self.GetActions(state) # Obtain new actions available to the agent in this state.
             
             for a in new_actions: # Then, for each of these actions...
-                next_state = deepcopy(state)              
+                next_state = state.clone()              
                 next_path  = path + [a]                   
                 goal, _ = self.DoAction(next_state, a) # Carry out this action on the state and check if the goal is reached
                 if goal:
@@ -1,11 +1,12 @@
 import time, random
-from copy import deepcopy
 from collections import deque
 import heapq
 
+from template import Deadline
 from Azul.azul_model import AzulGameRule as GameRule
 
-THINKTIME   = 0.9
+THINKTIME   = 0.9  # Time to think for when the runner gives no deadline
+SAFETY_MARGIN = 0.1  # Time kept back from the deadline to return the action
 NUM_PLAYERS = 2
 
 # Defines this agent.
@@ -26,19 +27,19 @@ class myAgent():
 
     # Take a list of actions and an initial state, and perform breadth-first search within a time limit.
     # Return the first action that leads to goal, if any was found.
-    def SelectAction(self, actions, rootstate):
-        start_time = time.time()
+    def SelectAction(self, actions, rootstate, deadline=None):
+        deadline = deadline or Deadline(THINKTIME + SAFETY_MARGIN)
         selected_actions = []
         goal_in_ture = False
-        queue = deque([ (deepcopy(rootstate),[]) ]) # Initialise queue. First node = root state and an empty path.
+        queue = deque([ (rootstate.clone(),[]) ]) # Initialise queue. First node = root state and an empty path.
         
         # Conduct BFS starting from rootstate.
-        while len(queue) and time.time()-start_time < THINKTIME:
+        while len(queue) and not deadline.Expired(SAFETY_MARGIN):
             state, path = queue.popleft() # Pop the next node (state, path) in the queue.
             new_actions = self.GetActions(state) # Obtain new actions available to the agent in this state.
             
             for a in new_actions: # Then, for each of these actions...
-                next_state = deepcopy(state)              
+                next_state = state.clone()              
                 next_path  = path + [a]                   
                 goal, gain = self.DoAction(next_state, a) # Carry out this action on the state, return goal_reached, score gained
                 if goal:
@@ -62,7 +63,7 @@ class myAgent():
             goal_reached = False
 
         plr_state = state.agents[agent_id]
-        wall = deepcopy(plr_state.grid_state)
+        wall = plr_state.grid_state
         gain =  self.CalculateRoundScore(plr_state, wall)
 
         goal_reached = (gain > 0)
@@ -100,12 +101,13 @@ class myAgent():
             return penalties
 
         def get_pattern_score(player_state):
+            grid = player_state.grid_state
             score = 0
-            for row in player_state.grid_state:
+            for row in grid:
                 if all(row): 
                     score += 2  # Bonus for completing a row
-            for col in range(len(player_state.grid_state[0])):
-                if all(player_state.grid_state[row][col] != 0 for row in range(5)):
+            for col in range(len(grid[0])):
+                if all(grid[row][col] != 0 for row in range(5)):
                     score += 7  # Bonus for completing a column
             return score
 
@@ -1,5 +1,3 @@
-from copy import deepcopy
-
 from template import Agent, GameRule
 import random
 from Azul.azul_model import AzulGameRule as GameRule
@@ -23,9 +21,10 @@ class myAgent(Agent):
         best_action = random.choice(new_actions)
 
         for a in new_actions:
-            # have to deepcopy so won't change original rootstate
-            new_state = self.game_rule.generateSuccessor(deepcopy(rootstate), a, self.id)
-            floor_tiles_filled = new_state.agents[self.id].floor.count(1)
+            # undo the action so won't change original rootstate
+            undo_token = self.game_rule.apply(rootstate, a, self.id)
+            floor_tiles_filled = rootstate.agents[self.id].floor.count(1)
+            self.game_rule.undo(rootstate, undo_token)
 
             if floor_tiles_filled < best_floor_tiles_filled:
                 best_action = a
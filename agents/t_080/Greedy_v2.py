@@ -1,5 +1,4 @@
 from Azul.azul_model import AzulGameRule as GameRule
-from copy import deepcopy
 
 THINKTIME = 0.9
 NUM_PLAYERS = 2
@@ -37,9 +36,10 @@ class myAgent():
         best_action = None
 
         for action in actions:
-            next_state = deepcopy(state)
-            self.game_rule.generateSuccessor(next_state, action, id)
-            reward = self.CalculateRoundScore(next_state, next_state.agents[id].grid_state, id)
+            # Score the action in place, then take it back
+            undo_token = self.game_rule.apply(state, action, id)
+            reward = self.CalculateRoundScore(state, state.agents[id].grid_state, id)
+            self.game_rule.undo(state, undo_token)
             if reward > best_reward:
                 best_reward = reward
                 best_action = action
@@ -78,24 +78,26 @@ class myAgent():
         #     return penalties
 
         def center_score(player_state):
+            grid = player_state.grid_state
             score = 0
             for x in range(0,5):
                 for y in range(0,5):
                     if x == 2 and y == 2:
-                        if player_state.grid_state[x][y] == 1:
+                        if grid[x][y] == 1:
                             score += 2
                     elif x > 0 and x < 4 and y > 0 and y < 4:
-                        if player_state.grid_state[x][y] == 1:
+                        if grid[x][y] == 1:
                             score += 1
             return score
 
         def get_pattern_score(player_state):
+            grid = player_state.grid_state
             score = 0
-            for row in player_state.grid_state:
+            for row in grid:
                 if all(row): 
                     score += 2  # Bonus for completing a row
-            for col in range(len(player_state.grid_state[0])):
-                if all(player_state.grid_state[row][col] != 0 for row in range(5)):
+            for col in range(len(grid[0])):
+                if all(grid[row][col] != 0 for row in range(5)):
                     score += 7  # Bonus for completing a column
             return score
             
@@ -106,8 +108,8 @@ class myAgent():
         # score += floor_penalty(player_state)
         score += center_score(player_state)
         score += get_pattern_score(player_state)
-        score += player_state.ScoreRound()[0] # Round score from game mechanics
-        score += player_state.EndOfGameScore() # End of game score from game mechanics
+        score += player_state.PreviewRoundScore() # Round score from game mechanics
+        score += player_state.PreviewEndGameBonus() # End of game score from game mechanics
 
 
         return score
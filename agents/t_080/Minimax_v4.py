@@ -1,9 +1,12 @@
 import time, random, math
 from Azul.azul_model import AzulGameRule as GameRule
-from copy import deepcopy
+from template import Deadline
+from agents.t_080.transposition import TranspositionTable, bound_type, cuts_off, move_first
 
 NUM_PLAYERS = 2
-THINKTIME = 0.9
+THINKTIME = 0.9      # Time to think for when the runner gives no deadline
+SAFETY_MARGIN = 0.1  # Time kept back from the deadline to return the action
+TT_MEMORY_MB = 128  # Memory ceiling of the transposition table
 
 
 class myAgent():
@@ -11,22 +14,24 @@ class myAgent():
         super().__init__()
         self.id = _id
         self.game_rule = GameRule(NUM_PLAYERS)
+        self.tt = TranspositionTable(TT_MEMORY_MB)
 
-    def SelectAction(self, actions, game_state):
+    def SelectAction(self, actions, game_state, deadline=None):
         """
         Iterative deepening search to gradually increase the minimax search depth.
         """
-        start_time = time.time()  # Record start time
+        deadline = deadline or Deadline(THINKTIME + SAFETY_MARGIN)
+        self.tt.new_search()  # Keep the table between moves
         best_action = random.choice(actions)  # Default random action
         depth = 1  # Start with depth 1 and gradually increase
 
         while True:
-            if time.time() - start_time > THINKTIME:
+            if deadline.Expired(SAFETY_MARGIN):
                 break  # Break if the time limit is exceeded
 
             try:
                 # Run minimax at the given depth
-                best_action, _ = self.minimax(game_state, depth, -float('inf'), float('inf'), True, start_time)
+                best_action, _ = self.minimax(game_state, depth, -float('inf'), float('inf'), True, deadline)
                 depth += 1  # Increase search depth
             except TimeoutError:
                 break  # Stop search if timeout occurs
@@ -65,18 +70,29 @@ class myAgent():
         sorted_actions = [val[1] for _, val in sorted(action_dict.items(), reverse=True, key=lambda x: x[1][0])]
         return sorted_actions if sorted_actions else actions
 
-    def minimax(self, state, depth, alpha, beta, maximizingPlayer, start_time):
+    def minimax(self, state, depth, alpha, beta, maximizingPlayer, deadline):
         """
         Minimax algorithm with alpha-beta pruning and a time limit.
         """
-        if time.time() - start_time > THINKTIME:
+        if deadline.Expired(SAFETY_MARGIN):
             raise TimeoutError  # Raise timeout error if time exceeds
 
         # Termination condition: depth is 0 or no tiles remain
         if depth == 0 or not state.TilesRemaining():
             return None, self.evaluate_score(state)
 
-        actions = self._get_best_actions(state)
+        # Look the position up in the transposition table
+        key = state.zobrist
+        alpha_orig, beta_orig = alpha, beta
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_depth, tt_value, tt_bound, tt_move = entry
+            if tt_depth >= depth and cuts_off(tt_value, tt_bound, alpha, beta):
+                return tt_move, tt_value
+
+        # Search the stored best move first
+        actions = move_first(self._get_best_actions(state), tt_move)
 
         if maximizingPlayer:
             max_eval = -float('inf')
@@ -85,11 +101,11 @@ class myAgent():
             for action in actions:
                 # Validate action using the game rules
                 try:
-                    new_state = self.game_rule.generateSuccessor(deepcopy(state), action, self.id)
+                    new_state = self.game_rule.generateSuccessor(state.clone(), action, self.id)
                 except AssertionError:
                     continue  # Skip invalid actions
 
-                _, eval = self.minimax(new_state, depth - 1, alpha, beta, False, start_time)
+                _, eval = self.minimax(new_state, depth - 1, alpha, beta, False, deadline)
 
                 if eval > max_eval:
                     max_eval = eval
@@ -99,6 +115,7 @@ class myAgent():
                 if beta <= alpha:
                     break  # Beta pruning
 
+            self.tt.store(key, depth, max_eval, bound_type(max_eval, alpha_orig, beta_orig), best_action)
             return best_action, max_eval
 
         else:
@@ -107,11 +124,11 @@ class myAgent():
 
             for action in actions:
                 try:
-                    new_state = self.game_rule.generateSuccessor(deepcopy(state), action, 1 - self.id)
+                    new_state = self.game_rule.generateSuccessor(state.clone(), action, 1 - self.id)
                 except AssertionError:
                     continue  # Skip invalid actions
 
-                _, eval = self.minimax(new_state, depth - 1, alpha, beta, True, start_time)
+                _, eval = self.minimax(new_state, depth - 1, alpha, beta, True, deadline)
 
                 if eval < min_eval:
                     min_eval = eval
@@ -121,6 +138,7 @@ class myAgent():
                 if beta <= alpha:
                     break  # Alpha pruning
 
+            self.tt.store(key, depth, min_eval, bound_type(min_eval, alpha_orig, beta_orig), best_action)
             return best_action, min_eval
 
     def evaluate_score(self, state):
@@ -166,12 +184,13 @@ class myAgent():
     
     # Calculate the pattern score of a player
     def get_pattern_score(self, state, player_id):
+        grid = state.agents[player_id].grid_state
         score = 0
-        for row in state.agents[player_id].grid_state:
+        for row in grid:
             if all(row): 
                 score += 2  # Bonus for completing a row
-        for col in range(len(state.agents[player_id].grid_state[0])):
-            if all(state.agents[player_id].grid_state[row][col] != 0 for row in range(5)):
+        for col in range(len(grid[0])):
+            if all(grid[row][col] != 0 for row in range(5)):
                 score += 7  # Bonus for completing a column
         return score
 
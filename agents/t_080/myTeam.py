@@ -1,62 +1,104 @@
-from copy import deepcopy
-
 from template import Agent, GameRule
 import random
 from Azul.azul_model import AzulGameRule as GameRule
+from template import Deadline
+from agents.t_080.transposition import TranspositionTable, bound_type, cuts_off, move_first
 import time
 
 NUM_PLAYERS = 2
-THINKTIME = 0.9
+THINKTIME = 0.9      # Time to think for when the runner gives no deadline
+SAFETY_MARGIN = 0.1  # Time kept back from the deadline to return the action
+TT_MEMORY_MB = 128  # Memory ceiling of the transposition table
 
 class myAgent(Agent):
     def __init__(self, _id):
         super().__init__(_id)
         self.game_rule = GameRule(NUM_PLAYERS)
+        self.tt = TranspositionTable(TT_MEMORY_MB)
+        self.ponder_stop = None  # Set when pondering must stop; None when not pondering
        
 
-    def SelectAction(self, actions, game_state):
+    def SelectAction(self, actions, game_state, deadline=None):
         """
         Iterative deepening search to gradually increase the minimax search depth.
         """
-        start_time = time.time()  # Record start time
+        deadline = deadline or Deadline(THINKTIME + SAFETY_MARGIN)
+        self.tt.new_search()  # Keep the table between moves
         best_action = random.choice(actions)  # # Choose a default random action
         depth = 1   # Start with depth 1 and gradually increase
 
         while True:
-            if time.time() - start_time > THINKTIME:
+            if deadline.Expired(SAFETY_MARGIN):
                 break  
 
             try:
                 # Run minimax at the given depth
-                best_action, _ = self.minimax(game_state, depth, -float('inf'), float('inf'), True, start_time)
+                best_action, _ = self.minimax(game_state, depth, -float('inf'), float('inf'), True, deadline)
                 depth += 1  # Increase search depth
             except TimeoutError:
                 break # Stop search if timeout occurs
 
         return best_action
 
-    def minimax(self, state, depth, alpha, beta, maximizingPlayer, start_time):
+    def Ponder(self, game_state, stop):
+        """
+        Search the opponent's move while they think, until the runner sets stop (a
+        threading.Event). The results are kept in the transposition table for the next
+        SelectAction.
+        """
+        self.ponder_stop = stop
+        self.tt.new_search()
+        depth = 1
+        try:
+            while not stop.is_set() and game_state.TilesRemaining():
+                self.minimax(game_state, depth, -float('inf'), float('inf'), False, None)
+                depth += 1
+        except TimeoutError:
+            pass
+        finally:
+            self.ponder_stop = None
+
+    def out_of_time(self, deadline):
+        """
+        Whether the search must stop. A deadline of None means the agent is pondering.
+        """
+        if deadline is None:
+            return self.ponder_stop.is_set()
+        return deadline.Expired(SAFETY_MARGIN)
+
+    def minimax(self, state, depth, alpha, beta, maximizingPlayer, deadline):
         """
         Minimax with time limit.
         """
-        # Check if the time limit has been reached
-        if time.time() - start_time > THINKTIME:
+        # Check if the time limit has been reached (or pondering was stopped)
+        if self.out_of_time(deadline):
             raise TimeoutError 
 
         # Termination condition: depth is 0 or game is finished
         if depth == 0 or not state.TilesRemaining():
             return None, self.evaluate_score(state)
 
-        actions = self.game_rule.getLegalActions(state, self.id if maximizingPlayer else 1 - self.id)
+        # Look the position up in the transposition table
+        key = state.zobrist
+        alpha_orig, beta_orig = alpha, beta
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_depth, tt_value, tt_bound, tt_move = entry
+            if tt_depth >= depth and cuts_off(tt_value, tt_bound, alpha, beta):
+                return tt_move, tt_value
+
+        # Search the stored best move first
+        actions = move_first(self.game_rule.getLegalActions(state, self.id if maximizingPlayer else 1 - self.id), tt_move)
 
         if maximizingPlayer:
             max_eval = -float('inf')
             best_action = random.choice(actions) # Initialize the best action
 
             for action in actions:
-                new_state = self.game_rule.generateSuccessor(deepcopy(state), action, self.id)
+                new_state = self.game_rule.generateSuccessor(state.clone(), action, self.id)
 
-                _, eval = self.minimax(new_state, depth - 1, alpha, beta, False, start_time)
+                _, eval = self.minimax(new_state, depth - 1, alpha, beta, False, deadline)
 
                 if eval > max_eval:
                     max_eval = eval
@@ -66,6 +108,7 @@ class myAgent(Agent):
                 if beta <= alpha:
                     break  # Beta pruning
 
+            self.tt.store(key, depth, max_eval, bound_type(max_eval, alpha_orig, beta_orig), best_action)
             return best_action, max_eval
 
         else:
@@ -73,9 +116,9 @@ class myAgent(Agent):
             best_action = random.choice(actions)  # Initialize the best action
 
             for action in actions:
-                new_state = self.game_rule.generateSuccessor(deepcopy(state), action, 1 - self.id)
+                new_state = self.game_rule.generateSuccessor(state.clone(), action, 1 - self.id)
 
-                _, eval = self.minimax(new_state, depth - 1, alpha, beta, True, start_time)
+                _, eval = self.minimax(new_state, depth - 1, alpha, beta, True, deadline)
 
                 if eval < min_eval:
                     min_eval = eval
@@ -85,6 +128,7 @@ class myAgent(Agent):
                 if beta <= alpha:
                     break  # Alpha pruning
 
+            self.tt.store(key, depth, min_eval, bound_type(min_eval, alpha_orig, beta_orig), best_action)
             return best_action, min_eval
 
     def evaluate_score(self, state):
@@ -118,12 +162,13 @@ class myAgent(Agent):
     
     # Calculate the pattern score of a player
     def get_pattern_score(self, state, player_id):
+        grid = state.agents[player_id].grid_state
         score = 0
-        for row in state.agents[player_id].grid_state:
+        for row in grid:
             if all(row): 
                 score += 2  # Bonus for completing a row
-        for col in range(len(state.agents[player_id].grid_state[0])):
-            if all(state.agents[player_id].grid_state[row][col] != 0 for row in range(5)):
+        for col in range(len(grid[0])):
+            if all(grid[row][col] != 0 for row in range(5)):
                 score += 7  # Bonus for completing a column
         return score
 
@@ -143,12 +188,13 @@ class myAgent(Agent):
     def centre_score(self, state, id):
         score = 0
         agent_state = state.agents[id]
+        grid = agent_state.grid_state
         for x in range(0,5):
             for y in range(0,5):
                 if x == 2 and y == 2:
-                    if agent_state.grid_state[x][y] == 1:
+                    if grid[x][y] == 1:
                         score += 2
                 elif x > 0 and x < 4 and y > 0 and y < 4:
-                    if agent_state.grid_state[x][y] == 1:
+                    if grid[x][y] == 1:
                         score += 1
         return score
\ No newline at end of file
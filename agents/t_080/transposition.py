@@ -0,0 +1,99 @@
+import math
+
+# Bound types stored with each value
+EXACT = 0  # The value is exact
+LOWER = 1  # The search failed high, the true value is at least this value
+UPPER = 2  # The search failed low, the true value is at most this value
+
+DEFAULT_MEMORY_MB = 128  # Memory ceiling of one table; two agents must fit in the Docker RAM_limit
+ENTRY_BYTES = 160        # Conservative estimate of the memory used by one filled slot
+
+
+class TranspositionTable:
+    """
+    Size-bounded transposition table keyed by the AzulState zobrist hash.
+
+    Each bucket has two slots. The first keeps the entry searched to the
+    greatest depth (or the newest one, once the entry is left over from
+    an earlier move); the second is always replaced. Entries are kept in
+    parallel lists preallocated up to the memory ceiling, so the table
+    never grows during a search.
+    """
+    def __init__(self, memory_mb=DEFAULT_MEMORY_MB):
+        num_buckets = max(1, int(memory_mb * 1024 * 1024 // (2 * ENTRY_BYTES)))
+        # Round down to a power of two so the bucket index is a mask
+        num_buckets = 1 << int(math.log2(num_buckets))
+        self.mask = num_buckets - 1
+        self.size = 2 * num_buckets
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        self.keys = [None] * self.size
+        self.depths = [0] * self.size
+        self.values = [0] * self.size
+        self.bounds = [EXACT] * self.size
+        self.moves = [None] * self.size
+        self.generations = [0] * self.size
+
+    def new_search(self):
+        """
+        Called at the start of each move. Entries from earlier moves stay
+        usable, but no longer protect their depth-preferred slot.
+        """
+        self.generation += 1
+
+    def probe(self, key):
+        """
+        Return (depth, value, bound, move) stored for the key, or None.
+        """
+        i = (key & self.mask) << 1
+        if self.keys[i] != key:
+            i += 1
+            if self.keys[i] != key:
+                return None
+        return self.depths[i], self.values[i], self.bounds[i], self.moves[i]
+
+    def store(self, key, depth, value, bound, move):
+        i = (key & self.mask) << 1
+        # Use the depth-preferred slot if it is free, holds the same
+        # position, is stale, or was searched no deeper than this entry.
+        if self.keys[i] is not None and self.keys[i] != key \
+                and self.generations[i] == self.generation and self.depths[i] > depth:
+            i += 1
+        self.keys[i] = key
+        self.depths[i] = depth
+        self.values[i] = value
+        self.bounds[i] = bound
+        self.moves[i] = move
+        self.generations[i] = self.generation
+
+
+def bound_type(value, alpha, beta):
+    """
+    Bound type of a value returned by an alpha-beta search on the window (alpha, beta).
+    """
+    if value <= alpha:
+        return UPPER
+    if value >= beta:
+        return LOWER
+    return EXACT
+
+
+def cuts_off(value, bound, alpha, beta):
+    """
+    Whether a stored value decides the search on the window (alpha, beta).
+    """
+    return bound == EXACT or (bound == LOWER and value >= beta) or (bound == UPPER and value <= alpha)
+
+
+def move_first(actions, move):
+    """
+    Return the actions with the one matching the stored best move first.
+    """
+    if move is None:
+        return actions
+    for i, action in enumerate(actions):
+        if action == move:
+            return [action] + actions[:i] + actions[i+1:]
+    return actions
@@ -6,10 +6,13 @@
 
 # IMPORTS ------------------------------------------------------------------------------------------------------------#
 
-import random, copy, time
+import os, random, copy, time
 from   template     import GameState
 from   func_timeout import func_timeout, FunctionTimedOut
 from   template     import Agent as DummyAgent
+from   template     import Deadline, TakesDeadline
+from   agent_worker import AgentWorker, WorkerTimedOut
+from   replay_file  import ReplayWriter, SupportsCompactReplay, SaveReplay, LoadReplay, HEADER_KEYS
     
 # CONSTANTS ----------------------------------------------------------------------------------------------------------#
 
@@ -27,7 +30,11 @@ class Game:
                  warning_limit=3, 
                  displayer = None, 
                  agents_namelist = ["Alice","Bob"],
-                 interactive=False):
+                 interactive=False,
+                 agent_workers=True,
+                 ponder=False,
+                 replay_path=None,
+                 chance_seed=None):
         
         self.seed = seed
         random.seed(self.seed)
@@ -44,6 +51,13 @@ class Game:
             i += 1
 
         self.game_rule = GameRule(num_of_agent)
+        #With a chance seed, the game state draws its chance events (eg. Azul's tiles) from a generator of its own
+        #rather than the random module, which is reseeded before every action. Games with the same seed and chance
+        #seed then see the same draws whatever moves are made, as duplicate games need.
+        self.chance_seed = chance_seed
+        if chance_seed is not None:
+            assert hasattr(self.game_rule.current_game_state, "rng"), "This game has no chance generator to seed."
+            self.game_rule.current_game_state.rng = random.Random(chance_seed)
         self.gamemaster = DummyAgent(num_of_agent) #GM/template agent used by some games (e.g. Azul, for signalling rounds).
         self.valid_action = self.game_rule.validAction
         self.agents = agent_list
@@ -52,17 +66,39 @@ class Game:
         self.warning_limit = warning_limit
         self.warnings = [0]*len(agent_list)
         self.warning_positions = []
+        self.move_times = [] #(agent index, action counter, time taken, time limit, warmup) of each player agent's move.
         self.displayer = displayer
         if self.displayer is not None:
             self.displayer.InitDisplayer(self)
         self.interactive = interactive
 
+        #If given a replay path, the game is recorded there (see replay_file.py). Games that can encode their actions
+        #are written as they are played; others are pickled at the end.
+        self.replay_path = replay_path
+        self.replay_writer = None
+
+        #Unless freedom is given to agents, each player agent runs in its own worker process (see agent_worker.py).
+        #Without workers, agents run in this process and are time-limited by func_timeout threads.
+        #If asked to, agents that can ponder do so while others choose their moves. This is only fair if each worker
+        #has a CPU to itself, so pondering is left off unless workers can be pinned to one CPU each.
+        self.workers = None
+        self.ponder = False
+        if agent_workers and not FREEDOM:
+            cpus = [None]*len(agent_list)
+            if ponder and hasattr(os, "sched_getaffinity") and len(os.sched_getaffinity(0)) >= len(agent_list):
+                cpus = sorted(os.sched_getaffinity(0))[:len(agent_list)]
+                self.ponder = True
+            self.workers = [AgentWorker(agent, cpu) for agent,cpu in zip(agent_list, cpus)]
+
     def _EndGame(self,num_of_agent,history, isTimeOut = True, id = None):
         history.update({"seed":self.seed,
                         "num_of_agent":num_of_agent,
                         "agents_namelist":self.agents_namelist,
                         "warning_positions":self.warning_positions,
-                        "warning_limit":self.warning_limit})
+                        "warning_limit":self.warning_limit,
+                        "legacy_bag":getattr(self.game_rule,"legacy_bag",False),
+                        "chance_seed":self.chance_seed})
+        header = {key:history[key] for key in HEADER_KEYS}
         history["scores"]= {i:0 for i in range(num_of_agent)}
         if isTimeOut:
             history["scores"][id] = -1
@@ -70,21 +106,61 @@ class Game:
             for i in range(num_of_agent):
                 history["scores"].update({i:self.game_rule.calScore(self.game_rule.current_game_state,i)})
 
+        # Round by round scores, for games that keep agent traces.
+        traces = getattr(self.game_rule,"agent_traces",None)
+        if traces is not None:
+            history["round_scores"] = {trace.id:trace.round_scores[:] for trace in traces}
+
+        if self.replay_writer is not None:
+            self.replay_writer.Finish({key:value for key,value in history.items()
+                                       if key not in header and key != "actions"})
+        elif self.replay_path is not None:
+            SaveReplay(self.replay_path, history, self.game_rule)
+
         if self.displayer is not None:
             self.displayer.EndGame(self.game_rule.current_game_state,history["scores"])
         return history
 
     def Run(self):
+        try:
+            return self._Run()
+        finally:
+            if self.replay_writer is not None:
+                self.replay_writer.Close()
+            if self.workers is not None:
+                for worker in self.workers:
+                    worker.Close()
+
+    def _Run(self):
         history = {"actions":[]}
         action_counter = 0
+        if self.replay_path is not None and SupportsCompactReplay(self.game_rule):
+            self.replay_writer = ReplayWriter(self.replay_path, {"seed":self.seed,
+                                                                 "num_of_agent":self.game_rule.num_of_agent,
+                                                                 "agents_namelist":self.agents_namelist,
+                                                                 "warning_limit":self.warning_limit,
+                                                                 "legacy_bag":getattr(self.game_rule,"legacy_bag",False),
+                                                                 "chance_seed":self.chance_seed})
         while not self.game_rule.gameEnds():
             agent_index = self.game_rule.getCurrentAgentIndex()
             agent = self.agents[agent_index] if agent_index < len(self.agents) else self.gamemaster
             game_state = self.game_rule.current_game_state
             game_state.agent_to_move = agent_index
             actions = self.game_rule.getLegalActions(game_state, agent_index)
-            actions_copy = copy.deepcopy(actions)
-            gs_copy = copy.deepcopy(game_state)
+
+            #In a perfect information game, the gamemaster is handed the game state itself. So are agent workers, which
+            #are sent a copy of it, and agents run in this process if the game can snapshot its state, which are
+            #checked after their turn for changing it. Otherwise agents are handed deep copies.
+            snapshot = None
+            if agent_index != self.game_rule.num_of_agent and self.workers is None and not self.game_rule.private_information:
+                snapshot = self.game_rule.snapshotState(game_state)
+            if not self.game_rule.private_information and \
+                    (agent_index == self.game_rule.num_of_agent or self.workers is not None or snapshot is not None):
+                actions_copy = list(actions)
+                gs_copy = game_state
+            else:
+                actions_copy = copy.deepcopy(actions)
+                gs_copy = copy.deepcopy(game_state)
             
             # Delete all specified attributes in the agent state copies, if this isn't a perfect information game.
             if self.game_rule.private_information:
@@ -118,19 +194,42 @@ class Game:
                     #- If it returns an illegal move, display IllegalWarning.
                     #  - Illegal move checked by self.validaction(), if implemented by the game being run.
                     #  - Else, look for move in actions list by equality according to Python.
-                    #If this is the agent's first turn, allow warmup time.
+                    if self.ponder and agent_index != self.game_rule.num_of_agent:
+                        for worker in self.workers:
+                            if worker.id != agent_index:
+                                worker.Ponder(gs_copy)
+                    #If this is the agent's first turn, allow warmup time. Agents that take a deadline are handed one.
+                    warmup = action_counter-1 < len(self.agents)
+                    deadline = Deadline(WARMUP if warmup else self.time_limit, warmup)
                     try: 
-                        selected = func_timeout(WARMUP if action_counter-1 < len(self.agents) else self.time_limit, 
-                                                agent.SelectAction,args=(actions_copy, gs_copy))
-                    except FunctionTimedOut:
+                        if self.workers is None:
+                            selected = func_timeout(deadline.time_limit, agent.SelectAction,args=(actions_copy, gs_copy),
+                                                    kwargs={"deadline":deadline} if TakesDeadline(agent) else None)
+                        elif agent_index != self.game_rule.num_of_agent:
+                            selected = self.workers[agent_index].SelectAction(actions_copy, gs_copy, deadline)
+                        else:
+                            selected = agent.SelectAction(actions_copy, gs_copy)
+                    except (FunctionTimedOut, WorkerTimedOut):
                         selected = "timeout"
                     except Exception as e:
                         exception = e
+                        selected = "illegal"
+                    if agent_index != self.game_rule.num_of_agent:
+                        self.move_times.append((agent_index, action_counter, deadline.Elapsed(), deadline.time_limit,
+                                                deadline.warmup))
+
+                    #If the agent was handed the game state itself, carry on from the snapshot if it changed the state,
+                    #penalising it as for an illegal move, or if it timed out (as it may still be running).
+                    if snapshot is not None and (selected == "timeout" or self.game_rule.stateChanged(game_state, snapshot)):
+                        self.game_rule.current_game_state = snapshot
+                        if selected != "timeout":
+                            selected = "illegal"
+                            exception = exception or RuntimeError("Agent changed the game state it was handed.")
                         
                     if agent_index != self.game_rule.num_of_agent:
                         if selected != "timeout":
                             if self.valid_action:
-                                if not self.valid_action(selected, actions):
+                                if not self.valid_action(selected, self.game_rule.indexActions(actions)):
                                     selected = "illegal"
                             elif not selected in actions:
                                 selected = "illegal"
@@ -149,6 +248,8 @@ class Game:
             random.seed(self.seed_list[self.seed_idx])
             self.seed_idx += 1
             history["actions"].append({action_counter:{"agent_id":self.game_rule.current_agent_index,"action":selected}})
+            if self.replay_writer is not None:
+                self.replay_writer.WriteAction(self.game_rule.current_agent_index, self.game_rule.encodeAction(selected))
             action_counter += 1
             
             self.game_rule.update(selected)
@@ -167,7 +268,10 @@ class Game:
             
 
 class GameReplayer:
+    #The replay is a history dict, or the path of a replay file of either format (see replay_file.py).
     def __init__(self,GameRule,replay, displayer = None):
+        if isinstance(replay, str):
+            replay = LoadReplay(replay, GameRule)
         self.replay = replay
                     
         self.seed = self.replay["seed"]
@@ -180,31 +284,94 @@ class GameReplayer:
         self.warning_limit = replay["warning_limit"]
         self.warnings = [0]*self.num_of_agent
         self.warning_positions = replay["warning_positions"]
-        self.game_rule = GameRule(self.num_of_agent)
+        # Replays recorded before the tile bag was kept as counts have no
+        # "legacy_bag" entry, and only replay exactly with the old bag.
+        self.game_rule = GameRule(self.num_of_agent, legacy_bag=replay.get("legacy_bag",True))
+        if replay.get("chance_seed") is not None:
+            self.game_rule.current_game_state.rng = random.Random(replay["chance_seed"])
         self.scores=replay["scores"]
+        self.position = 0     #Number of actions applied.
+        self.checkpoints = {} #Checkpoints of the game, by position (see Seek).
 
         self.displayer = displayer
         if self.displayer is not None:
             self.displayer.InitDisplayer(self)           
   
     def Run(self):
-        for item in self.replay["actions"]:
-            (index, info), = item.items()
-            selected = info["action"]
-            agent_index = info["agent_id"]
-            self.game_rule.current_agent_index = agent_index          
-
-            random.seed(self.seed_list[self.seed_idx])
-            self.seed_idx += 1
-            self.game_rule.update(selected)
-            random.seed(self.seed_list[self.seed_idx])
-            self.seed_idx += 1
+        while self.position < len(self.replay["actions"]):
+            agent_index, selected = self.Step()
             if self.displayer is not None:
-                if (agent_index,index) in self.warning_positions:
-                    self.warnings[agent_index] += 1
+                if (agent_index,self.position-1) in self.warning_positions:
                     self.displayer.TimeOutWarning(self,agent_index)
                 self.displayer.ExcuteAction(agent_index,selected, self.game_rule.current_game_state)
             
         if self.displayer is not None:
             self.displayer.EndGame(self.game_rule.current_game_state,self.scores)
+
+    #Apply the next action of the replay, and return (agent index, action). Before each STARTROUND, and the first
+    #action, the game is checkpointed so that Seek can later restart from there.
+    def Step(self):
+        (index, info), = self.replay["actions"][self.position].items()
+        selected = info["action"]
+        agent_index = info["agent_id"]
+        if self.position not in self.checkpoints and (self.position == 0 or selected == "STARTROUND"):
+            self.checkpoints[self.position] = self._Checkpoint()
+        self.game_rule.current_agent_index = agent_index          
+
+        random.seed(self.seed_list[self.seed_idx])
+        self.seed_idx += 1
+        self.game_rule.update(selected)
+        random.seed(self.seed_list[self.seed_idx])
+        self.seed_idx += 1
+        self.position += 1
+        if (agent_index,index) in self.warning_positions:
+            self.warnings[agent_index] += 1
+        return agent_index, selected
+
+    #Move to the game as it was after the given number of actions, restarting from the last checkpoint before it if
+    #that is closer than the current position. Checkpoints are taken the first time a round is stepped through, so
+    #once a game has been seen, seeking anywhere in it costs at most a round's actions.
+    def Seek(self, position):
+        assert 0 <= position <= len(self.replay["actions"]), "Position {} is outside the replay.".format(position)
+        checkpoint = max((p for p in self.checkpoints if p <= position), default=None)
+        if position < self.position or (checkpoint is not None and checkpoint > self.position):
+            self._Restore(checkpoint)
+        while self.position < position:
+            self.Step()
+        return self.game_rule.current_game_state
+
+    #Move back one action. At the start of the replay there is nothing to undo, and the game is left as it is.
+    def StepBack(self):
+        if self.position == 0:
+            return self.game_rule.current_game_state
+        return self.Seek(self.position-1)
+
+    #A copy of everything the game rule keeps between actions. Game states are copied by the rule's snapshotState
+    #where it has one. A state's chance generator (see Game's chance_seed) is shared by its copies, so its position is
+    #kept separately.
+    def _Checkpoint(self):
+        game_state = self.game_rule.current_game_state
+        snapshot = self.game_rule.snapshotState(game_state)
+        if snapshot is None:
+            snapshot = copy.deepcopy(game_state)
+        rule = copy.deepcopy({k:v for k,v in vars(self.game_rule).items() if k != "current_game_state"})
+        rng = getattr(game_state, "rng", None)
+        return snapshot, rule, rng.getstate() if rng is not None else None
+
+    def _Restore(self, position):
+        snapshot, rule, rng_state = self.checkpoints[position]
+        game_state = self.game_rule.snapshotState(snapshot)
+        if game_state is None:
+            game_state = copy.deepcopy(snapshot)
+        if rng_state is not None:
+            game_state.rng = random.Random()
+            game_state.rng.setstate(rng_state)
+        vars(self.game_rule).update(copy.deepcopy(rule))
+        self.game_rule.current_game_state = game_state
+        self.position = position
+        self.seed_idx = 2*position
+        self.warnings = [0]*self.num_of_agent
+        for agent_index,index in self.warning_positions:
+            if index < position:
+                self.warnings[agent_index] += 1
    
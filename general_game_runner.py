@@ -17,13 +17,15 @@ import importlib
 import traceback
 import datetime
 import time
-import pickle
 import random
 import git
 import pytz
 import json
+import math
+from concurrent.futures import ProcessPoolExecutor
 from template import Agent as DummyAgent
 from game import Game, GameReplayer
+from replay_file import LoadReplay
 from optparse import OptionParser
 
 
@@ -96,6 +98,118 @@ class HidePrint:
         sys.stderr = sys.stdout
 
 
+def playGame(options, msg, matches, agent_names, GameRule, displayer, random_seed):
+    """
+    Load the agents and play one game with the given seed. Duplicate games also draw their tiles from a generator
+    seeded with it (see game.Game's chance_seed), so both games of a pair are dealt the same tiles. Returns the game's entry for matches['games'], its replay
+    (None if the game was invalid), whether it was valid, and whether each team's agent was loaded. With --jobs, this
+    runs in a worker process.
+    """
+    num_of_agents = options.num_of_agents
+    file_path = options.output
+    game = {}
+    replay = None
+    loaded_agents, valid_game = loadAgent(matches, superQuiet=options.superQuiet)
+
+    game.update({'valid_game':valid_game})
+    game.update({'random_seed':random_seed})
+    f_name = agent_names[0]
+    for name in agent_names[-1:]:
+        f_name += '-vs-'+name
+    f_name += "-"+datetime.datetime.now().strftime("%d-%b-%Y-%H-%M-%S-%f")
+    f_name += "-"+str(random_seed) #Add seed to replay filename for reproducibility.
+    game.update({'file_name':f_name})
+    if options.saveLog: game.update({'log_path':f"{file_path}/log-{f_name}.log"})
+    # Recorded games are written to their replay file as they are played.
+    replay_path = None
+    if options.saveGameRecord and valid_game:
+        os.makedirs(file_path, exist_ok=True)
+        replay_path = f"{file_path}/replay-{f_name}.replay"
+        game.update({'replay_path':replay_path})
+    gr = Game(GameRule,
+                loaded_agents,
+                num_of_agent = num_of_agents,
+                seed=random_seed,
+                time_limit=options.warningTimeLimit,
+                warning_limit=options.numOfWarnings,
+                displayer=displayer,
+                agents_namelist=agent_names,
+                interactive=options.interactive,
+                agent_workers=not options.inProcess,
+                ponder=options.ponder,
+                replay_path=replay_path,
+                chance_seed=random_seed if options.duplicate else None)
+    if not options.print:
+        with HidePrint(options.saveLog,file_path,f_name):
+            print("Following are the print info for loading:\n{}\n".format(msg))
+            print("\n-------------------------------------\n")
+            print("Following are the print info from the game:\n")
+            if valid_game:          
+                replay = gr.Run()
+            else:
+                print("Invalid game. No game played.\n")
+    else:
+        print("Following are the print info for loading:\n{}\n".format(msg))
+        print("\n-------------------------------------\n")
+        print("Following are the print info from the game:\n")
+        if valid_game:      
+            replay = gr.Run()
+        else:
+            print("Invalid game. No game played.\n")
+    return game, replay, valid_game, [matches['teams'][i]['load_agent'] for i in range(num_of_agents)]
+
+
+def eloToScore(elo):
+    """
+    Expected score per game (a win counting 1 and a draw 1/2) of an agent that is the given number of Elo points
+    stronger than its opponent.
+    """
+    return 1/(1+10**(-elo/400))
+
+
+def sprtLLR(wins, draws, losses, elo0, elo1):
+    """
+    Log-likelihood ratio of the hypothesis that the agent is elo1 Elo points stronger than its opponent against the
+    hypothesis that it is elo0 points stronger, given its wins, draws and losses (see _sprtLLR).
+    """
+    return _sprtLLR([losses, draws, wins], elo0, elo1)
+
+
+def sprtPairLLR(pair_counts, elo0, elo1):
+    """
+    The same log-likelihood ratio for duplicate games, given the agent's results by pair: pair_counts[k] is the number
+    of pairs in which it scored k/2 points over the two games (k = 0 to 4). Each pair is one trial, so the correlation
+    between the two games of a pair is taken into account.
+    """
+    return _sprtLLR(pair_counts, elo0, elo1)
+
+
+def _sprtLLR(counts, elo0, elo1):
+    """
+    Log-likelihood ratio given counts[k], the number of trials in which the agent scored k/(len(counts)-1) per game.
+    The score per trial is taken to be normally distributed, with the variance observed so far; half a trial of each
+    extreme result is added to the counts, so that the variance is not 0 when every trial has ended the same way.
+    """
+    num_trials = sum(counts)
+    if num_trials == 0:
+        return 0.0
+    counts = list(counts)
+    counts[0] += 0.5
+    counts[-1] += 0.5
+    values = [k/(len(counts)-1) for k in range(len(counts))]
+    mean = sum(count*value for count,value in zip(counts, values))/(num_trials+1)
+    variance = sum(count*value**2 for count,value in zip(counts, values))/(num_trials+1) - mean**2
+    score0, score1 = eloToScore(elo0), eloToScore(elo1)
+    return num_trials*(score1-score0)*(2*mean-score0-score1)/(2*variance)
+
+
+def sprtBounds(alpha, beta):
+    """
+    The (lower, upper) bounds on the log-likelihood ratio at which the SPRT accepts elo0 and elo1 respectively.
+    """
+    return math.log(beta/(1-alpha)), math.log((1-beta)/alpha)
+
+
 def run(options,msg):
     num_of_agents = options.num_of_agents
 
@@ -148,6 +262,28 @@ def run(options,msg):
         displayer = TextDisplayer()
     elif options.quiet or options.superQuiet:
         displayer = None
+    if options.jobs > 1:
+        assert not options.ponder, "Pondering cannot be used with --jobs, as games would share CPUs."
+        displayer = None # Games in worker processes are not displayed.
+
+    # With --sprt, -m is the most games to play, and games stop as soon as the test decides whether agent 0 is elo0
+    # or elo1 Elo points stronger than agent 1.
+    if options.sprt is not None:
+        assert num_of_agents == 2, "The SPRT compares two agents."
+        elo0, elo1 = (float(elo) for elo in options.sprt.split(","))
+        assert elo0 < elo1, "The SPRT needs elo0 < elo1."
+        llr_lower, llr_upper = sprtBounds(options.alpha, options.beta)
+        sprt_counts = [0, 0, 0] # Wins, draws and losses of agent 0.
+        sprt_pair_counts = [0]*5 # With --duplicate, pairs in which agent 0 scored 0, 1/2, ... 2 points.
+        sprt_pair_scores = {}    # Agent 0's half points in each game of the pairs not yet complete.
+        sprt_result = "inconclusive"
+
+    # With --duplicate, games are played in pairs on the same seed (seed_list[pair]), the second with the seats
+    # swapped, so that the luck of the draw cancels out of each pair's score difference.
+    if options.duplicate:
+        assert num_of_agents == 2, "Duplicate games need two agents."
+        assert options.multipleGames % 2 == 0, "Duplicate games are played in pairs, so -m must be even."
+        pair_diffs = {} # Score differences (agent 0 - agent 1) of each pair's valid games.
 
     # if random seed is not provide, using timestamp
     if options.setRandomSeed == 90054:
@@ -159,61 +295,43 @@ def run(options,msg):
     random.seed(random_seed)
     seed_list = [random.randint(0,1e10) for _ in range(1000)]
     seed_list[0] = random_seed
-    seed_idx = 0
 
-    num_of_warning = options.numOfWarnings
     file_path = options.output
 
     if options.replay != None:
         if not options.superQuiet:
             print('Replaying recorded game %s.' % options.replay)
         replay_dir = options.replay
-        replay = pickle.load(open(replay_dir,'rb'),encoding="bytes")
+        replay = LoadReplay(replay_dir, GameRule)
         GameReplayer(GameRule,replay,displayer).Run()
     else: 
         games_results = [tuple([0]*num_of_agents for i in range(5))]
         # results = {"succ":valid_game}
+        # Games are played in order, or spread over a pool of worker processes with --jobs. Either way, results are
+        # merged in game order as they come back, so they are the same as for sequential games with the same seeds.
+        executor = ProcessPoolExecutor(options.jobs) if options.jobs > 1 else None
+        # game_seats[game_num][seat] is the team playing in that seat.
+        game_seats = []
+        game_args = []
         for game_num in range(options.multipleGames):
-            game = {}
-            loaded_agents, valid_game = loadAgent(matches, superQuiet=options.superQuiet)
-
-            game.update({'valid_game':valid_game})
-            random_seed=seed_list[seed_idx]
-            seed_idx += 1
-            game.update({'random_seed':random_seed})
-            f_name = agent_names[0]
-            for name in agent_names[-1:]:
-                f_name += '-vs-'+name
-            f_name += "-"+datetime.datetime.now().strftime("%d-%b-%Y-%H-%M-%S-%f")
-            f_name += "-"+str(random_seed) #Add seed to replay filename for reproducibility.
-            game.update({'file_name':f_name})
-            if options.saveLog: game.update({'log_path':f"{file_path}/log-{f_name}.log"})
-            gr = Game(GameRule,
-                        loaded_agents,
-                        num_of_agent = num_of_agents,
-                        seed=random_seed,
-                        time_limit=options.warningTimeLimit,
-                        warning_limit=num_of_warning,
-                        displayer=displayer,
-                        agents_namelist=agent_names,
-                        interactive=options.interactive)
-            if not options.print:
-                with HidePrint(options.saveLog,file_path,f_name):
-                    print("Following are the print info for loading:\n{}\n".format(msg))
-                    print("\n-------------------------------------\n")
-                    print("Following are the print info from the game:\n")
-                    if valid_game:          
-                        replay = gr.Run()
-                    else:
-                        print("Invalid game. No game played.\n")
-            else:
-                print("Following are the print info for loading:\n{}\n".format(msg))
-                print("\n-------------------------------------\n")
-                print("Following are the print info from the game:\n")
-                if valid_game:      
-                    replay = gr.Run()
-                else:
-                    print("Invalid game. No game played.\n")
+            seats = list(range(num_of_agents))
+            if options.duplicate and game_num % 2 == 1:
+                seats.reverse()
+            seat_matches = dict(matches, teams={seat:dict(matches['teams'][team]) for seat,team in enumerate(seats)})
+            game_seats.append(seats)
+            game_args.append((options, msg, seat_matches, [agent_names[team] for team in seats], GameRule, displayer,
+                              seed_list[game_num//2 if options.duplicate else game_num]))
+        if executor is not None:
+            futures = [executor.submit(playGame, *args) for args in game_args]
+            results = (future.result() for future in futures)
+        else:
+            results = (playGame(*args) for args in game_args)
+        num_played = 0
+        for game_num, (game, replay, valid_game, load_agent) in enumerate(results):
+            num_played = game_num+1
+            seats = game_seats[game_num]
+            for seat in range(num_of_agents):
+                matches['teams'][seats[seat]]['load_agent'] = load_agent[seat]
                     
             if valid_game:
                 # loading the current total
@@ -224,11 +342,14 @@ def run(options,msg):
                 new_wins = []
                 new_ties  = []
                 new_loses = []
-                game.update({f"scores":replay["scores"]})
+                team_scores = {seats[seat]:score for seat,score in replay["scores"].items()}
+                game.update({f"scores":team_scores})
+                if options.duplicate:
+                    game.update({'seats':seats})
                 
                 #Record scores.
                 for i in range(num_of_agents):
-                    new_scores.append(replay["scores"][i])
+                    new_scores.append(team_scores[i])
                     
                 max_score = max(new_scores)
 
@@ -237,7 +358,7 @@ def run(options,msg):
 
                 #Order agent IDs and scores by their ranks this game. Ranks is a list of ranks (int) in player order.
                 #Ranks record ties, so if 2 or more agents achieve the same score, they also achieve the same rank.
-                ids,scores = list(zip(*sorted(replay["scores"].items(), key=lambda x : x[1], reverse=True)))
+                ids,scores = list(zip(*sorted(team_scores.items(), key=lambda x : x[1], reverse=True)))
                 ranks = []
                 for agent_id,score in zip(ids,scores):
                     ranks.append((agent_id, scores.index(score) + 1))
@@ -269,16 +390,70 @@ def run(options,msg):
                 games_results.append((new_scores,new_totals,new_wins, new_ties,new_loses))
 
                 if options.saveGameRecord:
-                    if not os.path.exists(file_path):
-                        os.makedirs(file_path)
                     if not options.superQuiet:
                         print("Game ({}/{}) has been recorded!".format(game_num+1,options.multipleGames))
-                    record = pickle.dumps(replay)
-                    game.update({'replay_path': f"{file_path}/replay-{f_name}.replay"})
-                    with open(f"{file_path}/replay-{f_name}.replay",'wb') as f:
-                        f.write(record)
 
                 matches['games'].append(game)
+
+                if options.duplicate:
+                    pair_diffs.setdefault(game_num//2, []).append(new_scores[0]-new_scores[1])
+
+                if options.sprt is not None:
+                    result = 0 if new_scores[0] > new_scores[1] else 1 if new_scores[0] == new_scores[1] else 2
+                    sprt_counts[result] += 1
+                    # Duplicate games are tested pair by pair, once both games of a pair are in.
+                    if options.duplicate:
+                        pair_scores = sprt_pair_scores.setdefault(game_num//2, [])
+                        pair_scores.append(2-result)
+                        if len(pair_scores) < 2:
+                            continue
+                        sprt_pair_counts[sum(sprt_pair_scores.pop(game_num//2))] += 1
+                        llr = sprtPairLLR(sprt_pair_counts, elo0, elo1)
+                    else:
+                        llr = sprtLLR(*sprt_counts, elo0, elo1)
+                    if not options.superQuiet:
+                        print("SPRT: {} wins, {} draws, {} losses{}; LLR {:.2f} ({:.2f}, {:.2f})."\
+                              .format(*sprt_counts, " (pairs scoring 0-2: {})".format(sprt_pair_counts)
+                                      if options.duplicate else "", llr, llr_lower, llr_upper))
+                    if llr <= llr_lower or llr >= llr_upper:
+                        sprt_result = "H1" if llr >= llr_upper else "H0"
+                        break
+        if executor is not None:
+            if options.sprt is not None:
+                for future in futures:
+                    future.cancel()
+            executor.shutdown()
+        if options.sprt is not None:
+            if sprt_result == "H1":
+                print("SPRT accepted H1 after {} games: {} is at least {} Elo stronger than {}."\
+                      .format(num_played, agent_names[0], elo1, agent_names[1]))
+            elif sprt_result == "H0":
+                print("SPRT accepted H0 after {} games: {} is at most {} Elo stronger than {}."\
+                      .format(num_played, agent_names[0], elo0, agent_names[1]))
+            else:
+                print("SPRT inconclusive after {} games.".format(num_played))
+            matches["num_of_games"] = num_played
+            matches["sprt"] = {"elo0":elo0, "elo1":elo1, "alpha":options.alpha, "beta":options.beta,
+                               "wins":sprt_counts[0], "draws":sprt_counts[1], "losses":sprt_counts[2],
+                               "llr":sprtPairLLR(sprt_pair_counts, elo0, elo1) if options.duplicate
+                                     else sprtLLR(*sprt_counts, elo0, elo1), "result":sprt_result}
+            if options.duplicate:
+                matches["sprt"]["pairs"] = sprt_pair_counts
+        if options.duplicate:
+            # Mean and variance of the score differences over complete pairs, against those of single games.
+            diffs = [sum(d)/2 for d in pair_diffs.values() if len(d) == 2]
+            game_diffs = [d for pair in pair_diffs.values() for d in pair]
+            if len(diffs) > 1:
+                mean_diff = sum(diffs)/len(diffs)
+                pair_var = sum((d-mean_diff)**2 for d in diffs)/(len(diffs)-1)
+                game_mean = sum(game_diffs)/len(game_diffs)
+                game_var = sum((d-game_mean)**2 for d in game_diffs)/(len(game_diffs)-1)
+                print("Duplicate: over {} pairs, {} scored {:.2f} more than {} per game (standard error {:.2f}). "\
+                      "Variance of pair differences {:.2f}, of single-game differences {:.2f}."\
+                      .format(len(diffs), agent_names[0], mean_diff, agent_names[1], math.sqrt(pair_var/len(diffs)),
+                              pair_var, game_var))
+                matches["duplicate"] = {"pair_diffs":diffs, "mean_diff":mean_diff, "pair_variance":pair_var,
+                                        "game_variance":game_var}
         print(matches)
         if valid_game:
             scores,totals,wins,ties,loses = games_results[len(games_results)-1]
@@ -286,11 +461,11 @@ def run(options,msg):
             avgs = []
             win_rates = []
             for i in range(num_of_agents):
-                avgs.append(totals[i]/options.multipleGames)
-                win_rates.append(wins[i]/options.multipleGames*100)
+                avgs.append(totals[i]/num_played)
+                win_rates.append(wins[i]/num_played*100)
 
             if not options.superQuiet:
-                print("Over {} games:".format(options.multipleGames))
+                print("Over {} games:".format(num_played))
                 for i in range(num_of_agents):
                     print("    {} earned {:.2f} on average and won {} games ({:.2f})%."\
                           .format(agent_names[i],avgs[i],wins[i],win_rates[i]))
@@ -334,6 +509,13 @@ def loadParameter():
     parser.add_option('--startRoundWarningTimeLimit', type='float',help='Time limit for a warning of initialization for each round in seconds (default: 5)', default=5.0)
     parser.add_option('--numOfWarnings', type='int',help='Num of warnings a team can get before fail (default: 3)', default=3)
     parser.add_option('-m', '--multipleGames', type='int',help='Run multiple games in a roll', default=1)
+    parser.add_option('-j', '--jobs', type='int',help='Number of games played at once, each in its own worker process, without display (default: 1)', default=1)
+    parser.add_option('--duplicate', action='store_true', help='Play games in pairs on the same seed, with the seats swapped in the second game, and report the paired score differences. Needs two agents and an even -m (default: False)', default=False)
+    parser.add_option('--sprt', help='Run a sequential probability ratio test of whether the first agent is elo0 or elo1 Elo points stronger than the second, given as "elo0,elo1", stopping as soon as it is decided. -m is then the most games to play (default: None)', default=None)
+    parser.add_option('--alpha', type='float', help='SPRT probability of accepting elo1 when elo0 is true (default: 0.05)', default=0.05)
+    parser.add_option('--beta', type='float', help='SPRT probability of accepting elo0 when elo1 is true (default: 0.05)', default=0.05)
+    parser.add_option('--inProcess', action='store_true', help='Run agents in the runner\'s process, time-limited by threads, instead of each in its own worker process. Useful for debugging (default: False)', default=False)
+    parser.add_option('--ponder', action='store_true', help='Let agents that can ponder search during other agents\' turns. Needs a CPU for each agent, and is ignored without one (default: False)', default=False)
     parser.add_option('--setRandomSeed', type='int',help='Set the random seed, otherwise it will be completely random (default: 90054)', default=90054)
     parser.add_option('-s','--saveGameRecord', action='store_true', help='Writes game histories to a file (named by teams\' names and the time they were played) (default: False)', default=False)
     parser.add_option('-o','--output', help='output directory for replay and log (default: output)',default='output')
@@ -0,0 +1,250 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Round-robin league between many agents. Every pair of agents plays the given number of rounds, each round
+#          being two games on the same seed with the seats swapped. Games are spread over a pool of worker processes,
+#          longest expected games first, and each result is appended to a results file as it comes back, so an
+#          interrupted league can be resumed. Ratings are fitted with the Bradley-Terry model and reported on the Elo
+#          scale, with 95% confidence intervals.
+# Usage:   python league.py -a AGENT,AGENT[,AGENT...] [-r ROUNDS] [-j JOBS] [-f RESULTS_FILE]
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+import sys
+import os
+import json
+import math
+import random
+import importlib
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from optparse import OptionParser
+from game import Game
+from general_game_runner import HidePrint
+
+# CONSTANTS ----------------------------------------------------------------------------------------------------------#
+
+ELO_SCALE    = 400/math.log(10) #Elo points per unit of Bradley-Terry log-strength.
+PRIOR_GAMES  = 2                #Drawn games each agent is taken to have played against an average agent, so that
+                                #ratings stay finite for agents that won or lost every game.
+MAX_ITERS    = 1000             #Iterations of the Bradley-Terry fit.
+TOLERANCE    = 1e-9
+REPORT_EVERY = 10               #Number of games between rating tables.
+
+# FUNCTION DEF -------------------------------------------------------------------------------------------------------#
+
+def leagueSeed(seed, agent_a, agent_b, round_num):
+    """
+    Seed of a round between two agents. It only depends on the league seed, the pair and the round, so adding agents
+    to a league does not change the games already played.
+    """
+    pair = sorted([agent_a, agent_b])
+    return random.Random("{}-{}-{}-{}".format(seed, pair[0], pair[1], round_num)).randint(0, 1e10)
+
+
+def scheduleGames(agents, rounds, seed):
+    """
+    List (agents in seat order, round, seed) for every game of the league.
+    """
+    games = []
+    for agent_a, agent_b in itertools.combinations(agents, 2):
+        for round_num in range(rounds):
+            game_seed = leagueSeed(seed, agent_a, agent_b, round_num)
+            games.append(((agent_a, agent_b), round_num, game_seed))
+            games.append(((agent_b, agent_a), round_num, game_seed))
+    return games
+
+
+def loadResults(file_path):
+    """
+    Results already in the file, keyed by (agents in seat order, round).
+    """
+    results = {}
+    if os.path.exists(file_path):
+        with open(file_path) as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    results[(tuple(result["agents"]), result["round"])] = result
+    return results
+
+
+def configuredTime(agent, time_limit):
+    """
+    Thinking time per move an agent is configured to take: its module's THINKTIME, within the time limit of a move.
+    Agents without one are taken to move at once.
+    """
+    with HidePrint(False, None, None):
+        module = importlib.import_module(agent)
+    return min(getattr(module, "THINKTIME", 0), time_limit)
+
+
+def expectedTimes(agents, results, time_limit):
+    """
+    Expected thinking time of each agent per move, from its results so far, or from its configured thinking time (see
+    configuredTime) if it has none yet, as in a new league.
+    """
+    think_times = {agent:0 for agent in agents}
+    moves = {agent:0 for agent in agents}
+    for result in results.values():
+        for agent, think_time, num_moves in zip(result["agents"], result["think_time"], result.get("moves", ())):
+            if agent in moves:
+                think_times[agent] += think_time
+                moves[agent] += num_moves
+    return {agent:think_times[agent]/moves[agent] if moves[agent] else configuredTime(agent, time_limit)
+            for agent in agents}
+
+
+def playLeagueGame(GameRule, agent_names, seed, time_limit, warning_limit):
+    """
+    Play one game and return the scores, and each agent's total thinking time, as measured by the runner, and number
+    of moves.
+    """
+    with HidePrint(False, None, None):
+        agents = [importlib.import_module(name).myAgent(i) for i,name in enumerate(agent_names)]
+        game = Game(GameRule, agents, len(agents), seed=seed, time_limit=time_limit, warning_limit=warning_limit,
+                    agents_namelist=agent_names)
+        replay = game.Run()
+    think_time = [0]*len(agents)
+    moves = [0]*len(agents)
+    for agent_index, _, taken, _, _ in game.move_times:
+        think_time[agent_index] += taken
+        moves[agent_index] += 1
+    return [replay["scores"][i] for i in range(len(agents))], think_time, moves
+
+
+def priorScale(strength):
+    """
+    Factor to scale all strengths by for the prior games to fit best. Scaling leaves the games between agents as likely
+    as they were, and the prior games (draws against strength 1) fit best when the agents are expected to win half of
+    them in all. Found by Newton's method on the log of the factor.
+    """
+    log_scale = 0
+    for _ in range(MAX_ITERS):
+        p = 1 / (1 + np.exp(-np.log(strength) - log_scale))
+        step = np.clip((len(strength)/2 - p.sum()) / (p * (1 - p)).sum(), -1, 1)
+        log_scale += step
+        if abs(step) < TOLERANCE:
+            break
+    return math.exp(log_scale)
+
+
+def fitRatings(agents, results):
+    """
+    Fit Bradley-Terry strengths to the results, counting a draw as half a win for each agent, with the MM algorithm.
+    Returns {agent: (elo, 95% interval half-width)}, with Elo ratings centred on 0.
+    """
+    index = {agent:i for i,agent in enumerate(agents)}
+    n = len(agents)
+    games = np.zeros((n, n))
+    wins = np.zeros(n)
+    for result in results.values():
+        if not all(agent in index for agent in result["agents"]):
+            continue
+        i, j = (index[agent] for agent in result["agents"])
+        score_i, score_j = result["scores"]
+        games[i, j] += 1
+        games[j, i] += 1
+        wins[i] += 1 if score_i > score_j else 0.5 if score_i == score_j else 0
+        wins[j] += 1 if score_j > score_i else 0.5 if score_i == score_j else 0
+
+    #Each agent also draws PRIOR_GAMES games against an average agent, of strength 1. Only that opponent fixes the
+    #scale of the strengths, which MM steps move slowly, so after each step they are rescaled to the scale that best
+    #fits the prior games (see priorScale). They are centred at the end.
+    wins += PRIOR_GAMES/2
+    strength = np.ones(n)
+    for _ in range(MAX_ITERS):
+        pair_sums = strength[:, None] + strength[None, :]
+        new_strength = wins / ((games / pair_sums).sum(axis=1) + PRIOR_GAMES/(strength + 1))
+        new_strength *= priorScale(new_strength)
+        converged = np.abs(np.log(new_strength / strength)).max() < TOLERANCE
+        strength = new_strength
+        if converged:
+            break
+
+    #Covariance of the log-strengths from the inverse of the Fisher information.
+    log_strength = np.log(strength)
+    p = strength[:, None] / (strength[:, None] + strength[None, :])
+    information = -games * p * p.T
+    np.fill_diagonal(information, 0)
+    prior = strength / (strength + 1)
+    np.fill_diagonal(information, -information.sum(axis=1) + PRIOR_GAMES * prior * (1 - prior))
+    variance = np.diag(np.linalg.inv(information))
+    return {agent:(ELO_SCALE * (log_strength[i] - log_strength.mean()), 1.96 * ELO_SCALE * math.sqrt(variance[i]))
+            for agent,i in index.items()}
+
+
+def printRatings(agents, results):
+    ratings = fitRatings(agents, results)
+    played = {agent:0 for agent in agents}
+    for result in results.values():
+        for agent in result["agents"]:
+            if agent in played:
+                played[agent] += 1
+    print("{:<40} {:>8} {:>8} {:>6}".format("Agent", "Elo", "+/-", "Games"))
+    for agent in sorted(agents, key=lambda agent: -ratings[agent][0]):
+        print("{:<40} {:>8.1f} {:>8.1f} {:>6}".format(agent, ratings[agent][0], ratings[agent][1], played[agent]))
+
+
+def run(options):
+    agents = list(dict.fromkeys(options.agents.split(",")))
+    assert len(agents) > 1, "A league needs at least two agents."
+    model = importlib.import_module(f"{options.game}.{options.game.lower()}_model")
+    GameRule = getattr(model, f'{options.game}GameRule')
+
+    #Skip the games already in the results file, and play the rest longest expected first.
+    results = loadResults(options.results)
+    times = expectedTimes(agents, results, options.warningTimeLimit)
+    schedule = scheduleGames(agents, options.rounds, options.setRandomSeed)
+    pending = [game for game in schedule if (game[0], game[1]) not in results]
+    pending.sort(key=lambda game: -sum(times[agent] for agent in game[0]))
+    print("{} of {} games already played, {} to play.".format(len(schedule)-len(pending), len(schedule), len(pending)))
+
+    with ProcessPoolExecutor(options.jobs) as executor, open(options.results, "a") as f:
+        futures = {executor.submit(playLeagueGame, GameRule, game_agents, game_seed, options.warningTimeLimit,
+                                   options.numOfWarnings):(game_agents, round_num, game_seed)
+                   for game_agents, round_num, game_seed in pending}
+        for num_done, future in enumerate(as_completed(futures)):
+            game_agents, round_num, game_seed = futures[future]
+            try:
+                scores, think_time, moves = future.result()
+            except Exception as e:
+                print("Game {} (round {}) failed: {!r}".format(" vs ".join(game_agents), round_num, e))
+                continue
+            result = {"agents":list(game_agents), "round":round_num, "seed":game_seed, "scores":scores,
+                      "think_time":think_time, "moves":moves}
+            f.write(json.dumps(result) + "\n")
+            f.flush()
+            results[(game_agents, round_num)] = result
+            if not options.superQuiet:
+                print("{} vs {} (round {}): {}-{}".format(game_agents[0], game_agents[1], round_num, *scores))
+            if (num_done+1) % REPORT_EVERY == 0:
+                printRatings(agents, results)
+    printRatings(agents, results)
+
+
+def loadParameter():
+    parser = OptionParser("python league.py <options>")
+    parser.add_option('-a', '--agents', help='A list of the agents, etc. agents.t_080.Greedy_v1,agents.t_080.BFS_v1')
+    parser.add_option('-g', '--game', help='The name of the game, starting with a uppercase character (default: Azul)', default="Azul")
+    parser.add_option('-r', '--rounds', type='int', help='Rounds per pair of agents; each round is two games with the seats swapped (default: 1)', default=1)
+    parser.add_option('-j', '--jobs', type='int', help='Number of games played at once, each in its own worker process (default: 1)', default=1)
+    parser.add_option('-f', '--results', help='File the results are appended to, and resumed from (default: output/league.jsonl)', default="output/league.jsonl")
+    parser.add_option('-w', '--warningTimeLimit', type='float', help='Time limit for a warning of one move in seconds (default: 1)', default=1.0)
+    parser.add_option('--numOfWarnings', type='int', help='Num of warnings a team can get before fail (default: 3)', default=3)
+    parser.add_option('--setRandomSeed', type='int', help='Seed from which the seed of each round is derived (default: 90054)', default=90054)
+    parser.add_option('-Q', '--superQuiet', action='store_true', help='Only show the rating tables (default: False)', default=False)
+    options, otherjunk = parser.parse_args(sys.argv[1:])
+    assert len(otherjunk) == 0, "Unrecognized options: " + str(otherjunk)
+    assert options.agents, "No agents given."
+    return options
+
+# MAIN ---------------------------------------------------------------------------------------------------------------#
+
+if __name__ == '__main__':
+    options = loadParameter()
+    if os.path.dirname(options.results) and not os.path.exists(os.path.dirname(options.results)):
+        os.makedirs(os.path.dirname(options.results))
+    run(options)
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
@@ -0,0 +1,159 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Compact binary replay files. A replay file holds a header with what is known when the game starts (seed,
+#          agents, warning limit), then one fixed-width record per action (the agent's id and the action packed into
+#          an int by the game's GameRule.encodeAction), then a trailer with what is only known when the game ends
+#          (scores, warning positions, round scores). Records are written as the game is played, and read back through
+#          a memory map, so a replay's actions can be scanned without unpickling anything.
+#
+#          Layout: MAGIC, header length (uint32), header (JSON), records, trailer (JSON), trailer length (uint32),
+#          number of records (uint64), END_MAGIC. Integers are little-endian.
+#
+#          Games whose GameRule cannot encode actions, and replays recorded before this format, are pickled history
+#          dicts; LoadReplay reads both.
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+import json
+import pickle
+import struct
+import numpy as np
+from   template import GameRule
+
+# CONSTANTS ----------------------------------------------------------------------------------------------------------#
+
+MAGIC       = b"REPLAY\x00\x01" #Start of a compact replay, ending with the format version.
+END_MAGIC   = b"RPLEND\x00\x01"
+RECORD      = struct.Struct("<BI") #Agent id and action code of one action.
+RECORD_TYPE = np.dtype([("agent_id", "<u1"), ("action", "<u4")]) #The same record, for reading.
+TAIL        = struct.Struct("<IQ") #Trailer length and number of records.
+HEADER_KEYS = ("seed", "num_of_agent", "agents_namelist", "warning_limit", "legacy_bag", "chance_seed")
+
+# CLASS DEF ----------------------------------------------------------------------------------------------------------#
+
+#Whether a game's replays can be written in the compact format.
+def SupportsCompactReplay(game_rule):
+    return type(game_rule).encodeAction is not GameRule.encodeAction
+
+
+def _ToJSON(value):
+    return json.dumps(value, default=lambda v: v.item()).encode("utf-8") #Numpy scalars become Python numbers.
+
+
+class ReplayWriter:
+    #Start a replay file, with the entries of the header (see HEADER_KEYS).
+    def __init__(self, path, header):
+        self.file = open(path, "wb")
+        self.num_records = 0
+        header = _ToJSON(header)
+        self.file.write(MAGIC + struct.pack("<I", len(header)) + header)
+
+    def WriteAction(self, agent_id, code):
+        self.file.write(RECORD.pack(agent_id, code))
+        self.num_records += 1
+
+    #Write the trailer's entries, and close the file.
+    def Finish(self, trailer):
+        trailer = _ToJSON(trailer)
+        self.file.write(trailer + TAIL.pack(len(trailer), self.num_records) + END_MAGIC)
+        self.Close()
+
+    #Close the file. A replay closed before it is finished has no trailer, and cannot be loaded.
+    def Close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+#The actions of a compact replay, in the same form as the "actions" of a history dict: item i is
+#{i:{"agent_id":agent_id, "action":action}}. Actions are decoded as they are read. The records are also available as
+#the arrays agent_ids and codes.
+class ReplayActions:
+    def __init__(self, records, decode):
+        self.records = records
+        self.agent_ids = records["agent_id"]
+        self.codes = records["action"]
+        self.decode = decode
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return {i:{"agent_id":int(self.agent_ids[i]), "action":self.decode(int(self.codes[i]))}}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def IsCompactReplay(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+#Load everything in a replay of either format but its actions, and its number of actions. Compact replays are read
+#without touching their action records.
+def LoadReplayInfo(path):
+    if IsCompactReplay(path):
+        replay, num_records, _ = _ReadCompact(path)
+        return replay, num_records
+    replay = _LoadPickled(path)
+    return {key:value for key,value in replay.items() if key != "actions"}, len(replay["actions"])
+
+
+#Load a replay of either format as a history dict. Compact replays are decoded with game_rule_class's decodeAction.
+def LoadReplay(path, game_rule_class):
+    if not IsCompactReplay(path):
+        return _LoadPickled(path)
+    replay, num_records, records_start = _ReadCompact(path)
+    if num_records:
+        records = np.memmap(path, dtype=RECORD_TYPE, mode="r", offset=records_start, shape=(num_records,))
+    else:
+        records = np.zeros(0, dtype=RECORD_TYPE)
+    replay["actions"] = ReplayActions(records, game_rule_class(replay["num_of_agent"]).decodeAction)
+    return replay
+
+
+def _LoadPickled(path):
+    with open(path, "rb") as f:
+        return pickle.load(f, encoding="bytes")
+
+
+#Read a compact replay's header and trailer. Returns them as one dict, the number of records, and their offset.
+def _ReadCompact(path):
+    with open(path, "rb") as f:
+        f.seek(len(MAGIC))
+        header_len, = struct.unpack("<I", f.read(4))
+        replay = json.loads(f.read(header_len))
+        f.seek(-(TAIL.size + len(END_MAGIC)), 2)
+        tail = f.read(TAIL.size + len(END_MAGIC))
+        assert tail[TAIL.size:] == END_MAGIC, "Replay {} is incomplete.".format(path)
+        trailer_len, num_records = TAIL.unpack(tail[:TAIL.size])
+        records_start = len(MAGIC) + 4 + header_len
+        f.seek(records_start + num_records*RECORD.size)
+        replay.update(json.loads(f.read(trailer_len)))
+
+    #JSON keeps dict keys as strings and tuples as lists.
+    replay["scores"] = {int(i):score for i,score in replay["scores"].items()}
+    if "round_scores" in replay:
+        replay["round_scores"] = {int(i):scores for i,scores in replay["round_scores"].items()}
+    replay["warning_positions"] = [tuple(position) for position in replay["warning_positions"]]
+    return replay, num_records, records_start
+
+
+#Save a history dict, compactly if the game can encode its actions, otherwise pickled.
+def SaveReplay(path, replay, game_rule):
+    if not SupportsCompactReplay(game_rule):
+        with open(path, "wb") as f:
+            pickle.dump(replay, f)
+        return
+    writer = ReplayWriter(path, {key:replay[key] for key in HEADER_KEYS if key in replay})
+    for item in replay["actions"]:
+        (_, info), = item.items()
+        writer.WriteAction(info["agent_id"], game_rule.encodeAction(info["action"]))
+    writer.Finish({key:value for key,value in replay.items() if key not in HEADER_KEYS and key != "actions"})
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
@@ -0,0 +1,242 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Index of recorded games. Scans a directory for replay files (replay-*.replay, of either format; see
+#          replay_file.py) and keeps a SQLite catalog of each game's seed, date, agents, scores, margins and round by
+#          round scores. Only files that are new or changed since the last scan are read, and files that are gone are
+#          dropped. Queries are answered from the catalog, without opening any replay.
+# Usage:   python replay_index.py [-d DIRECTORY] [-a AGENT] [--result won|lost|tied] [--margin POINTS] [--stats]
+#          eg. games where random0 lost by more than 20 points:
+#              python replay_index.py -a random0 --result lost --margin 20
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+import sys
+import os
+import re
+import sqlite3
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+from optparse import OptionParser
+from replay_file import LoadReplayInfo
+
+# CONSTANTS ----------------------------------------------------------------------------------------------------------#
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS replays(
+    id           INTEGER PRIMARY KEY,
+    path         TEXT UNIQUE NOT NULL,
+    size         INTEGER NOT NULL,
+    mtime        REAL NOT NULL,
+    played_at    TEXT,
+    seed         INTEGER,
+    num_of_agent INTEGER,
+    num_actions  INTEGER,
+    num_rounds   INTEGER);
+CREATE TABLE IF NOT EXISTS players(
+    replay_id    INTEGER NOT NULL REFERENCES replays(id) ON DELETE CASCADE,
+    seat         INTEGER NOT NULL,
+    agent        TEXT,
+    score        REAL,
+    margin       REAL,  -- Score less the best other agent's score.
+    result       TEXT,  -- won, lost or tied.
+    warnings     INTEGER,
+    PRIMARY KEY (replay_id, seat));
+CREATE TABLE IF NOT EXISTS round_scores(
+    replay_id    INTEGER NOT NULL REFERENCES replays(id) ON DELETE CASCADE,
+    seat         INTEGER NOT NULL,
+    round        INTEGER NOT NULL,
+    score        REAL,  -- Points scored in the round.
+    PRIMARY KEY (replay_id, seat, round));
+CREATE INDEX IF NOT EXISTS players_agent  ON players(agent, result, margin);
+CREATE INDEX IF NOT EXISTS players_margin ON players(margin);
+CREATE INDEX IF NOT EXISTS replays_played ON replays(played_at);
+CREATE INDEX IF NOT EXISTS replays_seed   ON replays(seed);
+"""
+
+# Replay file names end in the date and time the game was played, and its seed (see general_game_runner.playGame).
+FILE_NAME = re.compile(r"-(\d{2}-[A-Za-z]{3}-\d{4}-\d{2}-\d{2}-\d{2}-\d{6})-(\d+)\.replay$")
+FILE_DATE = "%d-%b-%Y-%H-%M-%S-%f"
+
+# FUNCTION DEF -------------------------------------------------------------------------------------------------------#
+
+def openIndex(index_path):
+    conn = sqlite3.connect(index_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def findReplays(directory):
+    """
+    Paths of the replay files in a directory and its subdirectories.
+    """
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths += [os.path.join(root, f) for f in files if f.startswith("replay-") and f.endswith(".replay")]
+    return sorted(paths)
+
+
+def readReplay(path):
+    """
+    The catalog rows of one replay file: (replay row, player rows, round score rows), without the replay's id. Returns
+    None if the file cannot be read. Runs in a worker process when ingesting with jobs.
+    """
+    try:
+        replay, num_actions = LoadReplayInfo(path)
+    except Exception:
+        return None
+    played_at = None
+    match = FILE_NAME.search(os.path.basename(path))
+    if match:
+        played_at = datetime.datetime.strptime(match.group(1), FILE_DATE).isoformat(sep=" ")
+    round_scores = replay.get("round_scores", {})
+    num_rounds = max((len(scores) for scores in round_scores.values()), default=None)
+    stat = os.stat(path)
+    replay_row = (path, stat.st_size, stat.st_mtime, played_at, replay["seed"], replay["num_of_agent"], num_actions,
+                  num_rounds)
+
+    scores = replay["scores"]
+    player_rows = []
+    for seat in range(replay["num_of_agent"]):
+        best_other = max(score for other,score in scores.items() if other != seat)
+        margin = scores[seat] - best_other
+        result = "won" if margin > 0 else "tied" if margin == 0 else "lost"
+        warnings = sum(1 for agent_index,_ in replay["warning_positions"] if agent_index == seat)
+        player_rows.append((seat, replay["agents_namelist"][seat], scores[seat], margin, result, warnings))
+    round_rows = [(seat, round_num, score) for seat,seat_scores in round_scores.items()
+                  for round_num,score in enumerate(seat_scores)]
+    return replay_row, player_rows, round_rows
+
+
+def ingest(conn, directory, jobs=1):
+    """
+    Bring the catalog up to date with the replay files in a directory: index new files and files changed since they
+    were indexed, and drop files that are gone. Returns the numbers of files indexed, dropped and unreadable.
+    """
+    directory = os.path.abspath(directory)
+    indexed = {path:(size, mtime) for path,size,mtime in conn.execute("SELECT path, size, mtime FROM replays")}
+    paths = [os.path.abspath(path) for path in findReplays(directory)]
+    found = set(paths)
+    to_read = []
+    for path in paths:
+        stat = os.stat(path)
+        if indexed.get(path) != (stat.st_size, stat.st_mtime):
+            to_read.append(path)
+    gone = [path for path in indexed if path.startswith(directory + os.sep) and path not in found]
+
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs) as executor:
+            rows = list(executor.map(readReplay, to_read, chunksize=64))
+    else:
+        rows = [readReplay(path) for path in to_read]
+
+    num_failed = 0
+    with conn:
+        conn.executemany("DELETE FROM replays WHERE path = ?", [(path,) for path in gone + to_read])
+        for path, row in zip(to_read, rows):
+            if row is None:
+                num_failed += 1
+                continue
+            replay_row, player_rows, round_rows = row
+            replay_id = conn.execute("INSERT INTO replays(path, size, mtime, played_at, seed, num_of_agent, "
+                                     "num_actions, num_rounds) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", replay_row).lastrowid
+            conn.executemany("INSERT INTO players VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             [(replay_id,) + player_row for player_row in player_rows])
+            conn.executemany("INSERT INTO round_scores VALUES (?, ?, ?, ?)",
+                             [(replay_id,) + round_row for round_row in round_rows])
+    return len(to_read) - num_failed, len(gone), num_failed
+
+
+def queryGames(conn, agent=None, result=None, margin=None, seed=None, since=None, until=None, limit=None):
+    """
+    Games matching all the given conditions, most recent first, as (played_at, seed, path, [(agent, score), ...] in
+    seat order). agent, result and margin apply to the same player: eg. agent "random0" with result "lost" and margin
+    20 finds the games random0 lost by more than 20 points; without a result, margin finds games won or lost by more.
+    since and until are dates (YYYY-MM-DD).
+    """
+    conditions, params = [], []
+    if agent is not None:
+        conditions.append("p.agent = ?")
+        params.append(agent)
+    if result is not None:
+        conditions.append("p.result = ?")
+        params.append(result)
+    if margin is not None:
+        conditions.append({"won":"p.margin > ?", "lost":"p.margin < -?"}.get(result, "ABS(p.margin) > ?"))
+        params.append(margin)
+    if seed is not None:
+        conditions.append("r.seed = ?")
+        params.append(seed)
+    if since is not None:
+        conditions.append("r.played_at >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("r.played_at < date(?, '+1 day')")
+        params.append(until)
+    query = "SELECT DISTINCT r.id, r.played_at, r.seed, r.path FROM replays r JOIN players p ON p.replay_id = r.id"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY r.played_at DESC"
+    if limit is not None:
+        query += " LIMIT {:d}".format(limit)
+    games = []
+    for replay_id, played_at, game_seed, path in conn.execute(query, params).fetchall():
+        players = conn.execute("SELECT agent, score FROM players WHERE replay_id = ? ORDER BY seat",
+                               (replay_id,)).fetchall()
+        games.append((played_at, game_seed, path, players))
+    return games
+
+
+def agentStats(conn):
+    """
+    For each agent: games played, wins, ties, losses, mean score and mean margin.
+    """
+    return conn.execute("SELECT agent, COUNT(*), SUM(result = 'won'), SUM(result = 'tied'), SUM(result = 'lost'), "
+                        "AVG(score), AVG(margin) FROM players GROUP BY agent ORDER BY agent").fetchall()
+
+
+def run(options):
+    conn = openIndex(options.index or os.path.join(options.directory, "replays.db"))
+    if not options.noIngest:
+        num_indexed, num_dropped, num_failed = ingest(conn, options.directory, options.jobs)
+        print("Indexed {} replays, dropped {}{}.".format(num_indexed, num_dropped,
+              ", {} could not be read".format(num_failed) if num_failed else ""))
+    if options.stats:
+        print("{:<30} {:>6} {:>6} {:>6} {:>6} {:>8} {:>8}".format("Agent", "Games", "Won", "Tied", "Lost", "Score",
+                                                                    "Margin"))
+        for row in agentStats(conn):
+            print("{:<30} {:>6} {:>6} {:>6} {:>6} {:>8.2f} {:>8.2f}".format(*row))
+    if options.agent or options.result or options.margin is not None or options.seed is not None \
+            or options.since or options.until:
+        for played_at, game_seed, path, players in queryGames(conn, options.agent, options.result, options.margin,
+                                                              options.seed, options.since, options.until,
+                                                              options.limit):
+            print("{}  seed {:<11} {}  {}".format(played_at, game_seed,
+                  " vs ".join("{} ({:g})".format(agent, score) for agent,score in players), path))
+    conn.close()
+
+
+def loadParameter():
+    parser = OptionParser("python replay_index.py <options>")
+    parser.add_option('-d', '--directory', help='Directory of the replay files (default: output)', default="output")
+    parser.add_option('-i', '--index', help='Index file (default: replays.db in the directory)', default=None)
+    parser.add_option('-j', '--jobs', type='int', help='Number of worker processes reading replays (default: 1)', default=1)
+    parser.add_option('--noIngest', action='store_true', help='Query the index without scanning for new replays (default: False)', default=False)
+    parser.add_option('-a', '--agent', help='Games played by this agent (by name)', default=None)
+    parser.add_option('--result', type='choice', choices=['won', 'lost', 'tied'], help='Games the agent won, lost or tied', default=None)
+    parser.add_option('--margin', type='float', help='Games won or lost by more than this many points', default=None)
+    parser.add_option('--seed', type='int', help='Games played with this seed', default=None)
+    parser.add_option('--since', help='Games played on or after this date (YYYY-MM-DD)', default=None)
+    parser.add_option('--until', help='Games played on or before this date (YYYY-MM-DD)', default=None)
+    parser.add_option('--limit', type='int', help='Most games to list', default=None)
+    parser.add_option('--stats', action='store_true', help='Show games, results and mean scores of each agent (default: False)', default=False)
+    options, otherjunk = parser.parse_args(sys.argv[1:])
+    assert len(otherjunk) == 0, "Unrecognized options: " + str(otherjunk)
+    return options
+
+# MAIN ---------------------------------------------------------------------------------------------------------------#
+
+if __name__ == '__main__':
+    run(loadParameter())
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
@@ -0,0 +1,139 @@
+# INFORMATION ------------------------------------------------------------------------------------------------------- #
+
+# Purpose: Checks that recorded games still replay to their recorded results, eg. after a change to a game's model.
+#          Each replay (of either format; see replay_file.py) is re-simulated with GameReplayer, over a pool of worker
+#          processes. Every move is checked to be made by the agent whose turn it is, and to be legal; round scores
+#          are checked at the end of each round, where the replay has them; and the final scores are checked. The
+#          first move at which a replay diverges is reported.
+# Usage:   python replay_verify.py [-d DIRECTORY | REPLAY ...] [-j JOBS] [--noRounds]
+
+# IMPORTS ------------------------------------------------------------------------------------------------------------#
+
+import sys
+import os
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+from optparse import OptionParser
+from game import GameReplayer
+from replay_index import findReplays
+
+# FUNCTION DEF -------------------------------------------------------------------------------------------------------#
+
+def verifyReplay(path, GameRule, check_rounds=True):
+    """
+    Replay one game. Returns (path, number of moves, problem), where problem is None if the game reproduces its
+    recorded results, or (move, description) for the first divergence; move is None if it is only seen in the final
+    scores. Runs in a worker process when verifying with jobs.
+    """
+    try:
+        replayer = GameReplayer(GameRule, path)
+    except Exception as e:
+        return path, 0, (None, "could not be loaded: {!r}".format(e))
+    replay = replayer.replay
+    game_rule = replayer.game_rule
+    num_of_agent = replay["num_of_agent"]
+    actions = replay["actions"]
+    round_scores = replay.get("round_scores") if check_rounds else None
+    traces = getattr(game_rule, "agent_traces", None)
+    rounds_checked = 0
+    timed_out = None
+    while replayer.position < len(actions):
+        move = replayer.position
+        try:
+            (index, info), = actions[move].items()
+        except Exception as e:
+            return path, move, (move, "the move could not be read: {!r}".format(e))
+        agent_id, action = info["agent_id"], info["action"]
+        if game_rule.gameEnds():
+            return path, move, (move, "the game ended before this move")
+        if agent_id != game_rule.getCurrentAgentIndex():
+            return path, move, (move, "agent {} moved, but it was agent {}'s turn"
+                                .format(agent_id, game_rule.getCurrentAgentIndex()))
+        legal = game_rule.getLegalActions(game_rule.current_game_state, agent_id)
+        if agent_id != num_of_agent and game_rule.validAction:
+            is_legal = game_rule.validAction(action, game_rule.indexActions(legal))
+        else:
+            is_legal = action in legal
+        if not is_legal:
+            return path, move, (move, "agent {}'s move {} is illegal".format(agent_id, action))
+        try:
+            replayer.Step()
+        except Exception as e:
+            return path, move, (move, "agent {}'s move {} raised {!r}".format(agent_id, action, e))
+
+        #Round scores are recorded when a round ends, so they are compared once each trace has a new complete round.
+        if round_scores is not None and traces is not None and action == "ENDROUND":
+            rounds = min(len(trace.round_scores) for trace in traces)
+            for trace in traces:
+                if trace.round_scores[rounds_checked:rounds] != round_scores[trace.id][rounds_checked:rounds]:
+                    return path, move, (move, "agent {} scored {} in round {}, but {} was recorded".format(
+                        trace.id, trace.round_scores[rounds_checked:rounds], rounds_checked+1,
+                        round_scores[trace.id][rounds_checked:rounds]))
+            rounds_checked = rounds
+        if agent_id != num_of_agent and replayer.warnings[agent_id] == replay["warning_limit"]:
+            timed_out = agent_id
+            if replayer.position < len(actions):
+                return path, move, (move+1, "the game should have ended after agent {}'s last warning".format(agent_id))
+
+    #The final scores are worked out as Game._EndGame does.
+    if timed_out is not None:
+        scores = {i:-1 if i == timed_out else 0 for i in range(num_of_agent)}
+    else:
+        if not game_rule.gameEnds():
+            return path, len(actions), (len(actions), "the game has not ended after the last move")
+        scores = {i:game_rule.calScore(game_rule.current_game_state, i) for i in range(num_of_agent)}
+    if scores != replay["scores"]:
+        return path, len(actions), (None, "the final scores are {}, but {} were recorded".format(
+            scores, replay["scores"]))
+    return path, len(actions), None
+
+
+def verify(paths, GameRule, jobs=1, check_rounds=True):
+    """
+    Verify the replays, yielding verifyReplay's result for each, in order.
+    """
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs) as executor:
+            yield from executor.map(verifyReplay, paths, [GameRule]*len(paths), [check_rounds]*len(paths),
+                                    chunksize=16)
+    else:
+        for path in paths:
+            yield verifyReplay(path, GameRule, check_rounds)
+
+
+def run(options, paths):
+    model = importlib.import_module(f"{options.game}.{options.game.lower()}_model")
+    GameRule = getattr(model, f'{options.game}GameRule')
+    paths = paths or findReplays(options.directory)
+    num_failed = 0
+    num_moves = 0
+    for path, moves, problem in verify(paths, GameRule, options.jobs, not options.noRounds):
+        num_moves += moves
+        if problem is not None:
+            num_failed += 1
+            move, description = problem
+            print("{}: {}{}.".format(path, "" if move is None else "at move {}, ".format(move), description))
+        elif not options.quiet:
+            print("{}: ok.".format(path))
+    print("Verified {} replays ({} moves): {} reproduced, {} diverged.".format(len(paths), num_moves,
+                                                                           len(paths) - num_failed, num_failed))
+    return num_failed
+
+
+def loadParameter():
+    parser = OptionParser("python replay_verify.py <options> [REPLAY ...]")
+    parser.add_option('-d', '--directory', help='Directory of the replay files, if none are given (default: output)', default="output")
+    parser.add_option('-g', '--game', help='The name of the game, starting with a uppercase character (default: Azul)', default="Azul")
+    parser.add_option('-j', '--jobs', type='int', help='Number of worker processes replaying games (default: number of CPUs)', default=os.cpu_count() or 1)
+    parser.add_option('--noRounds', action='store_true', help='Only check the final scores, not the round by round scores (default: False)', default=False)
+    parser.add_option('-q', '--quiet', action='store_true', help='Only report replays that diverge (default: False)', default=False)
+    options, paths = parser.parse_args(sys.argv[1:])
+    return options, paths
+
+# MAIN ---------------------------------------------------------------------------------------------------------------#
+
+if __name__ == '__main__':
+    options, paths = loadParameter()
+    sys.exit(1 if run(options, paths) else 0)
+
+# END FILE -----------------------------------------------------------------------------------------------------------#
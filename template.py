@@ -1,8 +1,11 @@
 import utils
 import random
+import time
+import inspect
 
 
 class GameState:
+    __slots__ = ()
 
     def __init__(self,num_of_agent,agent_id):
         pass
@@ -33,6 +36,35 @@ class GameRule:
         utils.raiseNotDefined()
         return []
 
+    # Build a structure that validAction() can search quickly. Games
+    # without a faster lookup just use the list of actions.
+    def indexActions(self, actions):
+        return actions
+
+    # A copy of the game state from which the runner can detect and undo
+    # changes made by an agent that was handed the state itself (see 
+    # Game.Run). The actions handed to the agent must then be immutable.
+    # Games without a cheap way to do this return None, and their agents
+    # are handed deep copies instead.
+    def snapshotState(self, game_state):
+        return None
+
+    # Whether the game state differs from a snapshot taken of it.
+    def stateChanged(self, game_state, snapshot):
+        utils.raiseNotDefined()
+        return True
+
+    # Pack an action into an int in [0, 2**32), and unpack it, for compact
+    # replays (see replay_file.py). Games that do not override these have
+    # their replays pickled instead.
+    def encodeAction(self, action):
+        utils.raiseNotDefined()
+        return 0
+
+    def decodeAction(self, code):
+        utils.raiseNotDefined()
+        return None
+
     def calScore(self, game_state,agent_id):
         utils.raiseNotDefined()
         return 0
@@ -50,6 +82,45 @@ class GameRule:
     def getCurrentAgentIndex(self):
         return self.current_agent_index
 
+# Time budget for one move, handed by the runner to agents whose SelectAction
+# takes a 'deadline' argument. Times are read from a monotonic clock (see 
+# Now), which is the same in every process, so the deadline holds in an 
+# agent's worker process too.
+class Deadline:
+    def __init__(self, time_limit, warmup=False):
+        self.start = Deadline.Now()
+        self.time_limit = time_limit
+        self.end = self.start + time_limit
+
+        # Whether this is the agent's first move, which is given the longer
+        # warmup time limit
+        self.warmup = warmup
+
+    @staticmethod
+    def Now():
+        return time.monotonic()
+
+    def Elapsed(self):
+        return Deadline.Now() - self.start
+
+    def Remaining(self):
+        return self.end - Deadline.Now()
+
+    # Whether less than 'margin' seconds are left before the deadline. The
+    # margin should cover the time the agent needs to return its action.
+    def Expired(self, margin=0):
+        return Deadline.Now() >= self.end - margin
+
+
+# Whether the agent's SelectAction takes the runner's Deadline as a 
+# 'deadline' argument.
+def TakesDeadline(agent):
+    try:
+        return "deadline" in inspect.signature(agent.SelectAction).parameters
+    except (TypeError, ValueError):
+        return False
+
+
 class Agent(object):
     def __init__(self, _id):
         self.id = _id
@@ -57,7 +128,8 @@ class Agent(object):
 
     # Given a set of available actions for the agent to execute, and
     # a copy of the current game state (including that of the agent),
-    # select one of the actions to execute. 
+    # select one of the actions to execute. Agents may add a 'deadline'
+    # argument to be given the move's Deadline.
     def SelectAction(self, actions, game_state):
         return random.choice(actions)
 
@@ -0,0 +1,75 @@
+"""
+Shared helpers: games between the generic agents, played in this process and optionally recorded.
+"""
+
+import os
+import random
+import importlib
+import pytest
+from game import Game
+from Azul.azul_model import AzulGameRule
+
+AGENT_NAMES = ["random", "first_move"]
+
+
+def playGame(seed, names=AGENT_NAMES, replay_path=None, chance_seed=None):
+    """
+    Play a game of Azul between the given generic agents and return its history dict.
+    """
+    agents = [importlib.import_module("agents.generic." + name).myAgent(i) for i,name in enumerate(names)]
+    return Game(AzulGameRule, agents, len(agents), seed=seed, agent_workers=False, agents_namelist=list(names),
+                replay_path=replay_path, chance_seed=chance_seed).Run()
+
+
+def randomStates(seed, num_games=4):
+    """
+    States reached by playing random legal moves, with the agent to move: every position of each game.
+    """
+    random.seed(seed)
+    states = []
+    for _ in range(num_games):
+        game_rule = AzulGameRule(2)
+        while not game_rule.gameEnds():
+            agent_id = game_rule.getCurrentAgentIndex()
+            if agent_id < 2:
+                states.append(game_rule.current_game_state.clone())
+            game_rule.update(random.choice(game_rule.getLegalActions(game_rule.current_game_state, agent_id)))
+    return states
+
+
+def snapshot(state):
+    """
+    A clone of an Azul state with its own copy of the chance generator, which clones otherwise share.
+    """
+    copy = state.clone()
+    if state.rng is not None:
+        copy.rng = random.Random()
+        copy.rng.setstate(state.rng.getstate())
+    return copy
+
+
+def sameState(state, other):
+    """
+    Whether two Azul states are the same, including the position of their chance generators if they have them.
+    """
+    if (state.rng is None) != (other.rng is None):
+        return False
+    if state.rng is not None and state.rng.getstate() != other.rng.getstate():
+        return False
+    copy = other.clone()
+    copy.rng = state.rng
+    return state.SameAs(copy)
+
+
+@pytest.fixture(scope="session")
+def replay_dir(tmp_path_factory):
+    """
+    A directory of recorded games: four with the agents in each seat order, and one with a chance seed.
+    """
+    directory = tmp_path_factory.mktemp("replays")
+    games = [(seed, names, None) for seed in (11, 12) for names in (AGENT_NAMES, AGENT_NAMES[::-1])]
+    games.append((13, AGENT_NAMES, 13))
+    for seed, names, chance_seed in games:
+        path = os.path.join(str(directory), "replay-{}-vs-{}-{}.replay".format(names[0], names[1], seed))
+        playGame(seed, names, path, chance_seed)
+    return str(directory)
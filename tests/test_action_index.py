@@ -0,0 +1,72 @@
+"""
+Validating a selected action through the per-turn action index (utils.IndexActions and FindAction) agrees with
+searching the list of legal actions, for legal, illegal and malformed selections.
+"""
+
+import copy
+import random
+import Azul.azul_utils as utils
+from Azul.azul_model import AzulGameRule
+from conftest import randomStates
+
+
+def linearFind(c, actions):
+    """
+    The legal action equal to c, found field by field as ValidAction does without an index.
+    """
+    for m in actions:
+        if isinstance(m, str) or isinstance(c, str):
+            if m == c:
+                return m
+            continue
+        try:
+            if c[0] == m[0] and c[1] == m[1] and utils.SameTG(c[2], m[2]):
+                return m
+        except (TypeError, AttributeError, IndexError, KeyError):
+            pass
+    return None
+
+
+def unshared(action):
+    return (action[0], action[1], utils.TileGrab(action[2].tile_type, action[2].number,
+                                                  action[2].pattern_line_dest, action[2].num_to_pattern_line))
+
+
+def selections(actions, rng):
+    """
+    Legal actions (shared, copied and rebuilt), other actions, and things that are not actions at all.
+    """
+    moves = [m for m in actions if not isinstance(m, str)]
+    found = list(actions) + [copy.deepcopy(m) for m in moves] + [unshared(m) for m in moves]
+    found += rng.sample(utils.ACTIONS, 20) + ["STARTROUND", "ENDROUND"]
+    found += [None, 0, "not an action", (), (utils.Action.TAKE_FROM_FACTORY,), [1, 2, 3]]
+    for m in moves[:5]:
+        tg = m[2]
+        found.append((m[0], m[1], (tg.tile_type, tg.number, tg.pattern_line_dest, tg.num_to_pattern_line)))
+        found.append((m[0], m[1] + 1, tg))
+        found.append((m[0], m[1], utils.TileGrab(tg.tile_type, tg.number, tg.pattern_line_dest - 6,
+                                                 tg.num_to_pattern_line)))
+        found.append((m[0], m[1], utils.TileGrab(tg.tile_type + 5, tg.number, tg.pattern_line_dest,
+                                                 tg.num_to_pattern_line)))
+    return found
+
+
+def test_index_agrees_with_list():
+    game_rule = AzulGameRule(2)
+    rng = random.Random(8)
+    for state in randomStates(seed=8, num_games=2)[::3]:
+        actions = game_rule.getLegalActions(state, state.agent_to_move)
+        action_index = game_rule.indexActions(actions)
+        for c in selections(actions, rng):
+            expected = linearFind(c, actions)
+            assert utils.FindAction(c, action_index) is expected
+            assert game_rule.validAction(c, action_index) == (expected is not None)
+
+
+def test_round_signals():
+    game_rule = AzulGameRule(2)
+    for signal in ("STARTROUND", "ENDROUND"):
+        action_index = game_rule.indexActions([signal])
+        assert utils.FindAction(signal, action_index) == signal
+        assert not game_rule.validAction("ENDROUND" if signal == "STARTROUND" else "STARTROUND", action_index)
+        assert not game_rule.validAction(utils.ACTIONS[0], action_index)
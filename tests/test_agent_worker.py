@@ -0,0 +1,52 @@
+"""
+Agents in worker processes (agent_worker.py) play the same game as agents in the runner's process, including the
+random actions given in place of illegal moves and timeouts.
+"""
+
+import time
+import random
+import pytest
+from game import Game
+from template import Agent
+from Azul.azul_model import AzulGameRule
+from agents.generic.random import myAgent as RandomAgent
+
+
+class IllegalAgent(Agent):
+    """
+    Draws from the random module before every move, and makes every other move an illegal one.
+    """
+    def __init__(self, _id):
+        super().__init__(_id)
+        self.moves = 0
+
+    def SelectAction(self, actions, game_state):
+        self.moves += 1
+        random.random()
+        return "not an action" if self.moves % 2 else random.choice(actions)
+
+
+class SlowAgent(Agent):
+    """
+    Draws from the random module before every move, and overruns the time limit after some of its draws. A worker is
+    restarted after a timeout, so this depends on the draws rather than on the agent's own state.
+    """
+    def SelectAction(self, actions, game_state):
+        if random.random() < 0.25:
+            time.sleep(1)
+            return actions[0]
+        return random.choice(actions)
+
+
+def playGame(agent_class, agent_workers):
+    agents = [agent_class(0), RandomAgent(1)]
+    history = Game(AzulGameRule, agents, 2, seed=5, time_limit=0.3, warning_limit=100,
+                   agent_workers=agent_workers, agents_namelist=["test", "random"]).Run()
+    return [info["action"] for item in history["actions"] for info in item.values()], history["warning_positions"]
+
+
+@pytest.mark.parametrize("agent_class", [IllegalAgent, SlowAgent])
+def test_workers_play_same_game(agent_class):
+    actions, warning_positions = playGame(agent_class, agent_workers=False)
+    assert warning_positions
+    assert playGame(agent_class, agent_workers=True) == (actions, warning_positions)
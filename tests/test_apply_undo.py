@@ -0,0 +1,38 @@
+"""
+Moves applied in place with AzulGameRule.apply are undone exactly by AzulGameRule.undo, one at a time or in reverse
+order after several.
+"""
+
+import random
+from Azul.azul_model import AzulGameRule
+from conftest import randomStates
+
+
+def test_apply_undo_each_move():
+    game_rule = AzulGameRule(2)
+    for state in randomStates(seed=3, num_games=2):
+        agent_id = state.agent_to_move
+        before = state.clone()
+        for action in game_rule.getLegalActions(state, agent_id):
+            undo_token = game_rule.apply(state, action, agent_id)
+            assert not state.SameAs(before)
+            game_rule.undo(state, undo_token)
+            assert state.SameAs(before)
+
+
+def test_undo_in_reverse():
+    game_rule = AzulGameRule(2)
+    rng = random.Random(4)
+    for state in randomStates(seed=4, num_games=2):
+        before = state.clone()
+        # Play on to the end of the round, then undo every move.
+        states, undo_tokens = [], []
+        while state.TilesRemaining():
+            agent_id = state.agent_to_move
+            action = rng.choice(game_rule.getLegalActions(state, agent_id))
+            states.append(state.clone())
+            undo_tokens.append(game_rule.apply(state, action, agent_id))
+        while undo_tokens:
+            game_rule.undo(state, undo_tokens.pop())
+            assert state.SameAs(states.pop())
+        assert state.SameAs(before)
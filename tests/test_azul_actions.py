@@ -0,0 +1,51 @@
+"""
+Interned TileGrabs and action codes (Azul/azul_utils.py).
+"""
+
+import copy
+import pickle
+import pytest
+import Azul.azul_utils as utils
+
+
+def test_tile_grabs_interned():
+    for tile in utils.Tile:
+        for number in range(utils.MAX_GRAB+1):
+            for dest in range(-1, utils.NUM_DESTS-1):
+                for to_line in range(utils.NUM_DESTS):
+                    tg = utils.GetTileGrab(tile, number, dest, to_line)
+                    assert (tg.tile_type, tg.number, tg.pattern_line_dest, tg.num_to_pattern_line) == \
+                        (tile, number, dest, to_line)
+                    assert tg.num_to_floor_line == number - to_line
+                    assert utils.GetTileGrab(tile, number, dest, to_line) is tg
+                    assert copy.deepcopy(tg) is tg
+                    assert pickle.loads(pickle.dumps(tg)) is tg
+
+
+def test_tile_grab_out_of_range_not_wrapped():
+    # Negative or too large fields are not used as indices into the interned table.
+    for fields in [(0, 1, -2, 0), (0, 1, 0, -1), (0, 1, utils.NUM_DESTS-1, 0), (-1, 0, -1, 0)]:
+        tg = utils.GetTileGrab(*fields)
+        assert (tg.tile_type, tg.number, tg.pattern_line_dest, tg.num_to_pattern_line) == fields
+
+
+def test_action_codes_round_trip():
+    for code, action in enumerate(utils.ACTIONS):
+        assert utils.EncodeAction(action) == code
+        assert utils.DecodeAction(code) is action
+        unshared = (action[0], action[1], utils.TileGrab(*(getattr(action[2], field) for field in
+                    ("tile_type", "number", "pattern_line_dest", "num_to_pattern_line"))))
+        assert utils.InternAction(unshared) is action
+    assert utils.InternAction("STARTROUND") == "STARTROUND"
+
+
+@pytest.mark.parametrize("code", [-1, -len(utils.ACTIONS), len(utils.ACTIONS), 10**9])
+def test_bad_action_code(code):
+    with pytest.raises(ValueError):
+        utils.DecodeAction(code)
+
+
+def test_intern_action_out_of_range():
+    # A pattern line destination of -2 would otherwise alias another action's code.
+    with pytest.raises(ValueError):
+        utils.InternAction((utils.Action.TAKE_FROM_FACTORY, 0, utils.TileGrab(0, 1, -2, 0)))
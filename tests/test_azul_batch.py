@@ -0,0 +1,59 @@
+"""
+AzulBatch (Azul/azul_batch.py) plays by the same rules as AzulState and AzulGameRule: the same legal moves, and the
+same positions after each move and each round's scoring. The batch draws tiles from its own generator, so positions
+are compared move by move rather than over whole games.
+"""
+
+import numpy as np
+import pytest
+from Azul.azul_model import AzulGameRule
+from Azul.azul_batch import AzulBatch, RandomPolicy
+
+
+def sortedFloors(state):
+    """
+    A clone of the state with the floor tiles in colour order, as AzulBatch.GetState lists them.
+    """
+    state = state.clone()
+    for plr in state.agents:
+        plr.floor_tiles = sorted(plr.floor_tiles)
+    return state
+
+
+@pytest.mark.parametrize("num_agents", [2, 3, 4])
+def test_batch_agrees_with_state(num_agents):
+    batch = AzulBatch(16, num_agents, seed=num_agents, max_rounds=10)
+    game_rule = AzulGameRule(num_agents)
+    rounds_ended = 0
+    while not batch.done.all():
+        mask = batch.LegalMask()
+        actions = RandomPolicy(batch, mask)
+        successors = {}
+        for game in np.flatnonzero(~batch.done):
+            state = batch.GetState(game)
+            agent_id = state.agent_to_move
+            legal = game_rule.getLegalActions(state, agent_id)
+            assert sorted(batch.ActionIndex(action) for action in legal) == list(np.flatnonzero(mask[game]))
+            for action in legal:
+                assert batch.ToAction(game, batch.ActionIndex(action)) is action
+            successor = game_rule.generateSuccessor(state, batch.ToAction(game, actions[game]), agent_id)
+            if not successor.TilesRemaining() and successor.next_first_agent != -1:
+                successor = game_rule.generateSuccessor(successor, "ENDROUND", num_agents)
+            successors[game] = successor
+        batch.Step(actions)
+
+        for game, successor in successors.items():
+            state = batch.GetState(game)
+            if successor.TilesRemaining():
+                assert sortedFloors(state).SameAs(sortedFloors(successor))
+            else:
+                # The batch has gone on to deal the next round, from its own generator.
+                rounds_ended += 1
+                if batch.done[game] and not batch.stalled[game]:
+                    for plr in successor.agents:
+                        plr.EndOfGameScore() # Which the batch adds when a game ends
+                assert all(p.SameAs(q) for p,q in zip(sortedFloors(state).agents, sortedFloors(successor).agents))
+                dealt = np.sum([fd.tiles for fd in state.factories], 0)
+                assert list(np.add(state.bag.tiles, state.bag_used.tiles) + dealt) == \
+                    list(np.add(successor.bag.tiles, successor.bag_used.tiles))
+    assert rounds_ended > 0 and (batch.done & ~batch.stalled).any()
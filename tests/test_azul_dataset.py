@@ -0,0 +1,111 @@
+"""
+Exporting replays to a dataset (Azul/azul_dataset.py): exports resume where they left off, fill up the last shard,
+and remember the replays they skip.
+"""
+
+import os
+import shutil
+import pickle
+import numpy as np
+from replay_file import LoadReplay
+from replay_index import findReplays
+from Azul.azul_model import AzulGameRule
+from Azul import azul_dataset
+
+
+def readDataset(directory):
+    shards = list(azul_dataset.loadShards(directory))
+    return {name:np.concatenate([shard[name] for shard in shards]) for name in azul_dataset.ARRAYS}, len(shards)
+
+
+def test_export_resumes(replay_dir, tmp_path):
+    whole, partial, replays = (str(tmp_path / name) for name in ("whole", "partial", "replays"))
+    azul_dataset.export(replay_dir, whole, 2, shard_size=100)
+    os.makedirs(replays)
+    for path in findReplays(replay_dir):
+        shutil.copy(path, replays)
+        azul_dataset.export(replays, partial, 2, shard_size=100)
+    (expected, num_shards), (rows, num_partial_shards) = readDataset(whole), readDataset(partial)
+    assert num_partial_shards == num_shards == (len(expected["actions"]) + 99)//100
+    for name in azul_dataset.ARRAYS:
+        assert np.array_equal(rows[name], expected[name])
+    # Exporting again adds nothing.
+    assert azul_dataset.export(replays, partial, 2, shard_size=100) == (0, 0, 0)
+
+
+def test_rows(replay_dir, tmp_path):
+    path = findReplays(replay_dir)[0]
+    features, actions, outcomes, scores = azul_dataset.exportReplay(path, 2)
+    replay = LoadReplay(path, AzulGameRule)
+    num_moves = sum(1 for item in replay["actions"] for info in item.values() if info["agent_id"] < 2)
+    assert len(features) == len(actions) == len(outcomes) == len(scores) == \
+        num_moves - len(replay["warning_positions"])
+    assert features.shape[1] == len(azul_dataset.featureNames(2))
+    final = [replay["scores"][agent] for agent in range(2)]
+    assert (scores == final).all()
+    to_move = features[:, -2:].argmax(1)
+    expected = np.sign(np.array(final)[to_move] - np.array(final)[1-to_move])
+    assert (outcomes == expected).all()
+
+
+def test_pickled_replay_with_numpy_scores(replay_dir, tmp_path):
+    # Replays pickled before the compact format hold numpy scores.
+    replay = LoadReplay(findReplays(replay_dir)[0], AzulGameRule)
+    replay["actions"] = list(replay["actions"])
+    replay["scores"] = {agent:np.float64(score) for agent,score in replay["scores"].items()}
+    path = str(tmp_path / "replay-pickled.replay")
+    with open(path, "wb") as f:
+        pickle.dump(replay, f)
+    rows = azul_dataset.exportReplay(path, 2)
+    assert rows is not None and len(rows[1]) > 0
+
+
+def test_partial_shard_filled_in_place(replay_dir, tmp_path):
+    replays, dataset = str(tmp_path / "replays"), str(tmp_path / "dataset")
+    os.makedirs(replays)
+    paths = findReplays(replay_dir)
+    shutil.copy(paths[0], replays)
+    azul_dataset.export(replays, dataset, 2, shard_size=10000)
+    before, _ = readDataset(dataset)
+    shard = azul_dataset.loadManifest(dataset, 2)["shards"][0]
+    # The shard is kept at full size, so it is filled up without rewriting it.
+    assert len(np.load(os.path.join(dataset, shard["name"] + "-actions.npy"), mmap_mode="r")) == 10000
+
+    # Rows appended by an export that never saves its manifest are not part of the dataset.
+    writer = azul_dataset.ShardWriter(dataset, azul_dataset.loadManifest(dataset, 2), 10000)
+    writer.Append(azul_dataset.exportReplay(paths[1], 2), 1)
+    writer.arrays["actions"].flush()
+    interrupted, num_shards = readDataset(dataset)
+    assert num_shards == 1
+    for name in azul_dataset.ARRAYS:
+        assert np.array_equal(interrupted[name], before[name])
+
+    shutil.copy(paths[1], replays)
+    azul_dataset.export(replays, dataset, 2, shard_size=10000)
+    after, num_shards = readDataset(dataset)
+    assert num_shards == 1
+    assert len(after["actions"]) == len(before["actions"]) + len(azul_dataset.exportReplay(paths[1], 2)[1])
+
+
+def test_skipped_replays_remembered(replay_dir, tmp_path, monkeypatch):
+    replays, dataset = str(tmp_path / "replays"), str(tmp_path / "dataset")
+    os.makedirs(replays)
+    shutil.copy(findReplays(replay_dir)[0], replays)
+    broken = os.path.join(replays, "replay-broken.replay")
+    with open(broken, "wb") as f:
+        f.write(b"not a replay")
+    assert azul_dataset.export(replays, dataset, 2)[:2] == (1, 1)
+    assert os.path.abspath(broken) in azul_dataset.loadManifest(dataset, 2)["skipped"]
+
+    tried = []
+    export_replay = azul_dataset.exportReplay
+    monkeypatch.setattr(azul_dataset, "exportReplay", lambda path, num_agents: tried.append(path) or
+                        export_replay(path, num_agents))
+    assert azul_dataset.export(replays, dataset, 2) == (0, 0, 0)
+    assert tried == []
+
+    # A skipped replay that changes, eg. because its game has finished, is tried again.
+    shutil.copy(findReplays(replay_dir)[1], broken)
+    assert azul_dataset.export(replays, dataset, 2)[:2] == (1, 0)
+    assert tried == [os.path.abspath(broken)]
+    assert azul_dataset.loadManifest(dataset, 2)["skipped"] == {}
@@ -0,0 +1,52 @@
+"""
+Duplicate games: both games of a pair, with the seats swapped, are dealt the same tiles, and the SPRT counts each pair
+as one trial.
+"""
+
+import importlib
+import pytest
+from game import Game, GameReplayer
+from Azul.azul_model import AzulGameRule
+from general_game_runner import sprtLLR, sprtPairLLR
+
+
+def playRounds(names, seed, chance_seed):
+    """
+    Play a game in this process, and return the factories dealt at the start of each round, with whether the bag had
+    been refilled from the discarded tiles by then.
+    """
+    agents = [importlib.import_module("agents.generic." + name).myAgent(i) for i,name in enumerate(names)]
+    replay = Game(AzulGameRule, agents, len(agents), seed=seed, agent_workers=False, agents_namelist=names,
+                  chance_seed=chance_seed).Run()
+    replayer = GameReplayer(AzulGameRule, replay)
+    rounds, refilled, bag_used = [], False, 0
+    while replayer.position < len(replay["actions"]):
+        _, action = replayer.Step()
+        state = replayer.game_rule.current_game_state
+        if action == "ENDROUND":
+            bag_used = state.bag_used.total
+        elif action == "STARTROUND":
+            refilled = refilled or state.bag_used.total < bag_used
+            rounds.append(([factory.tiles[:] for factory in state.factories], refilled))
+    return rounds
+
+
+@pytest.mark.parametrize("seed", [12345, 7, 90210])
+def test_pair_dealt_same_tiles(seed):
+    first = playRounds(["first_move", "random"], seed, seed)
+    second = playRounds(["random", "first_move"], seed, seed)
+    # Once the bag runs out it is refilled with the tiles the agents discarded, which depend on their moves; every
+    # round dealt from the original bag is the same in both games.
+    shared = [(a, b) for (a, refilled_a), (b, refilled_b) in zip(first, second) if not (refilled_a or refilled_b)]
+    assert len(shared) >= 4
+    for factories_a, factories_b in shared:
+        assert factories_a == factories_b
+
+
+def test_pair_llr():
+    # Pairs split evenly are evidence for neither hypothesis around 0.
+    assert sprtPairLLR([0, 0, 10, 0, 0], -10, 10) == pytest.approx(0)
+    assert sprtPairLLR([0, 0, 2, 8, 0], 0, 10) > 0
+    assert sprtPairLLR([0, 8, 2, 0, 0], 0, 10) < 0
+    # Two games, each a win or a loss, make the pentanomial counts the trinomial ones when each pair is one game.
+    assert sprtPairLLR([3, 0, 0, 0, 5], 0, 10) == pytest.approx(sprtLLR(5, 0, 3, 0, 10))
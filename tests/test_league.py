@@ -0,0 +1,52 @@
+"""
+Bradley-Terry ratings of a league (league.py): symmetric results give equal ratings, and the fit reaches the
+strengths that maximise the posterior, the prior being PRIOR_GAMES draws against an agent of strength 1.
+"""
+
+import math
+import random
+import pytest
+import league
+
+
+def results(games):
+    """
+    Results in the league's format from a list of (agents, scores).
+    """
+    return {(tuple(agents), i):{"agents":list(agents), "round":i, "scores":list(scores)}
+            for i,(agents,scores) in enumerate(games)}
+
+
+def test_symmetric_results():
+    # Every agent beats the next one round a cycle as often as it loses to it.
+    agents = ["a", "b", "c"]
+    games = [((agent, agents[(i+1) % 3]), (10, 5)) for i,agent in enumerate(agents) for _ in range(4)]
+    games += [((agents[(i+1) % 3], agent), (5, 10)) for i,agent in enumerate(agents) for _ in range(2)]
+    ratings = league.fitRatings(agents, results(games))
+    for agent in agents:
+        assert ratings[agent][0] == pytest.approx(0, abs=1e-6)
+        assert ratings[agent][1] == pytest.approx(ratings["a"][1])
+
+
+def test_fit_maximises_posterior():
+    rng = random.Random(0)
+    agents = ["a", "b", "c", "d", "unplayed"]
+    games = []
+    for _ in range(200):
+        pair = rng.sample(agents[:-1], 2)
+        # Agents earlier in the list are stronger.
+        scores = (1, 0) if rng.random() < 0.5 + 0.1*(agents.index(pair[1]) - agents.index(pair[0])) else (0, 1)
+        games.append((pair, scores if rng.random() < 0.9 else (1, 1)))
+    ratings = league.fitRatings(agents, results(games))
+
+    # An agent that has played no games is only held by the prior, at strength 1.
+    strength = {agent:math.exp((ratings[agent][0] - ratings["unplayed"][0]) / league.ELO_SCALE) for agent in agents}
+    for agent in agents:
+        wins, expected = league.PRIOR_GAMES/2, league.PRIOR_GAMES * strength[agent] / (strength[agent] + 1)
+        for pair, scores in games:
+            if agent in pair:
+                i = pair.index(agent)
+                wins += 1 if scores[i] > scores[1-i] else 0.5 if scores[i] == scores[1-i] else 0
+                expected += strength[agent] / (strength[agent] + strength[pair[1-i]])
+        assert wins == pytest.approx(expected, abs=1e-6)
+    assert ratings["a"][0] > ratings["b"][0] > ratings["c"][0] > ratings["d"][0]
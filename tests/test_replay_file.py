@@ -0,0 +1,75 @@
+"""
+Compact replay files (replay_file.py) load back as the history dict of the game they recorded, whether written as
+the game is played or saved afterwards, and games that cannot encode their actions are pickled instead.
+"""
+
+import os
+import pytest
+import numpy as np
+import replay_file
+from replay_file import LoadReplay, LoadReplayInfo, SaveReplay, IsCompactReplay, ReplayWriter
+from template import GameRule
+from Azul.azul_model import AzulGameRule
+from conftest import playGame
+
+
+def sameReplay(replay, history):
+    """
+    Whether a loaded replay has the entries of a history dict, comparing actions by their codes.
+    """
+    game_rule = AzulGameRule(history["num_of_agent"])
+    def codes(actions):
+        return [(info["agent_id"], game_rule.encodeAction(info["action"])) for item in actions
+                for info in item.values()]
+    return {key:value for key,value in replay.items() if key != "actions"} == \
+        {key:value for key,value in history.items() if key != "actions"} and \
+        [list(item) for item in replay["actions"]] == [list(item) for item in history["actions"]] and \
+        codes(replay["actions"]) == codes(history["actions"])
+
+
+class UnencodedRule(AzulGameRule):
+    encodeAction = GameRule.encodeAction
+
+
+def test_recorded_as_played(tmp_path):
+    path = str(tmp_path / "game.replay")
+    history = playGame(15, replay_path=path, chance_seed=15)
+    assert IsCompactReplay(path)
+    replay = LoadReplay(path, AzulGameRule)
+    assert sameReplay(replay, history)
+    info, num_actions = LoadReplayInfo(path)
+    assert num_actions == len(history["actions"])
+    assert info == {key:value for key,value in replay.items() if key != "actions"}
+
+
+def test_saved(tmp_path):
+    history = playGame(16)
+    history["warning_positions"] = [(0, 5), (1, 9)]
+    history["scores"] = {agent:np.int64(score) for agent,score in history["scores"].items()}
+    path = str(tmp_path / "game.replay")
+    SaveReplay(path, history, AzulGameRule(2))
+    replay = LoadReplay(path, AzulGameRule)
+    assert sameReplay(replay, history)
+    actions = replay["actions"]
+    assert actions[-1] == actions[len(actions)-1] and actions[2:5] == [actions[i] for i in range(2, 5)]
+
+
+def test_pickled(tmp_path):
+    history = playGame(17)
+    path = str(tmp_path / "game.replay")
+    SaveReplay(path, history, UnencodedRule(2))
+    assert not IsCompactReplay(path)
+    assert sameReplay(LoadReplay(path, AzulGameRule), history)
+    info, num_actions = LoadReplayInfo(path)
+    assert num_actions == len(history["actions"]) and "actions" not in info
+
+
+def test_unfinished(tmp_path):
+    # A replay whose game never finished has no trailer.
+    path = str(tmp_path / "game.replay")
+    writer = ReplayWriter(path, {"seed":1, "num_of_agent":2})
+    writer.WriteAction(2, AzulGameRule(2).encodeAction("STARTROUND"))
+    writer.Close()
+    assert os.path.getsize(path) > len(replay_file.MAGIC)
+    with pytest.raises(AssertionError):
+        LoadReplay(path, AzulGameRule)
@@ -0,0 +1,107 @@
+"""
+The replay catalog (replay_index.py) holds what the replays say, is kept up to date as replay files are added,
+changed and removed, and answers queries as a scan of the replays would.
+"""
+
+import os
+import shutil
+import pytest
+from replay_file import LoadReplayInfo
+from replay_index import openIndex, ingest, findReplays, queryGames, agentStats
+
+
+def copyReplays(replay_dir, directory):
+    """
+    Copy the recorded games into a directory, naming them as the game runner does, one day apart.
+    """
+    os.makedirs(directory)
+    paths = []
+    for day, path in enumerate(findReplays(replay_dir), 1):
+        info, _ = LoadReplayInfo(path)
+        name = "replay-game-{:02d}-Oct-2026-10-11-12-123456-{}.replay".format(day, info["seed"])
+        paths.append(os.path.join(directory, name))
+        shutil.copy(path, paths[-1])
+    return paths
+
+
+def catalog(conn):
+    return sorted(conn.execute("SELECT r.path, r.played_at, r.seed, r.num_actions, p.seat, p.agent, p.score, "
+                               "p.margin, p.result, p.warnings FROM replays r JOIN players p ON p.replay_id = r.id"))
+
+
+def test_catalog(replay_dir, tmp_path):
+    paths = copyReplays(replay_dir, str(tmp_path / "replays"))
+    conn = openIndex(":memory:")
+    assert ingest(conn, str(tmp_path / "replays")) == (len(paths), 0, 0)
+    expected = []
+    for day, path in enumerate(paths, 1):
+        info, num_actions = LoadReplayInfo(path)
+        scores = info["scores"]
+        for seat in range(2):
+            margin = scores[seat] - scores[1-seat]
+            expected.append((os.path.abspath(path), "2026-10-{:02d} 10:11:12.123456".format(day), info["seed"],
+                             num_actions, seat, info["agents_namelist"][seat], scores[seat], margin,
+                             "won" if margin > 0 else "lost" if margin < 0 else "tied", 0))
+        rounds = conn.execute("SELECT seat, round, r.score FROM round_scores r JOIN replays ON replay_id = id "
+                              "WHERE path = ? ORDER BY seat, round", (os.path.abspath(path),)).fetchall()
+        assert rounds == [(seat, i, score) for seat in range(2) for i,score in enumerate(info["round_scores"][seat])]
+    assert catalog(conn) == sorted(expected)
+
+    # Reading replays in worker processes gives the same catalog.
+    parallel = openIndex(":memory:")
+    ingest(parallel, str(tmp_path / "replays"), jobs=2)
+    assert catalog(parallel) == catalog(conn)
+
+
+def test_rebuild(replay_dir, tmp_path):
+    directory = str(tmp_path / "replays")
+    paths = copyReplays(replay_dir, directory)
+    index_path = str(tmp_path / "replays.db")
+    conn = openIndex(index_path)
+    ingest(conn, directory)
+    assert ingest(conn, directory) == (0, 0, 0)
+
+    # A changed file is read again, a removed one dropped, and a new unreadable one counted but not indexed.
+    shutil.copy(paths[1], paths[0])
+    os.remove(paths[2])
+    with open(os.path.join(directory, "replay-broken.replay"), "wb") as f:
+        f.write(b"not a replay")
+    conn.close()
+    conn = openIndex(index_path)
+    assert ingest(conn, directory) == (1, 1, 1)
+    fresh = openIndex(":memory:")
+    ingest(fresh, directory)
+    assert catalog(conn) == catalog(fresh)
+    assert conn.execute("SELECT COUNT(*) FROM round_scores").fetchone() == \
+        fresh.execute("SELECT COUNT(*) FROM round_scores").fetchone()
+
+
+def test_queries(replay_dir, tmp_path):
+    copyReplays(replay_dir, str(tmp_path / "replays"))
+    conn = openIndex(":memory:")
+    ingest(conn, str(tmp_path / "replays"))
+    players = catalog(conn)
+
+    def paths(rows):
+        return sorted({row[0] for row in rows})
+    def played(games):
+        return sorted(path for _,_,path,_ in games)
+    assert played(queryGames(conn, agent="random")) == paths(row for row in players if row[5] == "random")
+    assert played(queryGames(conn, agent="random", result="lost")) == \
+        paths(row for row in players if row[5] == "random" and row[8] == "lost")
+    assert played(queryGames(conn, margin=10)) == paths(row for row in players if abs(row[7]) > 10)
+    assert played(queryGames(conn, agent="first_move", result="won", margin=5)) == \
+        paths(row for row in players if row[5] == "first_move" and row[7] > 5)
+    assert played(queryGames(conn, seed=11)) == paths(row for row in players if row[2] == 11)
+    assert played(queryGames(conn, since="2026-10-02", until="2026-10-03")) == \
+        paths(row for row in players if "2026-10-02" <= row[1] < "2026-10-04")
+    games = queryGames(conn, limit=2)
+    assert [played_at for played_at,_,_,_ in games] == sorted({row[1] for row in players}, reverse=True)[:2]
+    assert all(len(game_players) == 2 for _,_,_,game_players in games)
+
+    for agent, num_games, won, tied, lost, score, margin in agentStats(conn):
+        rows = [row for row in players if row[5] == agent]
+        assert (num_games, won, tied, lost) == (len(rows), sum(row[8] == "won" for row in rows),
+                                                sum(row[8] == "tied" for row in rows),
+                                                sum(row[8] == "lost" for row in rows))
+        assert score == pytest.approx(sum(row[6] for row in rows) / len(rows))
@@ -0,0 +1,60 @@
+"""
+Seeking and stepping back in GameReplayer give the same game as replaying from the start.
+"""
+
+import random
+import pytest
+from game import GameReplayer
+from replay_index import findReplays
+from Azul.azul_model import AzulGameRule
+from conftest import sameState, snapshot
+
+
+def replayStates(path):
+    """
+    The state after each number of actions, and the agents' round scores, replaying from the start.
+    """
+    replayer = GameReplayer(AzulGameRule, path)
+    states = [snapshot(replayer.game_rule.current_game_state)]
+    round_scores = [[trace.round_scores[:] for trace in replayer.game_rule.agent_traces]]
+    while replayer.position < len(replayer.replay["actions"]):
+        replayer.Step()
+        states.append(snapshot(replayer.game_rule.current_game_state))
+        round_scores.append([trace.round_scores[:] for trace in replayer.game_rule.agent_traces])
+    return states, round_scores
+
+
+def atPosition(replayer, states, round_scores, position):
+    return replayer.position == position and sameState(replayer.game_rule.current_game_state, states[position]) \
+        and [trace.round_scores for trace in replayer.game_rule.agent_traces] == round_scores[position]
+
+
+def test_seek(replay_dir):
+    rng = random.Random(0)
+    for path in findReplays(replay_dir):
+        states, round_scores = replayStates(path)
+        replayer = GameReplayer(AzulGameRule, path)
+        for position in [len(states)-1, 0] + [rng.randrange(len(states)) for _ in range(30)]:
+            replayer.Seek(position)
+            assert atPosition(replayer, states, round_scores, position)
+
+
+def test_step_back(replay_dir):
+    for path in findReplays(replay_dir):
+        states, round_scores = replayStates(path)
+        replayer = GameReplayer(AzulGameRule, path)
+        replayer.Seek(len(states)-1)
+        for position in range(len(states)-2, -1, -1):
+            replayer.StepBack()
+            assert atPosition(replayer, states, round_scores, position)
+        # At the start there is nothing to step back over.
+        replayer.StepBack()
+        assert atPosition(replayer, states, round_scores, 0)
+        replayer.Step()
+        assert atPosition(replayer, states, round_scores, 1)
+
+
+def test_seek_outside(replay_dir):
+    replayer = GameReplayer(AzulGameRule, findReplays(replay_dir)[0])
+    with pytest.raises(AssertionError):
+        replayer.Seek(len(replayer.replay["actions"])+1)
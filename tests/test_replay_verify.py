@@ -0,0 +1,98 @@
+"""
+The replay verifier (replay_verify.py) passes replays that reproduce their results, and flags tampered ones at the
+move where they diverge.
+"""
+
+import struct
+import replay_file
+from replay_file import LoadReplay, SaveReplay, RECORD
+from replay_index import findReplays
+from replay_verify import verify, verifyReplay
+from Azul.azul_model import AzulGameRule
+import Azul.azul_utils as utils
+
+
+def loadHistory(path):
+    """
+    A replay as a history dict that can be changed, with its actions in a list.
+    """
+    replay = LoadReplay(path, AzulGameRule)
+    replay["actions"] = [{i:dict(info) for i,info in item.items()} for item in replay["actions"]]
+    return replay
+
+
+def firstMove(replay, agent_id=0):
+    return next(move for move,item in enumerate(replay["actions"]) for info in item.values()
+                if info["agent_id"] == agent_id)
+
+
+def verifyTampered(tmp_path, replay):
+    path = str(tmp_path / "replay-tampered.replay")
+    SaveReplay(path, replay, AzulGameRule(replay["num_of_agent"]))
+    _, _, problem = verifyReplay(path, AzulGameRule)
+    return problem
+
+
+def test_replays_verified(replay_dir):
+    paths = findReplays(replay_dir)
+    for jobs in (1, 2):
+        results = list(verify(paths, AzulGameRule, jobs))
+        assert [path for path,_,_ in results] == paths
+        assert all(problem is None for _,_,problem in results)
+        assert all(moves == len(LoadReplay(path, AzulGameRule)["actions"]) for path,moves,_ in results)
+
+
+def test_illegal_move(replay_dir, tmp_path):
+    replay = loadHistory(findReplays(replay_dir)[0])
+    move = firstMove(replay)
+    # A grab from a factory that is empty at the start of every round.
+    info = replay["actions"][move][move]
+    info["action"] = (utils.Action.TAKE_FROM_FACTORY, 0, utils.GetTileGrab(0, 20, -1, 0))
+    assert verifyTampered(tmp_path, replay)[0] == move
+
+
+def test_wrong_agent(replay_dir, tmp_path):
+    replay = loadHistory(findReplays(replay_dir)[0])
+    move = firstMove(replay)
+    replay["actions"][move][move]["agent_id"] ^= 1
+    move_found, description = verifyTampered(tmp_path, replay)
+    assert move_found == move and "turn" in description
+
+
+def test_changed_scores(replay_dir, tmp_path):
+    replay = loadHistory(findReplays(replay_dir)[0])
+    replay["scores"][1] += 1
+    move, description = verifyTampered(tmp_path, replay)
+    assert move is None and "final scores" in description
+
+    replay = loadHistory(findReplays(replay_dir)[0])
+    replay["round_scores"][0][1] += 1
+    end_rounds = [move for move,item in enumerate(replay["actions"]) for info in item.values()
+                  if info["action"] == "ENDROUND"]
+    move, description = verifyTampered(tmp_path, replay)
+    assert move == end_rounds[1] and "round 2" in description
+
+
+def test_wrong_length(replay_dir, tmp_path):
+    replay = loadHistory(findReplays(replay_dir)[0])
+    actions = replay["actions"]
+    replay["actions"] = actions[:-3]
+    assert verifyTampered(tmp_path, replay)[0] == len(actions) - 3
+    replay["actions"] = actions + [{len(actions):{"agent_id":2, "action":"STARTROUND"}}]
+    move, description = verifyTampered(tmp_path, replay)
+    assert move == len(actions) and "ended" in description
+
+
+def test_corrupt_record(replay_dir, tmp_path):
+    # An action record overwritten in the file with a code that is not an action.
+    replay = loadHistory(findReplays(replay_dir)[0])
+    path = str(tmp_path / "replay-corrupt.replay")
+    SaveReplay(path, replay, AzulGameRule(2))
+    move = firstMove(replay)
+    with open(path, "r+b") as f:
+        f.seek(len(replay_file.MAGIC))
+        header_len, = struct.unpack("<I", f.read(4))
+        f.seek(len(replay_file.MAGIC) + 4 + header_len + move*RECORD.size)
+        f.write(RECORD.pack(0, len(utils.ACTIONS) + 100))
+    _, _, (move_found, description) = verifyReplay(path, AzulGameRule)
+    assert move_found == move and "could not be read" in description
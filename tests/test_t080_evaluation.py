@@ -0,0 +1,32 @@
+"""
+The t_080 minimax agents search on clones of the game state instead of deep copies, and score each leaf in place in
+get_actual_score. These tests check that a clone evaluates the same as a deep copy, as leaves were before, and that a
+search leaves the state it is handed as it was.
+"""
+
+import copy
+import importlib
+import pytest
+from template import Deadline
+from conftest import randomStates
+
+AGENTS = ["Minimax_v1", "Minimax_v2", "Minimax_v3", "Minimax_v4", "myTeam"]
+
+
+@pytest.mark.parametrize("name", AGENTS)
+@pytest.mark.parametrize("agent_id", [0, 1])
+def test_clone_evaluates_as_deepcopy(name, agent_id):
+    agent = importlib.import_module("agents.t_080." + name).myAgent(agent_id)
+    for state in randomStates(seed=agent_id):
+        assert agent.evaluate_score(state.clone()) == agent.evaluate_score(copy.deepcopy(state))
+
+
+@pytest.mark.parametrize("name", AGENTS)
+def test_search_leaves_state_unchanged(name):
+    agent = importlib.import_module("agents.t_080." + name).myAgent(0)
+    for state in randomStates(seed=2, num_games=1)[::5]:
+        if not state.TilesRemaining():
+            continue
+        before = state.clone()
+        agent.minimax(state, 2, -float('inf'), float('inf'), True, Deadline(60))
+        assert state.SameAs(before)
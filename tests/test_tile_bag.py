@@ -0,0 +1,108 @@
+"""
+The tile bag kept as counts (AzulState.TileBag) draws like the list bag it replaced (LegacyTileBag, kept for games
+recorded with it): each tile in the bag is equally likely, and no tiles are lost or made. Games recorded with the list
+bag still replay with it.
+"""
+
+import random
+import functools
+from collections import Counter
+import Azul.azul_utils as utils
+from Azul.azul_model import AzulState, AzulGameRule, CELL_BIT
+from game import Game, GameReplayer
+from agents.generic.random import myAgent
+from conftest import playGame
+
+
+class Fixed:
+    """
+    Stands in for a generator, returning the given number from randrange.
+    """
+    def __init__(self, r):
+        self.r = r
+
+    def randrange(self, n):
+        assert 0 <= self.r < n
+        return self.r
+
+
+def test_each_tile_equally_likely():
+    counts = [20, 5, 0, 1, 3]
+    # Each of the values randrange can return draws a different tile.
+    drawn = Counter()
+    for r in range(sum(counts)):
+        bag = AzulState.TileBag()
+        bag.tiles, bag.total = counts[:], sum(counts)
+        drawn[bag.Draw(Fixed(r))] += 1
+        assert bag.total == sum(counts) - 1 and sum(bag.tiles) == bag.total
+    assert [drawn[tile] for tile in utils.Tile] == counts
+
+
+def test_draws_match_legacy_bag():
+    # The colours of the first factory, over many shuffles of the legacy bag and draws from the count bag.
+    rng = random.Random(9)
+    frequencies = []
+    for legacy_bag in (True, False):
+        drawn = Counter()
+        for _ in range(4000):
+            bag = AzulState.LegacyTileBag() if legacy_bag else AzulState.TileBag()
+            bag.Extend([tile for tile in utils.Tile for _ in range(AzulState.NUM_TILE_TYPE)])
+            bag.Shuffle(rng)
+            drawn[tuple(sorted(bag.Draw(rng) for _ in range(AzulState.NUM_ON_FACTORY)))] += 1
+        frequencies.append(drawn)
+    legacy, counts = frequencies
+    for factory in set(legacy) | set(counts):
+        assert abs(legacy[factory] - counts[factory]) < 5 * (legacy[factory] + counts[factory] + 1) ** 0.5
+    assert sum(n for factory,n in counts.items() if len(set(factory)) == 1) > 0
+
+
+def tilesInPlay(state):
+    """
+    Number of tiles of each colour in the bags, on the displays and on the agents' boards.
+    """
+    tiles = Counter()
+    for display in [state.bag, state.bag_used, state.centre_pool] + state.factories:
+        tiles.update(dict(enumerate(display.tiles)))
+    for plr in state.agents:
+        tiles.update(plr.floor_tiles)
+        for line in range(plr.GRID_SIZE):
+            if plr.lines_number[line] > 0:
+                tiles[plr.lines_tile[line]] += plr.lines_number[line]
+            for tile in utils.Tile:
+                if plr.wall & CELL_BIT[line][tile]:
+                    tiles[tile] += 1
+    return [tiles[tile] for tile in utils.Tile]
+
+
+def test_tiles_kept():
+    random.seed(10)
+    for legacy_bag in (True, False):
+        for num_agents in (2, 4):
+            game_rule = AzulGameRule(num_agents, legacy_bag)
+            assert tilesInPlay(game_rule.current_game_state) == [AzulState.NUM_TILE_TYPE]*len(utils.Tile)
+            # The first round's factories replace those filled when the state was made, whose tiles leave the game.
+            game_rule.update("STARTROUND")
+            tiles = tilesInPlay(game_rule.current_game_state)
+            while not game_rule.gameEnds():
+                state = game_rule.current_game_state
+                assert tilesInPlay(state) == tiles
+                agent_id = game_rule.getCurrentAgentIndex()
+                game_rule.update(random.choice(game_rule.getLegalActions(state, agent_id)))
+
+
+def test_legacy_replay():
+    # Games recorded before the count bag have no "legacy_bag" entry, and replay with the list bag.
+    history = playGame(14)
+    assert history["legacy_bag"] is False
+    legacy = Game(functools.partial(AzulGameRule, legacy_bag=True), [myAgent(0), myAgent(1)], 2, seed=14,
+                  agent_workers=False).Run()
+    del legacy["legacy_bag"]
+    for replay in (history, legacy):
+        replayer = GameReplayer(AzulGameRule, replay)
+        game_rule = replayer.game_rule
+        assert isinstance(game_rule.current_game_state.bag, AzulState.LegacyTileBag) == (replay is legacy)
+        while replayer.position < len(replay["actions"]):
+            (info,) = replay["actions"][replayer.position].values()
+            legal = game_rule.getLegalActions(game_rule.current_game_state, info["agent_id"])
+            assert utils.FindAction(info["action"], game_rule.indexActions(legal)) is not None
+            replayer.Step()
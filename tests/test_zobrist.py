@@ -0,0 +1,44 @@
+"""
+The Zobrist hash AzulGameRule keeps up to date move by move is the one AzulState.ComputeZobrist computes from scratch.
+"""
+
+import random
+from Azul.azul_model import AzulGameRule
+from conftest import randomStates
+
+
+def test_hash_kept_through_games():
+    random.seed(5)
+    for num_agents in (2, 3, 4):
+        game_rule = AzulGameRule(num_agents)
+        while not game_rule.gameEnds():
+            state = game_rule.current_game_state
+            assert state.zobrist == state.ComputeZobrist()
+            agent_id = game_rule.getCurrentAgentIndex()
+            game_rule.update(random.choice(game_rule.getLegalActions(state, agent_id)))
+        assert game_rule.current_game_state.zobrist == game_rule.current_game_state.ComputeZobrist()
+
+
+def test_hash_kept_through_apply_and_undo():
+    game_rule = AzulGameRule(2)
+    for state in randomStates(seed=6, num_games=2):
+        agent_id = state.agent_to_move
+        for action in game_rule.getLegalActions(state, agent_id):
+            undo_token = game_rule.apply(state, action, agent_id)
+            assert state.zobrist == state.ComputeZobrist()
+            game_rule.undo(state, undo_token)
+            assert state.zobrist == state.ComputeZobrist()
+
+
+def test_hash_tells_moves_apart():
+    # Moves from a position have the same hash only if they lead to the same position (eg. grabs that put all their
+    # tiles on the floor line, whatever their pattern line).
+    game_rule = AzulGameRule(2)
+    for state in randomStates(seed=7, num_games=1):
+        agent_id = state.agent_to_move
+        successors = [game_rule.generateSuccessor(state.clone(), action, agent_id)
+                      for action in game_rule.getLegalActions(state, agent_id)]
+        for i, successor in enumerate(successors):
+            assert successor.zobrist != state.zobrist
+            for other in successors[:i]:
+                assert (successor.zobrist == other.zobrist) == successor.SameAs(other)